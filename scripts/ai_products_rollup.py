@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+AI 产品下载量 / 收入 CSV 的流式增量汇总，并据此渲染 AI 产品下载收益日报。
+
+数据源 public/ai产品/ai产品竞品下载量和收益.csv 每行是「产品 × 国家 × 日期」的
+android_units / android_revenue，爬虫按日期追加写入。本脚本：
+  - 在本地汇总库（默认 .report_state/ai_products_rollup.db）里维护三张按日汇总表：
+      ai_product_daily          每产品每天：下载、收入、国家数、行数
+      ai_country_daily          每国家每天：下载、收入
+      ai_product_country_daily  每产品每国家每天（用于各产品的 Top 国家）
+  - 记录已处理到的字节偏移（水位）：每次只从偏移处流式读取新追加的完整行，
+    累加进汇总表（UPSERT），不会重读历史；末尾未写完的半行留到下次
+  - 末尾没有换行的最后一行列数齐全时也计入；若之后该行被续写（而不是换行追加）则全量重建
+  - 文件被截短、表头或水位前的内容被改写时（按水位前 4KB 的哈希判断）自动全量重建；--full 强制重建
+  - 日报只读汇总表：当天各产品 / 国家的下载与收入，以及与 7 天前（周环比）的对比
+
+注意：按行流式读取，不支持字段内含换行的 CSV。
+
+使用方式（在项目根目录）：
+  python scripts/ai_products_rollup.py
+  python scripts/ai_products_rollup.py --date 2026-01-26
+  python scripts/ai_products_rollup.py --full --out public/ai产品/ai产品下载收益日报.md
+"""
+
+import argparse
+import csv
+import hashlib
+import sqlite3
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from report_db import format_number, format_revenue
+
+DEFAULT_CSV = Path("public/ai产品/ai产品竞品下载量和收益.csv")
+DEFAULT_STORE = Path(".report_state/ai_products_rollup.db")
+DEFAULT_OUT = Path("public/ai产品/ai产品下载收益日报.md")
+# 水位前用于校验「文件只被追加」的尾部字节数
+TAIL_CHECK_BYTES = 4096
+TOP_COUNTRIES = 10
+TOP_COUNTRIES_PER_PRODUCT = 3
+
+REQUIRED_COLUMNS = ("product_name", "category", "app_id", "country", "date", "android_units", "android_revenue")
+
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS ai_product_daily (
+        date TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        category TEXT,
+        app_id TEXT,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue INTEGER NOT NULL DEFAULT 0,
+        countries INTEGER NOT NULL DEFAULT 0,
+        rows INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (date, product_name)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ai_country_daily (
+        date TEXT NOT NULL,
+        country TEXT NOT NULL,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (date, country)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ai_product_country_daily (
+        date TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        country TEXT NOT NULL,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (date, product_name, country)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ai_rollup_watermark (
+        source TEXT PRIMARY KEY,
+        header TEXT NOT NULL,
+        offset INTEGER NOT NULL,
+        tail_hash TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """,
+]
+
+
+def ensure_tables(conn: sqlite3.Connection) -> None:
+    with conn:
+        for sql in SCHEMA_SQL:
+            conn.execute(sql)
+
+
+def reset(conn: sqlite3.Connection, source: str) -> None:
+    """清空汇总与水位（全量重建前）。"""
+    with conn:
+        for table in ("ai_product_daily", "ai_country_daily", "ai_product_country_daily"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("DELETE FROM ai_rollup_watermark WHERE source = ?", (source,))
+
+
+def parse_int(value: str) -> int:
+    """'1,234' / '' / '12.0' -> int，无法解析为 0。"""
+    v = (value or "").replace(",", "").strip()
+    if not v:
+        return 0
+    try:
+        return int(v)
+    except ValueError:
+        try:
+            return int(float(v))
+        except ValueError:
+            return 0
+
+
+def tail_hash(f, offset: int) -> str:
+    """文件 [offset - TAIL_CHECK_BYTES, offset) 的哈希，用来确认水位之前的内容没有被改写。"""
+    start = max(0, offset - TAIL_CHECK_BYTES)
+    f.seek(start)
+    return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+def read_watermark(conn: sqlite3.Connection, source: str) -> tuple[list[str], int, str] | None:
+    row = conn.execute(
+        "SELECT header, offset, tail_hash FROM ai_rollup_watermark WHERE source = ?", (source,)
+    ).fetchone()
+    if not row:
+        return None
+    return row[0].split(","), row[1], row[2]
+
+
+def read_new_rows(path: Path, conn: sqlite3.Connection, full: bool = False) -> tuple[list[str], list[list[str]], int, bool]:
+    """从水位处读取新追加的完整行，返回 (表头, 新行, 新偏移, 是否全量)。"""
+    source = str(path.resolve())
+    mark = None if full else read_watermark(conn, source)
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        rebuilt = mark is None
+        if mark is not None:
+            header, offset, expected = mark
+            if offset > size or tail_hash(f, offset) != expected:
+                rebuilt = True
+            elif offset:
+                # 上次把没有换行结尾的最后一行也计入了：若之后在同一行继续写入（而不是换行追加），需要重建
+                f.seek(offset - 1)
+                if f.read(1) != b"\n" and f.read(1) not in (b"", b"\n", b"\r"):
+                    rebuilt = True
+        if rebuilt:
+            f.seek(0)
+            first = f.readline()
+            header = next(csv.reader([first.decode("utf-8-sig")]))
+            header = [h.strip() for h in header]
+            offset = len(first) if first.endswith(b"\n") else 0
+            if not offset:
+                return header, [], 0, True
+
+        f.seek(offset)
+        chunk = f.read(size - offset)
+
+    # 以换行结尾的行都是完整行；文件末尾没有换行的最后一行，列数齐全时也计入（CSV 导出常不带末尾换行），
+    # 否则视为写了一半，留到下次
+    end = chunk.rfind(b"\n") + 1
+    rows = [r for r in csv.reader(chunk[:end].decode("utf-8").splitlines()) if r]
+    tail = chunk[end:]
+    if tail.strip():
+        try:
+            last = next(csv.reader([tail.decode("utf-8")]))
+        except (UnicodeDecodeError, csv.Error):
+            last = []
+        if len(last) >= len(header):
+            rows.append(last)
+            end = len(chunk)
+    return header, rows, offset + end, rebuilt
+
+
+def apply_rows(conn: sqlite3.Connection, header: list[str], rows: list[list[str]]) -> int:
+    """把新行按 (日期, 产品) / (日期, 国家) / (日期, 产品, 国家) 聚合后累加进汇总表，返回涉及的日期数。"""
+    idx = {c: header.index(c) for c in REQUIRED_COLUMNS}
+    width = max(idx.values()) + 1
+
+    # 内存里先聚合本批新行：值为 [下载, 收入, 行数]
+    products: dict[tuple[str, str], list] = {}
+    countries: dict[tuple[str, str], list] = {}
+    product_countries: dict[tuple[str, str, str], list] = {}
+    meta: dict[str, tuple[str, str]] = {}
+    for r in rows:
+        if len(r) < width:
+            continue
+        name = r[idx["product_name"]].strip()
+        day = r[idx["date"]].strip()[:10]
+        if not name or not day:
+            continue
+        country = r[idx["country"]].strip() or "—"
+        units = parse_int(r[idx["android_units"]])
+        revenue = parse_int(r[idx["android_revenue"]])
+        meta.setdefault(name, (r[idx["category"]].strip(), r[idx["app_id"]].strip()))
+        for table, key in ((products, (day, name)), (countries, (day, country)), (product_countries, (day, name, country))):
+            acc = table.get(key)
+            if acc is None:
+                table[key] = [units, revenue, 1]
+            else:
+                acc[0] += units
+                acc[1] += revenue
+                acc[2] += 1
+
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO ai_product_country_daily (date, product_name, country, units, revenue)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (date, product_name, country) DO UPDATE SET
+                units = units + excluded.units, revenue = revenue + excluded.revenue
+            """,
+            [(*key, u, rv) for key, (u, rv, _) in product_countries.items()],
+        )
+        conn.executemany(
+            """
+            INSERT INTO ai_product_daily (date, product_name, category, app_id, units, revenue, rows)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (date, product_name) DO UPDATE SET
+                units = units + excluded.units, revenue = revenue + excluded.revenue, rows = rows + excluded.rows
+            """,
+            [(day, name, *meta[name], u, rv, n) for (day, name), (u, rv, n) in products.items()],
+        )
+        # 国家数按 ai_product_country_daily 重新计数（只更新本批涉及的产品日）
+        conn.executemany(
+            """
+            UPDATE ai_product_daily
+            SET countries = (
+                SELECT COUNT(*) FROM ai_product_country_daily c
+                WHERE c.date = ai_product_daily.date AND c.product_name = ai_product_daily.product_name
+            )
+            WHERE date = ? AND product_name = ?
+            """,
+            list(products),
+        )
+        conn.executemany(
+            """
+            INSERT INTO ai_country_daily (date, country, units, revenue)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (date, country) DO UPDATE SET
+                units = units + excluded.units, revenue = revenue + excluded.revenue
+            """,
+            [(*key, u, rv) for key, (u, rv, _) in countries.items()],
+        )
+    return len({day for day, _ in products})
+
+
+def update(conn: sqlite3.Connection, path: Path, full: bool = False) -> tuple[int, int, bool]:
+    """增量更新汇总，返回 (新行数, 涉及日期数, 是否全量重建)。"""
+    ensure_tables(conn)
+    source = str(path.resolve())
+    header, rows, offset, rebuilt = read_new_rows(path, conn, full)
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise ValueError(f"CSV 缺少列：{', '.join(missing)}")
+    if rebuilt:
+        reset(conn, source)
+    days = apply_rows(conn, header, rows) if rows else 0
+    with open(path, "rb") as f:
+        check = tail_hash(f, offset)
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO ai_rollup_watermark (source, header, offset, tail_hash, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (source) DO UPDATE SET
+                header = excluded.header, offset = excluded.offset,
+                tail_hash = excluded.tail_hash, updated_at = excluded.updated_at
+            """,
+            (source, ",".join(header), offset, check, time.strftime("%Y-%m-%d %H:%M:%S")),
+        )
+    return len(rows), days, rebuilt
+
+
+def _delta(current: int, previous: int | None) -> str:
+    """环比：上期无数据显示 —。"""
+    if not previous:
+        return "—"
+    pct = (current - previous) / previous * 100
+    return f"{'+' if pct >= 0 else ''}{pct:.1f}%"
+
+
+def render_daily_md(conn: sqlite3.Connection, day: str | None = None) -> str | None:
+    """从汇总表渲染某天（默认最新一天）的 AI 产品下载收益日报；无数据返回 None。"""
+    if day is None:
+        day = conn.execute("SELECT MAX(date) FROM ai_product_daily").fetchone()[0]
+        if not day:
+            return None
+    week_ago = (date.fromisoformat(day) - timedelta(days=7)).isoformat()
+
+    products = conn.execute(
+        """
+        SELECT p.product_name, p.category, p.units, p.revenue, p.countries, w.units, w.revenue
+        FROM ai_product_daily p
+        LEFT JOIN ai_product_daily w ON w.date = ? AND w.product_name = p.product_name
+        WHERE p.date = ?
+        ORDER BY p.revenue DESC, p.units DESC
+        """,
+        (week_ago, day),
+    ).fetchall()
+    if not products:
+        return None
+    countries = conn.execute(
+        """
+        SELECT c.country, c.units, c.revenue, w.units, w.revenue
+        FROM ai_country_daily c
+        LEFT JOIN ai_country_daily w ON w.date = ? AND w.country = c.country
+        WHERE c.date = ?
+        ORDER BY c.revenue DESC, c.units DESC
+        LIMIT ?
+        """,
+        (week_ago, day, TOP_COUNTRIES),
+    ).fetchall()
+    top_by_product: dict[str, list[str]] = {}
+    for name, country in conn.execute(
+        """
+        SELECT product_name, country FROM (
+            SELECT product_name, country,
+                   ROW_NUMBER() OVER (PARTITION BY product_name ORDER BY revenue DESC, units DESC) AS rn
+            FROM ai_product_country_daily
+            WHERE date = ?
+        )
+        WHERE rn <= ?
+        ORDER BY product_name, rn
+        """,
+        (day, TOP_COUNTRIES_PER_PRODUCT),
+    ):
+        top_by_product.setdefault(name, []).append(country)
+
+    total_units = sum(p[2] for p in products)
+    total_revenue = sum(p[3] for p in products)
+    prev_units = sum(p[5] or 0 for p in products)
+    prev_revenue = sum(p[6] or 0 for p in products)
+
+    lines = [
+        f"# AI 产品下载与收入日报（{day}）",
+        "",
+        f"**数据日期**：{day}（Android 下载量 + 收入估算，周环比对比 {week_ago}）  ",
+        f"**监控产品**：{len(products)} 款",
+        "",
+        "---",
+        "",
+        "## 一、总览",
+        "",
+        f"- **总下载量**：{format_number(total_units)}（周环比 {_delta(total_units, prev_units)}）",
+        f"- **总收入**：{format_revenue(total_revenue)}（周环比 {_delta(total_revenue, prev_revenue)}）",
+        "",
+        "## 二、分产品",
+        "",
+        "| 产品 | 分类 | 下载量 | 下载周环比 | 收入 | 收入周环比 | 覆盖国家 | Top 国家 |",
+        "| --- | --- | --- | --- | --- | --- | --- | --- |",
+    ]
+    for name, category, units, revenue, n_countries, w_units, w_revenue in products:
+        lines.append(
+            f"| {name} | {category or '—'} | {format_number(units)} | {_delta(units, w_units)} | "
+            f"{format_revenue(revenue)} | {_delta(revenue, w_revenue)} | {n_countries} | "
+            f"{'、'.join(top_by_product.get(name, [])) or '—'} |"
+        )
+    lines += [
+        "",
+        f"## 三、收入 Top{TOP_COUNTRIES} 国家",
+        "",
+        "| 国家 | 下载量 | 下载周环比 | 收入 | 收入周环比 |",
+        "| --- | --- | --- | --- | --- |",
+    ]
+    for country, units, revenue, w_units, w_revenue in countries:
+        lines.append(
+            f"| {country} | {format_number(units)} | {_delta(units, w_units)} | "
+            f"{format_revenue(revenue)} | {_delta(revenue, w_revenue)} |"
+        )
+    lines.append("")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI 产品下载量/收入 CSV 增量汇总，并渲染下载收益日报")
+    parser.add_argument("--csv", type=Path, default=DEFAULT_CSV, help="AI 产品下载量和收益 CSV")
+    parser.add_argument("--store", type=Path, default=DEFAULT_STORE, help="汇总库 SQLite 路径")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT, help="日报 Markdown 输出路径")
+    parser.add_argument("--date", default=None, help="日报日期（YYYY-MM-DD），默认最新一天")
+    parser.add_argument("--full", action="store_true", help="忽略水位，全量重建汇总")
+    parser.add_argument("--no-report", action="store_true", help="只更新汇总，不渲染日报")
+    args = parser.parse_args()
+
+    if not args.csv.exists():
+        print(f"错误：CSV 不存在 {args.csv}")
+        return 1
+
+    args.store.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(args.store)
+    try:
+        start = time.perf_counter()
+        try:
+            n_rows, n_days, rebuilt = update(conn, args.csv, full=args.full)
+        except ValueError as e:
+            print(f"错误：{e}")
+            return 1
+        print(
+            f"{'全量重建' if rebuilt else '增量更新'}：新增 {n_rows} 行，涉及 {n_days} 天"
+            f"（{(time.perf_counter() - start) * 1000:.1f}ms）"
+        )
+        if args.no_report:
+            return 0
+
+        start = time.perf_counter()
+        md = render_daily_md(conn, args.date)
+        if md is None:
+            print(f"没有 {args.date or '任何日期'} 的数据，未生成日报")
+            return 0
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        if not (args.out.exists() and args.out.read_text(encoding="utf-8") == md):
+            args.out.write_text(md, encoding="utf-8")
+        print(f"已生成：{args.out}（{(time.perf_counter() - start) * 1000:.1f}ms）")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+把 sensortower_top100.db 的 rank_changes 物化为按 (app_id, 地区, 榜单, 平台) 的多周排名轨迹表 app_rank_history。
+
+周报只看单个 rank_date_current；「连续 3 周上升」「本季度波动最大」这类问题原本要反复全表扫描 rank_changes。
+本脚本用一条窗口函数查询一次算出每个应用在每个上榜周的轨迹字段，写入 app_rank_history：
+  - rank / change_type / rank_change：当周最高排名及其异动（rank_change 由 change 解析，↑ 为正、↓ 为负，新进为 NULL）
+  - prev_week / prev_rank：上一次上榜的周次与排名；consecutive：上一次上榜正好是上周（rank_date_last）
+  - rising_streak：截至当周连续上升（新进或 ↑）的周数，当周未上升为 0
+  - best_rank / weeks_on_chart：截至当周的最高排名、累计上榜周数
+  - volatility：最近 VOLATILITY_WINDOW 次上榜排名的标准差（约一个季度）
+
+增量：app_rank_history_state 记录每周数据指纹（探测值 + 行内容哈希，含关联的 app_metadata，见 SensorTowerQueries.week_fingerprints）。
+从最早一个新增 / 变化 / 消失的周次 E 起重算：只读取在 E 及之后上榜的应用的全部历史
+（按 idx_rank_changes_app_key 索引查找），只替换 E 及之后的轨迹行。--full 全量重建。
+
+报表可用 rising_streaks / most_volatile 按 (rank_date_current, …) 索引一次查出趋势段落。
+
+使用方式（在项目根目录）：
+  python scripts/app_rank_history.py
+  python scripts/app_rank_history.py --db public/sensortower_top100.db --full
+  python scripts/app_rank_history.py --show 5
+"""
+
+import argparse
+import math
+import sqlite3
+from pathlib import Path
+
+from report_db import CHANGE_TYPE_NEW, SensorTowerQueries
+from sensortower_schema import surge_value_expr
+
+# 波动率窗口：最近 13 次上榜（约一个季度）
+VOLATILITY_WINDOW = 13
+
+KEY_COLUMNS = "app_id, country, signal, platform"
+
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS app_rank_history (
+        app_id TEXT NOT NULL,
+        country TEXT NOT NULL,
+        signal TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        rank_date_current TEXT NOT NULL,
+        rank INTEGER,
+        change_type TEXT,
+        rank_change INTEGER,
+        prev_week TEXT,
+        prev_rank INTEGER,
+        consecutive INTEGER NOT NULL,
+        rising_streak INTEGER NOT NULL,
+        best_rank INTEGER,
+        weeks_on_chart INTEGER NOT NULL,
+        volatility REAL NOT NULL,
+        PRIMARY KEY (app_id, country, signal, platform, rank_date_current)
+    ) WITHOUT ROWID
+    """,
+    # 趋势段落：某周连续上升最久 / 波动最大
+    "CREATE INDEX IF NOT EXISTS idx_app_rank_history_week_streak ON app_rank_history(rank_date_current, rising_streak)",
+    "CREATE INDEX IF NOT EXISTS idx_app_rank_history_week_volatility ON app_rank_history(rank_date_current, volatility)",
+    """
+    CREATE TABLE IF NOT EXISTS app_rank_history_state (
+        rank_date_current TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL
+    )
+    """,
+    # 增量重算时按应用取全部历史
+    f"CREATE INDEX IF NOT EXISTS idx_rank_changes_app_key ON rank_changes({KEY_COLUMNS}, rank_date_current)",
+]
+
+
+def ensure_tables(conn: sqlite3.Connection) -> None:
+    with conn:
+        for sql in SCHEMA_SQL:
+            conn.execute(sql)
+    # 部分 SQLite 构建未启用数学函数：缺少 sqrt 时注册 Python 实现
+    try:
+        conn.execute("SELECT sqrt(4)")
+    except sqlite3.OperationalError:
+        conn.create_function("sqrt", 1, lambda x: None if x is None else math.sqrt(x), deterministic=True)
+
+
+def history_sql(window: int = VOLATILITY_WINDOW) -> str:
+    """轨迹计算 SQL，参数 ?1 为起始周 E（'' 表示全部）：只计算在 E 及之后上榜的应用，只输出 E 及之后的行。"""
+    up = surge_value_expr('r."change"')
+    down = surge_value_expr('r."change"', arrow="↓")
+    partition = f"PARTITION BY {KEY_COLUMNS} ORDER BY rank_date_current"
+    return f"""
+        WITH touched AS (
+            SELECT DISTINCT {KEY_COLUMNS}
+            FROM rank_changes
+            WHERE rank_date_current >= ?1 AND app_id IS NOT NULL
+        ),
+        weekly AS (
+            -- 同一周同一分区有多行时取排名最高的一行（MIN 聚合时裸列取自该行）
+            SELECT
+                r.app_id, r.country, r.signal, r.platform, r.rank_date_current, r.rank_date_last,
+                MIN(r.current_rank) AS rank,
+                r.change_type,
+                CASE
+                    WHEN r.change_type = '{CHANGE_TYPE_NEW}' THEN NULL
+                    WHEN {up} > 0 THEN {up}
+                    ELSE -({down})
+                END AS rank_change
+            FROM touched t
+            -- CROSS JOIN 固定由 touched 驱动，按 idx_rank_changes_app_key 回查各应用的全部历史
+            CROSS JOIN rank_changes r
+              ON r.app_id = t.app_id AND r.country = t.country AND r.signal = t.signal AND r.platform = t.platform
+            WHERE r.rank_date_current IS NOT NULL
+            GROUP BY r.app_id, r.country, r.signal, r.platform, r.rank_date_current
+        ),
+        flagged AS (
+            SELECT
+                *,
+                (change_type = '{CHANGE_TYPE_NEW}' OR rank_change > 0) AS rising,
+                LAG(rank_date_current) OVER w AS prev_week,
+                LAG(rank) OVER w AS prev_rank
+            FROM weekly
+            WINDOW w AS ({partition})
+        ),
+        linked AS (
+            SELECT
+                *,
+                COALESCE(prev_week = rank_date_last, 0) AS consecutive,
+                COALESCE(LAG(rising) OVER w, 0) AS prev_rising
+            FROM flagged
+            WINDOW w AS ({partition})
+        ),
+        grouped AS (
+            -- 连续上升段：不上升、断周或上周未上升时开始新的一段
+            SELECT
+                *,
+                SUM(CASE WHEN rising AND consecutive AND prev_rising THEN 0 ELSE 1 END)
+                    OVER (w ROWS UNBOUNDED PRECEDING) AS grp
+            FROM linked
+            WINDOW w AS ({partition})
+        ),
+        history AS (
+            SELECT
+                app_id, country, signal, platform, rank_date_current,
+                rank, change_type, rank_change, prev_week, prev_rank, consecutive,
+                CASE WHEN rising
+                    THEN ROW_NUMBER() OVER (PARTITION BY {KEY_COLUMNS}, grp ORDER BY rank_date_current)
+                    ELSE 0
+                END AS rising_streak,
+                MIN(rank) OVER running AS best_rank,
+                COUNT(*) OVER running AS weeks_on_chart,
+                sqrt(MAX(0.0, AVG(rank * rank) OVER recent - AVG(rank) OVER recent * AVG(rank) OVER recent)) AS volatility
+            FROM grouped
+            WINDOW running AS ({partition} ROWS UNBOUNDED PRECEDING),
+                   recent AS ({partition} ROWS BETWEEN {window - 1} PRECEDING AND CURRENT ROW)
+        )
+        SELECT * FROM history WHERE rank_date_current >= ?1
+    """
+
+
+def changed_since(known: dict[str, str], weeks: list[tuple[str, str, str]]) -> str | None:
+    """与上次记录的指纹 known 比较，返回最早一个新增 / 变化 / 消失的周次；没有变化返回 None。"""
+    current = {week: fingerprint for week, _, fingerprint in weeks}
+    changed = [w for w, fp in current.items() if known.get(w) != fp]
+    changed += [w for w in known if w not in current]
+    return min(changed) if changed else None
+
+
+def rebuild(conn: sqlite3.Connection, full: bool = False, window: int = VOLATILITY_WINDOW) -> tuple[str | None, int]:
+    """增量（或全量）更新 app_rank_history，返回 (重算起始周, 写入行数)；无变化时为 (None, 0)。"""
+    ensure_tables(conn)
+    known = {} if full else dict(conn.execute("SELECT rank_date_current, fingerprint FROM app_rank_history_state"))
+    weeks = SensorTowerQueries(conn).week_fingerprints(known)
+    start = "" if full else changed_since(known, weeks)
+    if start is None:
+        return None, 0
+    with conn:
+        conn.execute("DELETE FROM app_rank_history WHERE rank_date_current >= ?", (start,))
+        written = conn.execute(f"INSERT INTO app_rank_history {history_sql(window)}", (start,)).rowcount
+        conn.execute("DELETE FROM app_rank_history_state")
+        conn.executemany(
+            "INSERT INTO app_rank_history_state (rank_date_current, fingerprint) VALUES (?, ?)",
+            [(week, fingerprint) for week, _, fingerprint in weeks],
+        )
+    return start, written
+
+
+def _trend_sql(where: str, order: str) -> str:
+    return f"""
+        SELECT
+            h.app_id, h.country, h.signal, h.platform, h.rank, h.rank_change,
+            h.rising_streak, h.best_rank, h.weeks_on_chart, ROUND(h.volatility, 2) AS volatility,
+            COALESCE(m.name, h.app_id) AS display_name
+        FROM app_rank_history h
+        LEFT JOIN app_metadata m ON m.app_id = h.app_id AND m.os = LOWER(h.platform)
+        WHERE h.rank_date_current = ? AND {where}
+        ORDER BY {order}
+        LIMIT ?
+    """
+
+
+def rising_streaks(conn: sqlite3.Connection, rank_date_current: str, min_streak: int = 3, limit: int = 20) -> list[dict]:
+    """当周连续上升至少 min_streak 周的应用，连续周数多者在前。"""
+    cur = conn.execute(
+        _trend_sql("h.rising_streak >= ?", "h.rising_streak DESC, h.rank"),
+        (rank_date_current, min_streak, limit),
+    )
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, r)) for r in cur]
+
+
+def most_volatile(conn: sqlite3.Connection, rank_date_current: str, min_weeks: int = 3, limit: int = 10) -> list[dict]:
+    """当周上榜、且累计上榜至少 min_weeks 周的应用中，最近一个窗口内排名波动最大的 limit 个。"""
+    cur = conn.execute(
+        _trend_sql("h.weeks_on_chart >= ?", "h.volatility DESC, h.rank"),
+        (rank_date_current, min_weeks, limit),
+    )
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, r)) for r in cur]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="物化 rank_changes 的多周排名轨迹到 app_rank_history")
+    parser.add_argument(
+        "--db",
+        type=Path,
+        default=Path("public/sensortower_top100.db"),
+        help="sensortower_top100.db 路径",
+    )
+    parser.add_argument("--full", action="store_true", help="忽略已记录的指纹，全量重建")
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=VOLATILITY_WINDOW,
+        help=f"波动率窗口（最近几次上榜），默认 {VOLATILITY_WINDOW}；修改后需配合 --full 重建",
+    )
+    parser.add_argument("--show", type=int, default=0, metavar="N", help="完成后打印最近一周连续上升与波动最大的前 N 个")
+    args = parser.parse_args()
+
+    if not args.db.exists():
+        print(f"错误：数据库不存在 {args.db}")
+        return 1
+
+    conn = sqlite3.connect(args.db)
+    try:
+        start, written = rebuild(conn, full=args.full, window=args.window)
+        if start is None:
+            print("rank_changes 无变化，app_rank_history 已是最新")
+        else:
+            print(f"已从 {start or '最早一周'} 起重算轨迹：写入 {written} 行")
+
+        if args.show:
+            latest = SensorTowerQueries(conn).latest_week()
+            if latest:
+                week = latest[0]
+                print(f"\n{week} 连续上升（≥3 周）：")
+                for r in rising_streaks(conn, week, limit=args.show):
+                    print(f"  {r['display_name']}（{r['country']}/{r['signal']}/{r['platform']}）连续 {r['rising_streak']} 周，当前第 {r['rank']} 名")
+                print(f"\n{week} 排名波动最大：")
+                for r in most_volatile(conn, week, limit=args.show):
+                    print(f"  {r['display_name']}（{r['country']}/{r['signal']}/{r['platform']}）波动 {r['volatility']}，最高第 {r['best_rank']} 名")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
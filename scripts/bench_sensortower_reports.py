@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+SensorTower 报表路径的基准测试（仅依赖标准库）。
+
+按指定规模生成合成的 rank_changes / app_metadata 数据库
+（周数 × 国家数 × 榜单数 × 平台数 × 100 名），然后对以下内容分别计时：
+  - report_db.SensorTowerQueries 的每条报表查询（周次探测、单周行内容、最近一周、新进、飙升、每分区一条、TopK）
+  - generate_sensortower_weekly_report：逐周取数 + render_week_md 渲染
+  - send_minigame_weekly_reports.build_sensortower_weekly_md
+  - pick_one_per_region_chart_platform 的每分区一条
+
+每项先预热若干次再重复计时，记录 min / median / mean；再单独跑一次用 tracemalloc 记录峰值内存。
+合成库默认放在临时目录；--db-path 指定的文件若已存在，只有带 bench_synthetic 标记表（本脚本生成的库）
+才会被删除重建，否则拒绝运行，避免误删真实数据库。
+结果写成 JSON，可用 --compare 与之前的结果对比，超过阈值的变慢项视为回归（返回 1）。
+
+使用方式（在项目根目录）：
+  python scripts/bench_sensortower_reports.py
+  python scripts/bench_sensortower_reports.py --weeks 52 --countries 20 --json bench.json
+  python scripts/bench_sensortower_reports.py --provision --compare bench.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+from generate_sensortower_weekly_report import render_week_md
+from report_db import ONE_PER_PARTITION_WEEKLY, SensorTowerQueries, connect_readonly
+from send_minigame_weekly_reports import build_sensortower_weekly_md
+from sensortower_schema import provision
+
+COUNTRIES = ["US", "JP", "DE", "GB", "FR", "KR", "BR", "CA", "AU", "IT", "ES", "MX", "RU", "IN", "TW", "NL", "SE", "TR", "ID", "TH"]
+SIGNALS = ["free", "paid", "grossing", "new_free", "new_paid"]
+PLATFORMS = ["iOS", "Android"]
+RANKS = 100
+# 合成库里的标记表：--db-path 指向已有文件时，只有带该表的库才允许覆盖
+BENCH_SENTINEL_TABLE = "bench_synthetic"
+
+
+def is_bench_db(path: Path) -> bool:
+    """已有文件是否为本脚本生成的合成库（带 BENCH_SENTINEL_TABLE 标记表）。"""
+    try:
+        conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            return conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (BENCH_SENTINEL_TABLE,)
+            ).fetchone() is not None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+
+def generate_db(path: Path, weeks: int, countries: int, charts: int, platforms: int, seed: int = 42) -> int:
+    """生成合成数据库，返回 rank_changes 行数。
+
+    path 已存在且非空时，只有本脚本生成的合成库才会被删除重建，其他文件抛 FileExistsError。
+    """
+    if path.exists() and path.stat().st_size > 0:
+        if not is_bench_db(path):
+            raise FileExistsError(f"{path} 已存在且不是基准测试生成的合成库（缺少 {BENCH_SENTINEL_TABLE} 表），拒绝覆盖")
+        for suffix in ("", "-wal", "-shm"):
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        f"""
+        CREATE TABLE {BENCH_SENTINEL_TABLE} (created_at TEXT NOT NULL);
+        INSERT INTO {BENCH_SENTINEL_TABLE} VALUES (datetime('now'));
+        CREATE TABLE rank_changes (
+            rank_date_current TEXT, rank_date_last TEXT, signal TEXT, app_name TEXT, app_id TEXT,
+            country TEXT, platform TEXT, current_rank INTEGER, last_week_rank TEXT, "change" TEXT,
+            change_type TEXT, downloads INTEGER, revenue REAL, publisher_name TEXT
+        );
+        CREATE TABLE app_metadata (app_id TEXT, os TEXT, name TEXT, publisher_name TEXT, release_date TEXT);
+        """
+    )
+    n_apps = max(500, countries * charts * RANKS)
+    start = date(2025, 1, 6)
+    rows = []
+    for w in range(weeks):
+        current = start + timedelta(weeks=w)
+        last = current - timedelta(weeks=1)
+        for country in (COUNTRIES * (countries // len(COUNTRIES) + 1))[:countries]:
+            for signal in SIGNALS[:charts]:
+                for plat in PLATFORMS[:platforms]:
+                    for rank in range(1, RANKS + 1):
+                        app_id = f"com.synthetic.app{rng.randrange(n_apps)}"
+                        roll = rng.random()
+                        if roll < 0.15:
+                            change_type, change, last_rank = "🆕 新进榜单", "NEW", "-"
+                        elif roll < 0.35:
+                            up = rng.randint(1, 90)
+                            change_type, change, last_rank = "🚀 排名飙升", f"↑{up}", str(rank + up)
+                        elif roll < 0.6:
+                            down = rng.randint(1, 30)
+                            change_type, change, last_rank = "📉 排名下降", f"↓{down}", str(max(1, rank - down))
+                        else:
+                            change_type, change, last_rank = "➡️ 排名稳定", "-", str(rank)
+                        rows.append(
+                            (
+                                current.isoformat(), last.isoformat(), signal, f"App {app_id[-5:]}", app_id,
+                                country, plat, rank, last_rank, change, change_type,
+                                rng.randint(100, 500000), round(rng.random() * 200000, 2), "",
+                            )
+                        )
+        conn.executemany("INSERT INTO rank_changes VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+        rows.clear()
+    conn.executemany(
+        "INSERT INTO app_metadata VALUES (?,?,?,?,?)",
+        (
+            (f"com.synthetic.app{i}", os_, f"Synthetic Game {i}", f"Publisher {i % 97}", "2024-01-01T00:00:00Z")
+            for i in range(n_apps)
+            for os_ in ("ios", "android")
+        ),
+    )
+    conn.commit()
+    total = conn.execute("SELECT COUNT(*) FROM rank_changes").fetchone()[0]
+    conn.close()
+    return total
+
+
+def measure(fn, repeat: int, warmup: int) -> dict:
+    """预热后重复计时，再单独跑一次记录 tracemalloc 峰值。"""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "min_ms": min(times) * 1000,
+        "median_ms": statistics.median(times) * 1000,
+        "mean_ms": statistics.fmean(times) * 1000,
+        "peak_kib": peak / 1024,
+        "repeat": repeat,
+    }
+
+
+def benchmarks(conn: sqlite3.Connection) -> list[tuple[str, object]]:
+    """(名称, 无参可调用) 列表。"""
+    queries = SensorTowerQueries(conn)
+    weeks = [w[0] for w in queries.week_fingerprints()]
+    latest = weeks[0]
+
+    def run_query(sql: str, params: tuple):
+        return lambda: conn.execute(sql, params).fetchall()
+
+    items: list[tuple[str, object]] = [
+        (f"query:{name}", run_query(sql, params)) for name, sql, params in queries.report_queries()
+    ]
+
+    def generate_per_week():
+        return [render_week_md(w, "", queries.new_entries(w), queries.surge_top(w)) for w in weeks]
+
+    items += [
+        ("generate_weekly_report:per_week_queries", generate_per_week),
+        ("build_sensortower_weekly_md", lambda: build_sensortower_weekly_md(conn)),
+        (
+            "pick_one_per_region_chart_platform",
+            lambda: list(queries.top_k_per_partition(1, ONE_PER_PARTITION_WEEKLY, "rank", latest, latest)),
+        ),
+    ]
+    return items
+
+
+def compare(results: dict, baseline_path: Path, threshold: float) -> bool:
+    """与基线对比 median，变慢超过 threshold（比例）的项目视为回归。返回是否无回归。"""
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    base = baseline.get("results", {})
+    ok = True
+    print(f"\n与基线对比：{baseline_path}（阈值 +{threshold:.0%}）")
+    for name, r in results["results"].items():
+        if name not in base:
+            print(f"  {name}: 基线中无此项")
+            continue
+        ratio = r["median_ms"] / base[name]["median_ms"] if base[name]["median_ms"] else 1.0
+        flag = "回归" if ratio > 1 + threshold else "OK"
+        if flag == "回归":
+            ok = False
+        print(f"  {name}: {base[name]['median_ms']:.2f}ms -> {r['median_ms']:.2f}ms（x{ratio:.2f}）{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SensorTower 报表路径基准测试（合成数据）")
+    parser.add_argument("--weeks", type=int, default=12, help="周数")
+    parser.add_argument("--countries", type=int, default=10, help="国家/地区数")
+    parser.add_argument("--charts", type=int, default=3, help=f"榜单数（最多 {len(SIGNALS)}）")
+    parser.add_argument("--platforms", type=int, default=2, help="平台数（1 或 2）")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复计时次数")
+    parser.add_argument("--warmup", type=int, default=1, help="每项预热次数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--provision", action="store_true", help="先执行 sensortower_schema 迁移与建索引")
+    parser.add_argument(
+        "--db-path",
+        type=Path,
+        default=None,
+        help="合成数据库保存路径（默认临时目录，结束后删除）；已存在的文件必须是本脚本生成的合成库",
+    )
+    parser.add_argument("--json", type=Path, default=None, help="结果 JSON 输出路径")
+    parser.add_argument("--compare", type=Path, default=None, help="与之前的结果 JSON 对比")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定回归的变慢比例，默认 0.2（20%%）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db_path or Path(tmp) / "bench_sensortower.db"
+        start = time.perf_counter()
+        try:
+            rows = generate_db(db_path, args.weeks, args.countries, args.charts, args.platforms, args.seed)
+        except FileExistsError as e:
+            print(f"错误：{e}", file=sys.stderr)
+            return 1
+        print(f"已生成合成数据：{rows} 行（{time.perf_counter() - start:.1f}s）-> {db_path}")
+        if args.provision:
+            conn = sqlite3.connect(db_path)
+            provision(conn)
+            conn.close()
+            print("已执行迁移与建索引")
+
+        conn = connect_readonly(db_path)
+        results = {}
+        for name, fn in benchmarks(conn):
+            r = measure(fn, args.repeat, args.warmup)
+            results[name] = r
+            print(f"  {name:<48} median {r['median_ms']:9.2f}ms  min {r['min_ms']:9.2f}ms  peak {r['peak_kib']:9.1f}KiB")
+        conn.close()
+
+    output = {
+        "config": {
+            "weeks": args.weeks,
+            "countries": args.countries,
+            "charts": args.charts,
+            "platforms": args.platforms,
+            "rows": rows,
+            "provisioned": args.provision,
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(output, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"已写入结果：{args.json}")
+    if args.compare and not compare(output, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
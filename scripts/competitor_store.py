@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+competitor_data.db 竞品社媒数据的统一存储。
+
+原结构为每个公司一张 company_raw_data_<公司> 表（经 company_tables_index 查找），
+每行一个 posts_json 大字段，跨公司的问题只能逐表扫描再在读取端解析 JSON。
+统一后：
+  - competitor_raw_data：每次抓取一行（公司 + 原表的账号/抓取字段），
+    索引 (company_name, fetch_date)、(platform_type, game)
+  - 帖子按内容寻址去重（同一账号每天重复抓取，posts_json 大部分相同）：
+    competitor_post_bodies 每条帖子正文（去掉 engagement）只存一份，
+    键为平台帖子 ID / 帖子链接（都没有时为正文本身），保留最近一次抓取的版本；
+    competitor_post_snapshots 每次抓取每条帖子一行，只存正文引用和当次互动数据，
+    点赞 / 评论 / 分享 / 播放与发布时间为 JSON1 生成列，
+    索引 (company_name, published_at)、(body_id)
+  - competitor_posts 视图：每条帖子一行（所属抓取、序号、拼回的完整帖子 JSON），
+    写入 / 删除经 INSTEAD OF 触发器落到上面两张表
+  - 兼容视图：--replace-legacy 时删除原表，建同名视图 company_raw_data_<公司>
+    （由帖子行重新拼出 posts_json），并带 INSTEAD OF INSERT 触发器，
+    原有读取方和按原表写入的抓取脚本都不需要修改
+
+迁移可重复执行：按 (公司, fetch_date, platform_type, game, url) 幂等写入；
+已按旧版（每条帖子存完整 JSON 的 competitor_posts 表）迁移过的库会自动转换为去重结构。
+--compact 为一次性压缩：迁移并替换原表、清理无引用正文、VACUUM，并分别报告去重前后的帖子数据量
+（没有重复抓取时去重存储会因键与逐次互动数据略大于 posts_json）与 VACUUM 回收的空间。
+
+使用方式（在项目根目录）：
+  python scripts/competitor_store.py
+  python scripts/competitor_store.py --db public/competitor_data.db --replace-legacy --vacuum
+  python scripts/competitor_store.py --compact
+"""
+
+import argparse
+import json
+import sqlite3
+from pathlib import Path
+
+RAW_TABLE = "competitor_raw_data"
+POSTS_TABLE = "competitor_posts"
+BODIES_TABLE = "competitor_post_bodies"
+SNAPSHOTS_TABLE = "competitor_post_snapshots"
+
+# 各平台帖子 JSON 的字段名不统一（以 competitor_data.db 实际数据为准）：
+#   帖子链接：Instagram / TikTok / Twitter 为 post_url，Facebook 为 link
+#   发布时间：Instagram / TikTok / Twitter 为 published_at，Facebook 为 time
+POST_KEY_PATHS = ("$.id", "$.post_url", "$.link")
+PUBLISHED_AT_PATHS = ("$.published_at", "$.time")
+# 互动数据：Twitter 的评论为 reply、转发为 retweet，其他平台为 comment / share
+COMMENT_PATHS = ("$.comment", "$.reply")
+SHARE_PATHS = ("$.share", "$.retweet")
+
+
+def _first_of(column: str, paths: tuple[str, ...]) -> str:
+    return "COALESCE(" + ", ".join(f"json_extract({column}, '{p}')" for p in paths) + ")"
+
+
+def post_key_sql(column: str) -> str:
+    """帖子 ID 的 SQL 表达式：平台帖子 ID，其次帖子链接（post_url / Facebook 的 link）。"""
+    return _first_of(column, POST_KEY_PATHS)
+
+
+def published_at_sql(column: str) -> str:
+    """发布时间的 SQL 表达式：published_at，Facebook 为 time。"""
+    return _first_of(column, PUBLISHED_AT_PATHS)
+
+
+# 帖子正文的去重键：帖子 ID / 链接，都没有时用去掉 engagement 的正文本身
+BODY_KEY_SQL = f"COALESCE({post_key_sql('NEW.post')}, json_remove(NEW.post, '$.engagement'))"
+
+# 原表的抓取字段（不含 id / posts_json），顺序与原表一致
+FETCH_COLUMNS = (
+    "fetch_date",
+    "platform_type",
+    "game",
+    "url",
+    "username",
+    "page_id",
+    "channel_id",
+    "handle",
+    "posts_count",
+    "fetched_at",
+    "created_at",
+)
+
+SCHEMA_SQL = f"""
+CREATE TABLE IF NOT EXISTS {RAW_TABLE} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    company_name TEXT NOT NULL,
+    fetch_date TEXT NOT NULL,
+    platform_type TEXT NOT NULL,
+    game TEXT,
+    url TEXT,
+    username TEXT,
+    page_id TEXT,
+    channel_id TEXT,
+    handle TEXT,
+    posts_count INTEGER DEFAULT 0,
+    fetched_at TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    UNIQUE(company_name, fetch_date, platform_type, game, url)
+);
+CREATE INDEX IF NOT EXISTS idx_competitor_raw_company_date ON {RAW_TABLE}(company_name, fetch_date);
+CREATE INDEX IF NOT EXISTS idx_competitor_raw_platform_game ON {RAW_TABLE}(platform_type, game);
+
+-- 帖子正文去重：同一公司同一帖子（平台帖子 ID / 链接；都没有时以正文内容本身为键）只存一份，
+-- 正文为去掉 engagement 的帖子 JSON，取最近一次抓取的版本（媒体链接等会随抓取刷新）
+CREATE TABLE IF NOT EXISTS {BODIES_TABLE} (
+    id INTEGER PRIMARY KEY,
+    company_name TEXT NOT NULL,
+    body_key TEXT NOT NULL,
+    body TEXT NOT NULL,
+    fetch_date TEXT,
+    published_at TEXT GENERATED ALWAYS AS ({published_at_sql('body')}) VIRTUAL,
+    UNIQUE(company_name, body_key)
+);
+CREATE INDEX IF NOT EXISTS idx_competitor_post_bodies_company_published
+    ON {BODIES_TABLE}(company_name, published_at);
+
+-- 每次抓取的帖子快照：只引用正文，另存当次会变化的互动数据
+CREATE TABLE IF NOT EXISTS {SNAPSHOTS_TABLE} (
+    raw_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    body_id INTEGER NOT NULL,
+    engagement TEXT,
+    likes INTEGER GENERATED ALWAYS AS (json_extract(engagement, '$.like')) VIRTUAL,
+    comments INTEGER GENERATED ALWAYS AS ({_first_of('engagement', COMMENT_PATHS)}) VIRTUAL,
+    shares INTEGER GENERATED ALWAYS AS ({_first_of('engagement', SHARE_PATHS)}) VIRTUAL,
+    views INTEGER GENERATED ALWAYS AS (json_extract(engagement, '$.view')) VIRTUAL,
+    PRIMARY KEY (raw_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_competitor_post_snapshots_body ON {SNAPSHOTS_TABLE}(body_id);
+
+-- 每条帖子一行（正文 + 当次互动数据拼回完整帖子 JSON），写入 / 删除经触发器落到上面两张表
+CREATE VIEW IF NOT EXISTS {POSTS_TABLE} AS
+SELECT
+    s.raw_id,
+    s.position,
+    b.company_name,
+    CASE WHEN s.engagement IS NULL THEN b.body
+         ELSE json_set(b.body, '$.engagement', json(s.engagement)) END AS post,
+    {post_key_sql('b.body')} AS post_key,
+    b.published_at,
+    s.likes,
+    s.comments,
+    s.shares,
+    s.views,
+    s.body_id
+FROM {SNAPSHOTS_TABLE} s
+JOIN {BODIES_TABLE} b ON b.id = s.body_id;
+
+CREATE TRIGGER IF NOT EXISTS {POSTS_TABLE}_insert INSTEAD OF INSERT ON {POSTS_TABLE}
+BEGIN
+    INSERT INTO {BODIES_TABLE} (company_name, body_key, body, fetch_date)
+    VALUES (
+        NEW.company_name,
+        {BODY_KEY_SQL},
+        json_remove(NEW.post, '$.engagement'),
+        (SELECT fetch_date FROM {RAW_TABLE} WHERE id = NEW.raw_id)
+    )
+    ON CONFLICT(company_name, body_key) DO UPDATE
+        SET body = excluded.body, fetch_date = excluded.fetch_date
+        WHERE excluded.fetch_date >= {BODIES_TABLE}.fetch_date OR {BODIES_TABLE}.fetch_date IS NULL;
+    INSERT OR REPLACE INTO {SNAPSHOTS_TABLE} (raw_id, position, body_id, engagement)
+    VALUES (
+        NEW.raw_id,
+        NEW.position,
+        (SELECT id FROM {BODIES_TABLE} WHERE company_name = NEW.company_name AND body_key = {BODY_KEY_SQL}),
+        json_extract(NEW.post, '$.engagement')
+    );
+END;
+
+CREATE TRIGGER IF NOT EXISTS {POSTS_TABLE}_delete INSTEAD OF DELETE ON {POSTS_TABLE}
+BEGIN
+    DELETE FROM {SNAPSHOTS_TABLE} WHERE raw_id = OLD.raw_id AND position = OLD.position;
+END;
+"""
+
+
+def _statements(script: str) -> list[str]:
+    """把多语句 SQL 拆成单条语句（触发器体内的分号不会被拆开），便于在调用方的事务内逐条执行。"""
+    statements, buf = [], ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            if buf.strip():
+                statements.append(buf.strip())
+            buf = ""
+    return statements
+
+
+def ensure_store(conn: sqlite3.Connection) -> int:
+    """建立统一存储的表、索引、视图与触发器（幂等），调用方负责事务。
+
+    若 competitor_posts 仍是每条帖子存完整 JSON 的旧版表，先取出全部帖子，
+    改建为正文去重结构后再经视图写回；返回转换的帖子条数。
+    快照表的评论 / 分享生成列若是旧定义（只读 comment / share），按当前定义重建。
+    """
+    _rebuild_engagement_columns(conn)
+    rows = []
+    if is_table(conn, POSTS_TABLE):
+        rows = conn.execute(
+            f"""
+            SELECT p.raw_id, p.position, p.company_name, p.post
+            FROM {POSTS_TABLE} p
+            LEFT JOIN {RAW_TABLE} r ON r.id = p.raw_id
+            ORDER BY r.fetch_date, p.raw_id, p.position
+            """
+        ).fetchall()
+        conn.execute(f"DROP TABLE {POSTS_TABLE}")
+    for statement in _statements(SCHEMA_SQL):
+        conn.execute(statement)
+    conn.executemany(
+        f"INSERT INTO {POSTS_TABLE} (raw_id, position, company_name, post) VALUES (?, ?, ?, ?)", rows
+    )
+    return len(rows)
+
+
+def _rebuild_engagement_columns(conn: sqlite3.Connection) -> None:
+    """把旧定义的 comments / shares 生成列按 COMMENT_PATHS / SHARE_PATHS 重建（幂等）。
+
+    生成列不能修改，只能删除再添加；删除列要求没有视图引用它，
+    因此先删除 competitor_posts 视图与各公司兼容视图，重建后再按原样建回（ensure_store 会建回 competitor_posts）。
+    """
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (SNAPSHOTS_TABLE,)
+    ).fetchone()
+    if not row or all(path in row[0] for path in COMMENT_PATHS + SHARE_PATHS):
+        return
+    compat_views = []
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'company_tables_index'").fetchone():
+        compat_views = [
+            (company_name, table_name)
+            for company_name, table_name in company_tables(conn)
+            if conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = ?", (table_name,)
+            ).fetchone()
+        ]
+    for _, table_name in compat_views:
+        conn.execute(f'DROP VIEW "{table_name}"')
+    conn.execute(f"DROP VIEW IF EXISTS {POSTS_TABLE}")
+    for column, paths in (("comments", COMMENT_PATHS), ("shares", SHARE_PATHS)):
+        conn.execute(f"ALTER TABLE {SNAPSHOTS_TABLE} DROP COLUMN {column}")
+        conn.execute(
+            f"ALTER TABLE {SNAPSHOTS_TABLE} ADD COLUMN {column} INTEGER "
+            f"GENERATED ALWAYS AS ({_first_of('engagement', paths)}) VIRTUAL"
+        )
+    for statement in _statements(SCHEMA_SQL):
+        conn.execute(statement)
+    for company_name, table_name in compat_views:
+        for statement in _statements(compat_view_sql(company_name, table_name)):
+            conn.execute(statement)
+
+
+def is_table(conn: sqlite3.Connection, name: str) -> bool:
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return bool(row) and row[0] == "table"
+
+
+def company_tables(conn: sqlite3.Connection) -> list[tuple[str, str]]:
+    """(company_name, table_name) 列表。"""
+    return conn.execute(
+        "SELECT company_name, table_name FROM company_tables_index ORDER BY created_at, company_name"
+    ).fetchall()
+
+
+def ingest_fetch(conn: sqlite3.Connection, company_name: str, record: dict, posts: list) -> int:
+    """写入一次抓取（同一 公司+日期+平台+游戏+url 已存在则整体替换），返回 raw id。
+
+    record 为原表的抓取字段（见 FETCH_COLUMNS），posts 为帖子字典列表。
+    调用方负责事务。
+    """
+    key = (company_name, record["fetch_date"], record["platform_type"], record.get("game"), record.get("url"))
+    old = conn.execute(
+        f"""
+        SELECT id FROM {RAW_TABLE}
+        WHERE company_name = ? AND fetch_date = ? AND platform_type = ? AND game IS ? AND url IS ?
+        """,
+        key,
+    ).fetchone()
+    if old:
+        conn.execute(f"DELETE FROM {POSTS_TABLE} WHERE raw_id = ?", (old[0],))
+        conn.execute(f"DELETE FROM {RAW_TABLE} WHERE id = ?", (old[0],))
+    cols = ", ".join(FETCH_COLUMNS)
+    marks = ", ".join("?" for _ in FETCH_COLUMNS)
+    cur = conn.execute(
+        f"INSERT INTO {RAW_TABLE} (company_name, {cols}) VALUES (?, {marks})",
+        (company_name, *(record.get(c) for c in FETCH_COLUMNS)),
+    )
+    raw_id = cur.lastrowid
+    conn.executemany(
+        f"INSERT INTO {POSTS_TABLE} (raw_id, position, company_name, post) VALUES (?, ?, ?, ?)",
+        (
+            (raw_id, i, company_name, json.dumps(post, ensure_ascii=False))
+            for i, post in enumerate(posts)
+        ),
+    )
+    return raw_id
+
+
+def migrate_company(conn: sqlite3.Connection, company_name: str, table_name: str) -> int:
+    """把一张原表的全部行写入统一存储，返回行数。"""
+    cols = ", ".join(FETCH_COLUMNS)
+    rows = conn.execute(f'SELECT {cols}, posts_json FROM "{table_name}" ORDER BY id').fetchall()
+    for row in rows:
+        record = dict(zip(FETCH_COLUMNS, row[:-1]))
+        try:
+            posts = json.loads(row[-1] or "[]")
+        except ValueError:
+            posts = []
+        if not isinstance(posts, list):
+            posts = []
+        ingest_fetch(conn, company_name, record, posts)
+    return len(rows)
+
+
+def verify_company(conn: sqlite3.Connection, company_name: str, table_name: str) -> bool:
+    """原表每一行在统一存储中都有对应抓取，且帖子条数一致。"""
+    missing = conn.execute(
+        f"""
+        SELECT COUNT(*)
+        FROM "{table_name}" t
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {RAW_TABLE} r
+            WHERE r.company_name = ? AND r.fetch_date = t.fetch_date AND r.platform_type = t.platform_type
+              AND r.game IS t.game AND r.url IS t.url
+              AND (SELECT COUNT(*) FROM {SNAPSHOTS_TABLE} s WHERE s.raw_id = r.id)
+                  = CASE WHEN json_valid(t.posts_json) AND json_type(t.posts_json) = 'array'
+                         THEN json_array_length(t.posts_json) ELSE 0 END
+        )
+        """,
+        (company_name,),
+    ).fetchone()[0]
+    return missing == 0
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def compat_view_sql(company_name: str, table_name: str) -> str:
+    """与原表同名、同列的兼容视图，以及按原表写入的 INSTEAD OF INSERT 触发器。"""
+    company = _sql_literal(company_name)
+    cols = ", ".join(f"r.{c}" for c in FETCH_COLUMNS[:-2])
+    fetch_cols = ", ".join(FETCH_COLUMNS)
+    new_cols = ", ".join(f"NEW.{c}" for c in FETCH_COLUMNS)
+    same_fetch = (
+        f"company_name = {company} AND fetch_date = NEW.fetch_date AND platform_type = NEW.platform_type "
+        "AND game IS NEW.game AND url IS NEW.url"
+    )
+    return f"""
+    CREATE VIEW "{table_name}" AS
+    SELECT
+        r.id,
+        {cols},
+        (
+            SELECT json_group_array(json(p.post))
+            FROM (SELECT post FROM {POSTS_TABLE} WHERE raw_id = r.id ORDER BY position) p
+        ) AS posts_json,
+        r.fetched_at,
+        r.created_at
+    FROM {RAW_TABLE} r
+    WHERE r.company_name = {company};
+
+    CREATE TRIGGER "{table_name}_insert" INSTEAD OF INSERT ON "{table_name}"
+    BEGIN
+        DELETE FROM {POSTS_TABLE} WHERE raw_id IN (SELECT id FROM {RAW_TABLE} WHERE {same_fetch});
+        DELETE FROM {RAW_TABLE} WHERE {same_fetch};
+        INSERT INTO {RAW_TABLE} (company_name, {fetch_cols}) VALUES ({company}, {new_cols});
+        INSERT INTO {POSTS_TABLE} (raw_id, position, company_name, post)
+        SELECT last_insert_rowid(), CAST(j.key AS INTEGER), {company}, j.value
+        FROM json_each(CASE WHEN json_valid(NEW.posts_json) THEN NEW.posts_json ELSE '[]' END) j
+        WHERE j.type = 'object';
+    END;
+    """
+
+
+def replace_legacy(conn: sqlite3.Connection, company_name: str, table_name: str) -> None:
+    """删除原表（及其索引），建同名兼容视图。调用方负责事务。"""
+    conn.execute(f'DROP TABLE "{table_name}"')
+    for statement in _statements(compat_view_sql(company_name, table_name)):
+        conn.execute(statement)
+
+
+def prune_bodies(conn: sqlite3.Connection) -> int:
+    """删除已没有任何快照引用的帖子正文，返回删除条数。"""
+    cur = conn.execute(
+        f"""
+        DELETE FROM {BODIES_TABLE}
+        WHERE NOT EXISTS (SELECT 1 FROM {SNAPSHOTS_TABLE} s WHERE s.body_id = {BODIES_TABLE}.id)
+        """
+    )
+    return cur.rowcount
+
+
+def posts_json_bytes(conn: sqlite3.Connection) -> int:
+    """各公司原表（或兼容视图）posts_json 的总字节数。"""
+    total = 0
+    for _, table_name in company_tables(conn):
+        total += conn.execute(f'SELECT COALESCE(SUM(length(CAST(posts_json AS BLOB))), 0) FROM "{table_name}"').fetchone()[0]
+    return total
+
+
+def store_bytes(conn: sqlite3.Connection) -> int:
+    """去重后帖子数据（正文 + 每次快照的互动数据 + 键）的总字节数。"""
+    bodies = conn.execute(
+        f"SELECT COALESCE(SUM(length(CAST(body AS BLOB)) + length(CAST(body_key AS BLOB))), 0) FROM {BODIES_TABLE}"
+    ).fetchone()[0]
+    snapshots = conn.execute(
+        f"SELECT COALESCE(SUM(length(CAST(engagement AS BLOB))), 0) FROM {SNAPSHOTS_TABLE}"
+    ).fetchone()[0]
+    return bodies + snapshots
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把各公司 company_raw_data_<公司> 表合并为统一的抓取/帖子存储")
+    parser.add_argument(
+        "--db",
+        type=Path,
+        default=Path("public/competitor_data.db"),
+        help="competitor_data.db 路径",
+    )
+    parser.add_argument(
+        "--replace-legacy",
+        action="store_true",
+        help="校验通过后删除原表，改为同名兼容视图",
+    )
+    parser.add_argument("--vacuum", action="store_true", help="完成后 VACUUM 回收空间")
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="一次性压缩：迁移并替换原表、清理无引用正文、VACUUM，并报告去重前后的数据量与 VACUUM 回收的空间",
+    )
+    args = parser.parse_args()
+    if args.compact:
+        args.replace_legacy = args.vacuum = True
+
+    if not args.db.exists():
+        print(f"错误：数据库不存在 {args.db}")
+        return 1
+
+    size_before = args.db.stat().st_size
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        json_bytes = posts_json_bytes(conn) if args.compact else 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            converted = ensure_store(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if converted:
+            print(f"已把 {converted} 条帖子转换为正文去重存储")
+        for company_name, table_name in company_tables(conn):
+            if not is_table(conn, table_name):
+                print(f"[{company_name}] {table_name} 已是兼容视图，跳过")
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                n = migrate_company(conn, company_name, table_name)
+                if not verify_company(conn, company_name, table_name):
+                    raise RuntimeError(f"{table_name} 校验失败：统一存储与原表不一致")
+                if args.replace_legacy:
+                    replace_legacy(conn, company_name, table_name)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            action = "，已替换为兼容视图" if args.replace_legacy else ""
+            print(f"[{company_name}] {table_name}：迁移 {n} 行{action}")
+        if args.compact:
+            pruned = prune_bodies(conn)
+            if pruned:
+                print(f"已清理无引用的帖子正文 {pruned} 条")
+        conn.execute("ANALYZE")
+        if args.vacuum:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            before_vacuum = conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+            conn.execute("VACUUM")
+            reclaimed = before_vacuum - conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+        if args.compact:
+            deduped = store_bytes(conn)
+            bodies, snapshots = conn.execute(
+                f"SELECT (SELECT COUNT(*) FROM {BODIES_TABLE}), (SELECT COUNT(*) FROM {SNAPSHOTS_TABLE})"
+            ).fetchone()
+    finally:
+        conn.close()
+
+    size_after = args.db.stat().st_size
+    if args.compact:
+        change = deduped - json_bytes
+        ratio = change / json_bytes if json_bytes else 0.0
+        print(
+            f"帖子数据：posts_json {json_bytes / 1024:.1f} KiB -> 去重存储 {deduped / 1024:.1f} KiB"
+            f"（{snapshots} 条快照引用 {bodies} 条正文，去掉重复正文 {snapshots - bodies} 条；"
+            f"{'减少' if change < 0 else '增加'} {abs(change) / 1024:.1f} KiB，{ratio:+.0%}）"
+        )
+    if args.vacuum:
+        print(f"VACUUM：回收 {reclaimed / 1024:.0f} KiB 空闲页（含删除原表释放的空间）")
+    print(f"完成：数据库 {size_before / 1024:.0f} KiB -> {size_after / 1024:.0f} KiB")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
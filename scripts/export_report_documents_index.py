@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+把 public/report_documents.json（AI 日报全文数组）拆成前端按需加载的列表索引、单篇正文与分片倒排索引。
+
+前端原先要下载并解析整个 report_documents.json，随日报数量线性增长，搜索也只在已加载的数据上做。
+本脚本输出（默认 public/report_documents/）：
+  - index.json：文档列表（标题、日期、时间、来源、标签、摘要、正文文件名），最新在前；
+    以及搜索分片表（分片号 -> 文件名）与分词、分片规则说明
+  - docs/doc_<id>.<内容哈希>.json：单篇文档的完整对象（与原数组里的一项相同）
+  - search/terms_<分片号>.<内容哈希>.json：倒排索引分片 {词项: [[文档序号, 位置增量...], ...]}
+  - 以上每个文件都有同名 .gz 预压缩副本（同 export_sensortower_shards.py）
+
+分词（tokenize，前端需实现同样的规则）：
+  - 先做 NFKC 归一化并转小写；Markdown 链接地址与裸 URL 不参与索引
+  - 连续的 CJK 字符取相邻二元组（bigram），只有一个字时取该字；连续的 [a-z0-9] 为一个拉丁词
+  - 位置为词项在文档词项流里的序号，字段（标题、标签、摘要、正文）之间位置跳过 FIELD_GAP，
+    查询短语时要求各词项位置依次相邻（见 search）
+  - 词项所在分片 = FNV-1a 32 位哈希（UTF-8 字节）% 分片数
+
+文档序号即 index.json 里 documents 的下标；位置列表按增量编码（首个为绝对位置）。
+文件名带内容哈希，可设置长期缓存；只有 index.json 需要每次重新拉取。未变化的文件不会重写，过期文件会被删除。
+
+使用方式（在项目根目录）：
+  python scripts/export_report_documents_index.py
+  python scripts/export_report_documents_index.py --src public/report_documents.json --out public/report_documents --shards 16
+  python scripts/export_report_documents_index.py --query "多智能体"
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+import unicodedata
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+from export_sensortower_shards import dump_json, remove_with_gzip, write_with_gzip
+
+INDEX_NAME = "index.json"
+INDEX_VERSION = 1
+HASH_LENGTH = 12
+DEFAULT_SHARDS = 16
+FIELD_GAP = 16
+SEARCH_FIELDS = ("title", "tags", "summary", "content")
+
+_URL_RE = re.compile(r"\]\((?:https?://|www\.)[^)]*\)|https?://\S+")
+_TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9]+")
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+
+def tokenize(text: str, start: int = 0) -> list[tuple[str, int]]:
+    """文本 -> [(词项, 位置)]：CJK 连续字符取 bigram，拉丁字母与数字按词切分。"""
+    text = _URL_RE.sub("]", unicodedata.normalize("NFKC", text).lower())
+    tokens = []
+    pos = start
+    for run in _TOKEN_RE.findall(text):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append((run, pos))
+                pos += 1
+            else:
+                for i in range(len(run) - 1):
+                    tokens.append((run[i : i + 2], pos))
+                    pos += 1
+        else:
+            tokens.append((run, pos))
+            pos += 1
+    return tokens
+
+
+def document_tokens(doc: dict) -> list[tuple[str, int]]:
+    """一篇文档各检索字段的词项流，字段之间留出位置间隔，短语不会跨字段匹配。"""
+    tokens = []
+    pos = 0
+    for name in SEARCH_FIELDS:
+        value = doc.get(name)
+        if isinstance(value, list):
+            value = " ".join(str(v) for v in value)
+        if not value:
+            continue
+        field_tokens = tokenize(str(value), pos)
+        tokens.extend(field_tokens)
+        if field_tokens:
+            pos = field_tokens[-1][1] + 1 + FIELD_GAP
+    return tokens
+
+
+def shard_of(term: str, shards: int) -> int:
+    """FNV-1a 32 位哈希取模，前端用同样的算法定位分片。"""
+    h = 0x811C9DC5
+    for b in term.encode("utf-8"):
+        h = ((h ^ b) * 0x01000193) & 0xFFFFFFFF
+    return h % shards
+
+
+def build_postings(docs: list[dict]) -> dict[str, list]:
+    """倒排表 {词项: [[文档序号, 位置增量...], ...]}，文档序号升序。"""
+    positions: dict[str, dict[int, list[int]]] = defaultdict(dict)
+    for doc_no, doc in enumerate(docs):
+        for term, pos in document_tokens(doc):
+            positions[term].setdefault(doc_no, []).append(pos)
+    postings = {}
+    for term, by_doc in positions.items():
+        entries = []
+        for doc_no in sorted(by_doc):
+            ps = by_doc[doc_no]
+            entries.append([doc_no, ps[0]] + [b - a for a, b in zip(ps, ps[1:])])
+        postings[term] = entries
+    return postings
+
+
+def _doc_id(doc: dict) -> str:
+    """稳定的文档 ID：日期 + 标题哈希（同一标题的日报重新生成时 ID 不变）。"""
+    title_hash = hashlib.sha256(str(doc.get("title", "")).encode("utf-8")).hexdigest()[:8]
+    return f"{str(doc.get('date') or 'nodate').replace('-', '')}_{title_hash}"
+
+
+def load_documents(src: Path) -> list[dict]:
+    """读取并校验 report_documents.json，按日期、时间倒序（最新在前）。"""
+    data = json.loads(src.read_text(encoding="utf-8"))
+    if not isinstance(data, list):
+        raise ValueError(f"{src} 应为 JSON 数组")
+    docs = [d for d in data if isinstance(d, dict) and "title" in d and isinstance(d.get("content"), str)]
+    return sorted(docs, key=lambda d: (str(d.get("date") or ""), str(d.get("time") or "")), reverse=True)
+
+
+def _hashed_name(prefix: str, data: bytes) -> str:
+    return f"{prefix}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}.json"
+
+
+def export(src: Path, out: Path, shards: int) -> tuple[int, int, int]:
+    """生成全部输出，返回 (文档数, 写入文件数, 删除文件数)。"""
+    docs = load_documents(src)
+    (out / "docs").mkdir(parents=True, exist_ok=True)
+    (out / "search").mkdir(parents=True, exist_ok=True)
+    keep: set[Path] = set()
+    written = 0
+
+    def put(subdir: str, prefix: str, payload) -> str:
+        nonlocal written
+        data = dump_json(payload)
+        name = _hashed_name(prefix, data)
+        path = out / subdir / name
+        keep.add(path)
+        if not path.is_file():
+            write_with_gzip(path, data)
+            written += 1
+        return f"{subdir}/{name}"
+
+    listing = []
+    seen_ids: dict[str, int] = {}
+    for doc in docs:
+        doc_id = _doc_id(doc)
+        seen_ids[doc_id] = seen_ids.get(doc_id, 0) + 1
+        if seen_ids[doc_id] > 1:
+            doc_id = f"{doc_id}_{seen_ids[doc_id]}"
+        listing.append(
+            {
+                "id": doc_id,
+                "title": doc.get("title"),
+                "date": doc.get("date"),
+                "time": doc.get("time"),
+                "source": doc.get("source"),
+                "tags": doc.get("tags") or [],
+                "summary": doc.get("summary"),
+                "file": put("docs", f"doc_{doc_id}", doc),
+                "bytes": len(doc.get("content", "").encode("utf-8")),
+            }
+        )
+
+    by_shard: list[dict[str, list]] = [{} for _ in range(shards)]
+    postings = build_postings(docs)
+    for term, entries in postings.items():
+        by_shard[shard_of(term, shards)][term] = entries
+    shard_files = [put("search", f"terms_{i:03d}", terms) for i, terms in enumerate(by_shard)]
+
+    removed = 0
+    for subdir in ("docs", "search"):
+        for path in (out / subdir).glob("*.json"):
+            if path not in keep:
+                remove_with_gzip(path)
+                removed += 1
+
+    index = {
+        "version": INDEX_VERSION,
+        "documents": listing,
+        "search": {
+            "tokenizer": "nfkc-lower; cjk-bigram; latin [a-z0-9]+",
+            "fields": list(SEARCH_FIELDS),
+            "field_gap": FIELD_GAP,
+            "shard_hash": "fnv1a32-utf8",
+            "shards": shard_files,
+            "terms": len(postings),
+        },
+    }
+    index_path = out / INDEX_NAME
+    try:
+        previous = json.loads(index_path.read_text(encoding="utf-8"))
+        previous.pop("generated_at", None)
+    except (OSError, ValueError):
+        previous = None
+    if previous != json.loads(dump_json(index)):
+        index["generated_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        write_with_gzip(index_path, dump_json(index))
+        written += 1
+    return len(docs), written, removed
+
+
+def search(out: Path, query: str) -> list[dict]:
+    """与前端相同的查询流程：分词 -> 只读取涉及的分片 -> 按文档求交并要求词项位置依次相邻。
+
+    查询里用空格分开的多个片段各自作为短语，全部命中的文档按命中次数降序返回。
+    """
+    index = json.loads((out / INDEX_NAME).read_text(encoding="utf-8"))
+    shard_files = index["search"]["shards"]
+    loaded: dict[int, dict] = {}
+
+    def postings(term: str) -> dict[int, set[int]]:
+        shard = shard_of(term, len(shard_files))
+        if shard not in loaded:
+            loaded[shard] = json.loads((out / shard_files[shard]).read_text(encoding="utf-8"))
+        result = {}
+        for doc_no, first, *deltas in loaded[shard].get(term, []):
+            pos = [first]
+            for d in deltas:
+                pos.append(pos[-1] + d)
+            result[doc_no] = set(pos)
+        return result
+
+    scores: dict[int, int] | None = None
+    for phrase in query.split():
+        terms = tokenize(phrase)
+        if not terms:
+            continue
+        lists = [postings(t) for t, _ in terms]
+        hits: dict[int, int] = {}
+        for doc_no in set.intersection(*(set(p) for p in lists)):
+            starts = lists[0][doc_no]
+            for offset, plist in enumerate(lists[1:], 1):
+                starts = {s for s in starts if s + offset in plist[doc_no]}
+            if starts:
+                hits[doc_no] = len(starts)
+        scores = hits if scores is None else {d: scores[d] + n for d, n in hits.items() if d in scores}
+    if not scores:
+        return []
+    docs = index["documents"]
+    return [{**docs[d], "hits": n} for d, n in sorted(scores.items(), key=lambda x: (-x[1], x[0]))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="拆分 report_documents.json：列表索引 + 单篇正文 + 分片倒排索引（含 .gz）")
+    parser.add_argument(
+        "--src",
+        type=Path,
+        default=Path("public/report_documents.json"),
+        help="report_documents.json 路径",
+    )
+    parser.add_argument(
+        "--out",
+        type=Path,
+        default=Path("public/report_documents"),
+        help="输出目录",
+    )
+    parser.add_argument("--shards", type=int, default=DEFAULT_SHARDS, help="倒排索引分片数")
+    parser.add_argument("--query", default=None, help="不导出，只在已导出的索引上检索并打印结果（用于核对）")
+    args = parser.parse_args()
+
+    if args.query is not None:
+        if not (args.out / INDEX_NAME).is_file():
+            print(f"错误：索引不存在 {args.out / INDEX_NAME}，请先导出")
+            return 1
+        results = search(args.out, args.query)
+        for r in results:
+            print(f"{r['date']}  {r['title']}（命中 {r['hits']} 处）")
+        print(f"共 {len(results)} 篇")
+        return 0
+
+    if not args.src.exists():
+        print(f"错误：文件不存在 {args.src}")
+        return 1
+    if args.shards < 1:
+        print("错误：--shards 至少为 1")
+        return 1
+    try:
+        count, written, removed = export(args.src, args.out, args.shards)
+    except ValueError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        return 1
+    print(f"共 {count} 篇文档：写入 {written} 个文件，删除 {removed} 个旧文件 -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
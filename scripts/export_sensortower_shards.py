@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+把 sensortower_top100.db 的 rank_changes 预聚合为前端可直接加载的小 JSON 分片。
+
+前端原先要下载整个 sensortower_top100.db 再用 sql.js 打开，体积随历史线性增长。
+本脚本输出：
+  - index.json：周次索引（每周的上周日期、分片文件名、条数、数据指纹），最新周在前
+  - week_<rank_date_current>.<内容哈希>.json：该周的新进 Top50、排名飙升 Top10、
+    每个 (地区, 榜单, 平台) 排名最高的一条
+  - 以上每个文件都有同名 .gz 预压缩副本（gzip mtime 固定为 0，内容相同则字节相同）
+
+分片文件名包含内容哈希，可设置长期缓存；只有 index.json 需要每次重新拉取。
+重新运行时按周次数据指纹（探测值 + 行内容哈希，同 generate_sensortower_weekly_report.py）
+只重新生成有变化的周次，旧哈希的分片会被删除。
+
+使用方式（在项目根目录）：
+  python scripts/export_sensortower_shards.py
+  python scripts/export_sensortower_shards.py --db public/sensortower_top100.db --out public/sensortower_shards
+  python scripts/export_sensortower_shards.py --full
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+from report_db import ONE_PER_PARTITION_WEEKLY, SensorTowerQueries, connect_readonly
+
+INDEX_NAME = "index.json"
+INDEX_VERSION = 1
+HASH_LENGTH = 12
+
+
+def dump_json(data) -> bytes:
+    """紧凑、键有序的 JSON（同样的数据总是得到同样的字节，便于内容哈希）。"""
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def write_with_gzip(path: Path, data: bytes) -> None:
+    """原子写入 path 及其 .gz 副本。"""
+    for target, payload in ((path, data), (path.with_name(path.name + ".gz"), gzip.compress(data, 9, mtime=0))):
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.write_bytes(payload)
+        tmp.replace(target)
+
+
+def remove_with_gzip(path: Path) -> None:
+    for target in (path, path.with_name(path.name + ".gz")):
+        target.unlink(missing_ok=True)
+
+
+def load_index(out_dir: Path) -> dict:
+    """读取已有索引；不存在、损坏或版本不符时返回空索引。"""
+    try:
+        data = json.loads((out_dir / INDEX_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != INDEX_VERSION or not isinstance(data.get("weeks"), list):
+        return {}
+    return {w["week"]: w for w in data["weeks"] if isinstance(w, dict) and "week" in w}
+
+
+def build_shards(queries: SensorTowerQueries, weeks: list[tuple[str, str]]) -> dict[str, dict]:
+    """为给定周次生成分片内容：新进/飙升逐周走索引查询，每分区一条一次区间查询。"""
+    week_ids = [w for w, _ in weeks]
+    report_rows = queries.weeks_report_rows(week_ids)
+    picks: dict[str, list] = {w: [] for w in week_ids}
+    for row in queries.top_k_per_partition(1, ONE_PER_PARTITION_WEEKLY, "rank", min(week_ids), max(week_ids)):
+        week = row.pop("rank_date_current")
+        if week in picks:
+            # 分片只保留每分区一条的原有字段
+            for key in ("rank_date_last", "pick_rank", "surge_value"):
+                row.pop(key, None)
+            picks[week].append(row)
+
+    shards = {}
+    for week, last in weeks:
+        new_entries, surges = report_rows[week]
+        shards[week] = {
+            "week": week,
+            "last": last,
+            "new_entries": new_entries,
+            "surges": surges,
+            "one_per_region": picks[week],
+        }
+    return shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出 SensorTower 周次索引与按周 JSON 分片（含 .gz）")
+    parser.add_argument(
+        "--db",
+        type=Path,
+        default=Path("public/sensortower_top100.db"),
+        help="sensortower_top100.db 路径",
+    )
+    parser.add_argument(
+        "--out",
+        type=Path,
+        default=Path("public/sensortower_shards"),
+        help="分片输出目录",
+    )
+    parser.add_argument("--full", action="store_true", help="忽略已有索引，重新生成全部周次")
+    args = parser.parse_args()
+
+    if not args.db.exists():
+        print(f"错误：数据库不存在 {args.db}")
+        return 1
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    conn = connect_readonly(args.db)
+    try:
+        queries = SensorTowerQueries(conn)
+        known = {} if args.full else load_index(args.out)
+        weeks = queries.week_fingerprints({week: entry.get("fingerprint") for week, entry in known.items()})
+
+        pending = [
+            (week, last)
+            for week, last, fingerprint in weeks
+            if not (
+                week in known
+                and known[week].get("fingerprint") == fingerprint
+                and (args.out / known[week].get("file", "")).is_file()
+            )
+        ]
+        shards = build_shards(queries, pending) if pending else {}
+    finally:
+        conn.close()
+
+    entries = []
+    written = 0
+    keep_files = set()
+    for week, last, fingerprint in weeks:
+        shard = shards.get(week)
+        if shard is None:
+            entry = known[week]
+        else:
+            data = dump_json(shard)
+            name = f"week_{week}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}.json"
+            if not (args.out / name).is_file():
+                write_with_gzip(args.out / name, data)
+                written += 1
+            entry = {
+                "week": week,
+                "last": last,
+                "file": name,
+                "fingerprint": fingerprint,
+                "bytes": len(data),
+                "counts": {
+                    "new_entries": len(shard["new_entries"]),
+                    "surges": len(shard["surges"]),
+                    "one_per_region": len(shard["one_per_region"]),
+                },
+            }
+        keep_files.add(entry["file"])
+        entries.append(entry)
+
+    # 清理已变化或已消失周次的旧分片
+    removed = 0
+    for path in args.out.glob("week_*.json"):
+        if path.name not in keep_files:
+            remove_with_gzip(path)
+            removed += 1
+
+    if pending or removed or len(known) != len(entries):
+        index = {
+            "version": INDEX_VERSION,
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "latest": entries[0]["week"] if entries else None,
+            "weeks": entries,
+        }
+        write_with_gzip(args.out / INDEX_NAME, dump_json(index))
+
+    print(
+        f"共 {len(weeks)} 周：重新生成 {len(pending)} 周，写入 {written} 个分片，"
+        f"删除 {removed} 个旧分片 -> {args.out}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
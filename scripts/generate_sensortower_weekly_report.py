@@ -5,198 +5,147 @@
 重点内容：
   - 本周新进 Top50：当周新进榜单且当前排名 ≤50 的产品，按当前排名排序
   - 本周排名飙升 Top10：当周排名飙升中上升幅度最大的 10 款产品
+    （上升幅度取 rank_changes.surge_value，未迁移的库现场从 change 解析）
+
+默认只以只读方式打开数据库；迁移与建索引由 sensortower_schema.py 负责，
+也可以加 --migrate 在生成前执行同样的迁移（需要写权限）。
 
 输出：Markdown 文件到 public/休闲游戏检测/sensortower_周报/周报_YYYY-MM-DD.md
 （日期为当周榜单日期 rank_date_current）
 
+增量模式（--incremental）：在输出目录维护 .manifest.json，记录每周数据指纹
+（行数、最大 rowid 与修改计数组成的探测值 + 报表所用列及关联 app_metadata 的行内容哈希，
+原地修改、应用名变更也会改变指纹；探测值未变的周不重新计算哈希，见 report_db.week_fingerprints）。
+只有指纹变化或周报文件缺失的周次才会重新查询与写入。
+
+周报先构建为 report_model.Report，再渲染为 Markdown（--html 时同时输出同名 .html 片段）；
+渲染结果按报表数据哈希缓存在 --render-cache 目录（默认 .report_state/render_cache/sensortower_weekly，
+只供本脚本使用），数据未变的周次不再重复渲染。清单记录每周报表的数据哈希，
+每次运行后删除缓存里清单已不再引用的条目，缓存大小与周数成正比。
+
+相对路径（--db、--out、--render-cache）都基于项目根目录，与 send_minigame_weekly_reports.py 一致。
+
+运行指标（见 report_metrics.py）：--metrics-dir 输出每个查询 / 渲染的耗时与行数、字节数，
+--profile 输出 cProfile 与 tracemalloc 快照。
+
 使用方式（在项目根目录）：
   python scripts/generate_sensortower_weekly_report.py
+  python scripts/generate_sensortower_weekly_report.py --incremental
+  python scripts/generate_sensortower_weekly_report.py --incremental --html
+  python scripts/generate_sensortower_weekly_report.py --incremental --migrate
+  python scripts/generate_sensortower_weekly_report.py --incremental --metrics-dir .report_state/metrics --profile
   python scripts/generate_sensortower_weekly_report.py --db public/sensortower_top100.db --out public/休闲游戏检测/sensortower_周报
 """
 
 import argparse
-import re
+import json
 import sqlite3
 from pathlib import Path
 
+import report_metrics
+from report_db import SensorTowerQueries, connect_readonly, format_number, format_revenue
+from report_model import DEFAULT_RENDER_CACHE, Heading, Paragraph, RenderCache, Report, Rule, Table, render, render_markdown
+from sensortower_schema import ensure_schema
 
-def parse_surge_value(change: str) -> int:
-    """从变化字符串解析上升幅度，如 '↑20' -> 20，'↑61' -> 61。无法解析返回 0。"""
-    if not change or change == "NEW":
-        return 0
-    m = re.search(r"↑\s*(\d+)", str(change).strip())
-    return int(m.group(1)) if m else 0
+MANIFEST_NAME = ".manifest.json"
+# 本脚本独占的渲染缓存目录：按清单清理时不会删掉其他脚本的条目
+DEFAULT_WEEKLY_RENDER_CACHE = DEFAULT_RENDER_CACHE / "sensortower_weekly"
 
 
-def format_number(n) -> str:
-    """格式化数字：过万显示为 x.xx万，否则千分位。"""
-    if n is None:
-        return "—"
+def load_manifest(out_dir: Path) -> dict:
+    """读取输出目录下的周报清单；不存在或损坏时返回空清单。"""
+    path = out_dir / MANIFEST_NAME
     try:
-        n = int(n)
-    except (TypeError, ValueError):
-        return str(n)
-    if n >= 10000:
-        return f"{n / 10000:.2f}万"
-    return f"{n:,}"
-
-
-def format_revenue(r) -> str:
-    """收入格式化：美元千分位或万。"""
-    if r is None:
-        return "—"
-    try:
-        r = float(r)
-    except (TypeError, ValueError):
-        return str(r)
-    if r >= 10000:
-        return f"${r / 10000:.2f}万"
-    return f"${r:,.0f}"
-
-
-def get_weeks(cursor) -> list[tuple[str, str]]:
-    """返回 (rank_date_current, rank_date_last) 列表，按当周日期倒序。"""
-    cursor.execute(
-        """
-        SELECT DISTINCT rank_date_current, rank_date_last
-        FROM rank_changes
-        ORDER BY rank_date_current DESC
-        """
-    )
-    return cursor.fetchall()
-
-
-def get_new_entries_top50(cursor, rank_date_current: str) -> list[dict]:
-    """获取当周新进 Top50 列表（新进榜单且 current_rank <= 50），按 current_rank 排序。"""
-    cursor.execute(
-        """
-        SELECT
-            r.current_rank,
-            r.app_id,
-            r.country,
-            r.platform,
-            r.downloads,
-            r.revenue,
-            COALESCE(m.name, r.app_name, r.app_id) AS display_name,
-            COALESCE(NULLIF(TRIM(r.publisher_name), ''), m.publisher_name) AS publisher_name
-        FROM rank_changes r
-        LEFT JOIN app_metadata m ON m.app_id = r.app_id AND m.os = LOWER(r.platform)
-        WHERE r.rank_date_current = ?
-          AND r.change_type = '🆕 新进榜单'
-          AND r.current_rank <= 50
-        ORDER BY r.current_rank ASC, r.country, r.platform
-        """,
-        (rank_date_current,),
-    )
-    rows = cursor.fetchall()
-    return [
-        {
-            "current_rank": r[0],
-            "app_id": r[1],
-            "country": r[2],
-            "platform": r[3],
-            "downloads": r[4],
-            "revenue": r[5],
-            "display_name": r[6] or r[1],
-            "publisher_name": r[7] or "—",
-        }
-        for r in rows
-    ]
-
-
-def get_surge_top10(cursor, rank_date_current: str) -> list[dict]:
-    """获取当周排名飙升 Top10（按上升幅度降序取前 10）。"""
-    cursor.execute(
-        """
-        SELECT
-            r.current_rank,
-            r.last_week_rank,
-            r.change,
-            r.app_id,
-            r.country,
-            r.platform,
-            r.downloads,
-            r.revenue,
-            COALESCE(m.name, r.app_name, r.app_id) AS display_name,
-            COALESCE(NULLIF(TRIM(r.publisher_name), ''), m.publisher_name) AS publisher_name
-        FROM rank_changes r
-        LEFT JOIN app_metadata m ON m.app_id = r.app_id AND m.os = LOWER(r.platform)
-        WHERE r.rank_date_current = ?
-          AND r.change_type = '🚀 排名飙升'
-        ORDER BY r.current_rank ASC
-        """,
-        (rank_date_current,),
-    )
-    rows = cursor.fetchall()
-    # 在 Python 里解析 change 并按上升幅度排序，取前 10
-    with_surge = []
-    for r in rows:
-        change_str = r[2] or ""
-        surge = parse_surge_value(change_str)
-        with_surge.append(
-            {
-                "current_rank": r[0],
-                "last_week_rank": r[1],
-                "change": change_str,
-                "surge_value": surge,
-                "app_id": r[3],
-                "country": r[4],
-                "platform": r[5],
-                "downloads": r[6],
-                "revenue": r[7],
-                "display_name": (r[8] or r[3]),
-                "publisher_name": r[9] or "—",
-            }
-        )
-    with_surge.sort(key=lambda x: (-x["surge_value"], x["current_rank"]))
-    return with_surge[:10]
-
-
-def render_week_md(rank_date_current: str, rank_date_last: str, new_top50: list, surge_top10: list) -> str:
-    """生成单周周报 Markdown 内容。"""
-    lines = [
-        f"# SensorTower 榜单周报（{rank_date_current}）",
-        "",
-        f"**统计周期**：本周榜单日期 {rank_date_current}，对比上周 {rank_date_last}。",
-        "",
-        "---",
-        "",
-        "## 一、本周新进 Top50",
-        "",
-        "当周新进榜单且当前排名在 Top50 内的产品（按当前排名排序）：",
-        "",
-        "| 排名 | 产品名 | 开发者 | 国家/地区 | 平台 | 下载量 | 收入 |",
-        "|------|--------|--------|-----------|------|--------|------|",
-    ]
-    for row in new_top50:
-        lines.append(
-            f"| {row['current_rank']} | {row['display_name']} | {row.get('publisher_name', '—')} | {row['country']} | {row['platform']} | "
-            f"{format_number(row['downloads'])} | {format_revenue(row['revenue'])} |"
-        )
-    if not new_top50:
-        lines.append("| — | 本周无新进 Top50 记录 | — | — | — | — | — |")
-    lines.extend(
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"weeks": {}}
+    if not isinstance(data.get("weeks"), dict):
+        return {"weeks": {}}
+    return data
+
+
+def save_manifest(out_dir: Path, manifest: dict) -> None:
+    """原子写入周报清单（先写临时文件再替换）。"""
+    path = out_dir / MANIFEST_NAME
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+
+
+def sensortower_week_report(
+    rank_date_current: str,
+    rank_date_last: str,
+    new_top50: list,
+    surge_top10: list,
+    title: str = "SensorTower 榜单周报",
+    footer: str | None = None,
+) -> Report:
+    """单周周报的报表结构（新进 Top50 + 排名飙升 Top10）。footer 非空时追加在末尾（推送消息用）。"""
+    heading = f"{title}（{rank_date_current}）"
+    return Report(
+        heading,
         [
-            "",
-            "---",
-            "",
-            "## 二、本周排名飙升 Top10",
-            "",
-            "当周排名飙升中，上升幅度最大的 10 款产品：",
-            "",
-            "| 当前排名 | 上周排名 | 上升幅度 | 产品名 | 开发者 | 国家/地区 | 平台 | 下载量 | 收入 |",
-            "|----------|----------|----------|--------|--------|-----------|------|--------|------|",
-        ]
+            Heading(heading, 1),
+            Paragraph(f"**统计周期**：本周榜单日期 {rank_date_current}，对比上周 {rank_date_last}。"),
+            Rule(),
+            Heading("一、本周新进 Top50"),
+            Paragraph("当周新进榜单且当前排名在 Top50 内的产品（按当前排名排序）："),
+            Table(
+                ["排名", "产品名", "开发者", "国家/地区", "平台", "下载量", "收入"],
+                [
+                    [
+                        row["current_rank"],
+                        row["display_name"],
+                        row.get("publisher_name", "—"),
+                        row["country"],
+                        row["platform"],
+                        format_number(row["downloads"]),
+                        format_revenue(row["revenue"]),
+                    ]
+                    for row in new_top50
+                ],
+                empty_row=["—", "本周无新进 Top50 记录", "—", "—", "—", "—", "—"],
+                dashes=[6, 8, 8, 11, 6, 8, 6],
+            ),
+            Rule(),
+            Heading("二、本周排名飙升 Top10"),
+            Paragraph("当周排名飙升中，上升幅度最大的 10 款产品："),
+            Table(
+                ["当前排名", "上周排名", "上升幅度", "产品名", "开发者", "国家/地区", "平台", "下载量", "收入"],
+                [
+                    [
+                        row["current_rank"],
+                        row["last_week_rank"],
+                        row["change"],
+                        row["display_name"],
+                        row.get("publisher_name", "—"),
+                        row["country"],
+                        row["platform"],
+                        format_number(row["downloads"]),
+                        format_revenue(row["revenue"]),
+                    ]
+                    for row in surge_top10
+                ],
+                empty_row=["—", "—", "—", "本周无排名飙升记录", "—", "—", "—", "—", "—"],
+                dashes=[10, 10, 10, 8, 8, 11, 6, 8, 6],
+            ),
+        ],
+        footer=footer,
+    )
+
+
+def render_week_md(
+    rank_date_current: str,
+    rank_date_last: str,
+    new_top50: list,
+    surge_top10: list,
+    title: str = "SensorTower 榜单周报",
+    footer: str | None = None,
+) -> str:
+    """生成单周周报 Markdown 内容。footer 非空时追加在末尾（推送消息用）。"""
+    return render_markdown(
+        sensortower_week_report(rank_date_current, rank_date_last, new_top50, surge_top10, title, footer)
     )
-    for row in surge_top10:
-        lines.append(
-            f"| {row['current_rank']} | {row['last_week_rank']} | {row['change']} | {row['display_name']} | {row.get('publisher_name', '—')} | "
-            f"{row['country']} | {row['platform']} | {format_number(row['downloads'])} | {format_revenue(row['revenue'])} |"
-        )
-    if not surge_top10:
-        lines.append("| — | — | — | 本周无排名飙升记录 | — | — | — | — | — |")
-    lines.append("")
-    return "\n".join(lines)
 
 
 def main():
@@ -213,32 +162,128 @@ def main():
         default=Path("public/休闲游戏检测/sensortower_周报"),
         help="周报 Markdown 输出目录",
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="增量模式：只重新生成数据指纹有变化（或文件缺失）的周次",
+    )
+    parser.add_argument(
+        "--html",
+        action="store_true",
+        help="同时输出 HTML 片段（周报_YYYY-MM-DD.html）",
+    )
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="生成前先执行 sensortower_schema 的迁移与建索引（默认只读打开数据库）",
+    )
+    parser.add_argument(
+        "--render-cache",
+        type=Path,
+        default=DEFAULT_WEEKLY_RENDER_CACHE,
+        help="渲染结果缓存目录（按报表数据哈希，只供本脚本使用，运行后删除清单不再引用的条目）",
+    )
+    parser.add_argument(
+        "--no-render-cache",
+        action="store_true",
+        help="不读写渲染缓存",
+    )
+    report_metrics.add_arguments(parser)
     args = parser.parse_args()
 
+    with report_metrics.session("generate_sensortower_weekly_report", args.metrics_dir, args.profile):
+        return generate(args)
+
+
+def _write_if_changed(path: Path, text: str) -> bool:
+    if path.exists() and path.read_text(encoding="utf-8") == text:
+        return False
+    path.write_text(text, encoding="utf-8")
+    return True
+
+
+def generate(args) -> int:
+    """按参数生成周报 Markdown，返回退出码。"""
+    repo_root = Path(__file__).resolve().parents[1]
+    args.db, args.out, args.render_cache = (
+        p if p.is_absolute() else repo_root / p for p in (args.db, args.out, args.render_cache)
+    )
     if not args.db.exists():
         print(f"错误：数据库不存在 {args.db}")
         return 1
 
     args.out.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(args.db)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    if args.migrate:
+        # 只有显式 --migrate 时才打开写连接；报表查询本身走只读连接
+        conn = sqlite3.connect(args.db)
+        try:
+            for column, backfilled in ensure_schema(conn).items():
+                if backfilled:
+                    print(f"已回填 rank_changes.{column}：{backfilled} 行")
+            conn.execute("PRAGMA optimize")
+        finally:
+            conn.close()
+
+    manifest = load_manifest(args.out) if args.incremental else {"weeks": {}}
+    known = manifest["weeks"]
 
-    weeks = get_weeks(cur)
+    conn = connect_readonly(args.db)
+    queries = SensorTowerQueries(conn)
+    # 探测值未变的周沿用清单里的指纹，不逐行计算内容哈希
+    weeks = queries.week_fingerprints({week: entry.get("fingerprint") for week, entry in known.items()})
     if not weeks:
         print("未找到任何周次数据（rank_changes 为空或无有效记录）")
         conn.close()
         return 0
 
-    for rank_date_current, rank_date_last in weeks:
-        new_top50 = get_new_entries_top50(cur, rank_date_current)
-        surge_top10 = get_surge_top10(cur, rank_date_current)
-        md = render_week_md(rank_date_current, rank_date_last, new_top50, surge_top10)
+    pending = []
+    for rank_date_current, rank_date_last, fingerprint in weeks:
+        entry = known.get(rank_date_current)
         out_file = args.out / f"周报_{rank_date_current}.md"
-        out_file.write_text(md, encoding="utf-8")
-        print(f"已生成：{out_file}（新进 Top50: {len(new_top50)} 条，排名飙升 Top10: {len(surge_top10)} 条）")
+        if (
+            args.incremental
+            and entry
+            and entry.get("fingerprint") == fingerprint
+            and out_file.exists()
+        ):
+            continue
+        pending.append((rank_date_current, rank_date_last, fingerprint))
+
+    if not pending:
+        print(f"所有周次均为最新，无需重新生成（共 {len(weeks)} 周）")
+        conn.close()
+        return 0
 
+    rows_by_week = queries.weeks_report_rows([w[0] for w in pending])
     conn.close()
+
+    cache = None if args.no_render_cache else RenderCache(args.render_cache)
+    targets = ["markdown", "html"] if args.html else ["markdown"]
+    written = 0
+    for rank_date_current, rank_date_last, fingerprint in pending:
+        new_top50, surge_top10 = rows_by_week[rank_date_current]
+        report = sensortower_week_report(rank_date_current, rank_date_last, new_top50, surge_top10)
+        outputs = render(report, targets, cache)
+        out_file = args.out / f"周报_{rank_date_current}.md"
+        # 内容未变（例如只是指纹变化）时不重写文件，保持 mtime 不变
+        changed = _write_if_changed(out_file, outputs["markdown"])
+        if args.html:
+            changed = _write_if_changed(out_file.with_suffix(".html"), outputs["html"]) or changed
+        if changed:
+            written += 1
+            print(f"已生成：{out_file}（新进 Top50: {len(new_top50)} 条，排名飙升 Top10: {len(surge_top10)} 条）")
+        known[rank_date_current] = {"fingerprint": fingerprint, "file": out_file.name, "data_hash": report.data_hash()}
+
+    if cache is not None and (cache.hits or cache.misses):
+        print(f"渲染缓存：命中 {cache.hits} 周，重新渲染 {cache.misses} 周")
+    if cache is not None:
+        # 只保留库里现有周次在清单中的数据哈希：数据已变化或周次已删除的旧条目不会再命中
+        removed = cache.prune({known[week].get("data_hash") for week, _, _ in weeks if week in known})
+        if removed:
+            print(f"渲染缓存：清理 {removed} 个不再引用的条目")
+
+    save_manifest(args.out, manifest)
+    print(f"本次检查 {len(pending)} 周，写入 {written} 个文件，跳过 {len(weeks) - len(pending)} 周")
     return 0
 
 
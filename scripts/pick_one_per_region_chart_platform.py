@@ -1,105 +1,79 @@
 #!/usr/bin/env python3
 """
-从 sensortower_top100.db 的 rank_changes 表中，取「最近一周」异动数据，
-在每个 (地区, 榜单, 平台) 组合下各取一条游戏（取当前排名最高的一条，即 current_rank 最小）。
+从 sensortower_top100.db 的 rank_changes 表中，取「最近一周」（或指定周次区间 / 全部周次）异动数据，
+在每周每个 (地区, 榜单, 平台) 组合下各取一条游戏（取当前排名最高的一条，即 current_rank 最小）。
 
-输出：打印表格到 stdout，可选输出 CSV。
+也可以泛化为「每分区 TopK」（一条窗口查询完成，见 report_db.SensorTowerQueries.top_k_per_partition）：
+  - --k：每个分区取几条（默认 1），K > 1 时输出多一列分区内名次
+  - --by：分区维度，逗号分隔，可选 country / signal / platform / change_type（默认 country,signal,platform）；
+    传空字符串表示不分区（全局 TopK）
+  - --metric：排序指标 rank（排名最高）/ downloads / revenue / surge（上升幅度），默认 rank
+  - --across-weeks：周次区间作为一个整体比较（默认每周单独取 TopK）
+
+输出：
+  - 默认打印表格到 stdout，可选同时输出 CSV（--csv）
+  - --format csv / jsonl：从游标逐行流式写出（--out 指定文件，否则写 stdout），
+    不把结果整体读入内存，可用于导出全部历史；只有表格模式需要先缓存全部行以计算列宽
 
 使用方式（在项目根目录）：
   python scripts/pick_one_per_region_chart_platform.py
   python scripts/pick_one_per_region_chart_platform.py --db public/sensortower_top100.db
   python scripts/pick_one_per_region_chart_platform.py --csv out.csv
+  python scripts/pick_one_per_region_chart_platform.py --from 2025-01-06 --to 2025-03-31 --format csv --out picks.csv
+  python scripts/pick_one_per_region_chart_platform.py --all-weeks --format jsonl --out picks.jsonl
+  python scripts/pick_one_per_region_chart_platform.py --k 3 --by country
+  python scripts/pick_one_per_region_chart_platform.py --k 3 --by country,change_type --metric downloads \
+      --from 2025-01-06 --to 2025-03-31 --across-weeks
 """
 
 import argparse
 import csv
-import sqlite3
+import json
+import sys
 from pathlib import Path
 
+import report_metrics
+from report_db import DEFAULT_PARTITION, PARTITION_DIMENSIONS, TOP_K_METRICS, SensorTowerQueries, connect_readonly
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="最近一周异动榜单：每个地区每个榜单每个平台取一条游戏（排名最高的一条）"
-    )
-    parser.add_argument(
-        "--db",
-        type=Path,
-        default=Path("public/sensortower_top100.db"),
-        help="sensortower_top100.db 路径",
-    )
-    parser.add_argument(
-        "--csv",
-        type=Path,
-        default=None,
-        help="若指定则同时输出到该 CSV 文件",
-    )
-    args = parser.parse_args()
+HEADERS = ["地区", "榜单", "平台", "当前排名", "上周排名", "变化", "异动类型", "App ID", "游戏名", "下载量", "收入"]
+COL_KEYS = ["country", "signal", "platform", "current_rank", "last_week_rank", "change", "change_type", "app_id", "display_name", "downloads", "revenue"]
 
-    if not args.db.exists():
-        print(f"错误：数据库不存在 {args.db}")
-        return 1
+# 多周导出时在最前面加上周次列
+WEEK_HEADERS = ["当周日期", "上周日期"]
+WEEK_COL_KEYS = ["rank_date_current", "rank_date_last"]
 
-    conn = sqlite3.connect(args.db)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+# K > 1 时在周次列之后加上分区内名次；按上升幅度排序时在最后加上幅度列
+PICK_RANK_HEADER, PICK_RANK_KEY = "名次", "pick_rank"
+SURGE_HEADER, SURGE_KEY = "上升幅度", "surge_value"
 
-    # 最近一周的日期
-    cur.execute("SELECT MAX(rank_date_current) AS dt FROM rank_changes")
-    row = cur.fetchone()
-    if not row or not row["dt"]:
-        print("未找到任何异动数据（rank_changes 为空）")
-        conn.close()
-        return 0
 
-    latest_week = row["dt"]
-    print(f"最近一周榜单日期：{latest_week}\n")
-
-    # 每个 (country, signal, platform) 取 current_rank 最小的一条，并关联 app_metadata 取显示名
-    cur.execute(
-        """
-        WITH latest AS (
-            SELECT * FROM rank_changes WHERE rank_date_current = ?
-        ),
-        ranked AS (
-            SELECT
-                l.*,
-                ROW_NUMBER() OVER (
-                    PARTITION BY l.country, l.signal, l.platform
-                    ORDER BY l.current_rank ASC
-                ) AS rn
-            FROM latest l
-        )
-        SELECT
-            r.country,
-            r.signal,
-            r.platform,
-            r.current_rank,
-            r.last_week_rank,
-            r.change,
-            r.change_type,
-            r.app_id,
-            COALESCE(m.name, r.app_name, r.app_id) AS display_name,
-            r.downloads,
-            r.revenue
-        FROM ranked r
-        LEFT JOIN app_metadata m ON m.app_id = r.app_id AND m.os = LOWER(r.platform)
-        WHERE r.rn = 1
-        ORDER BY r.country, r.signal, r.platform
-        """,
-        (latest_week,),
-    )
-    rows = cur.fetchall()
-    conn.close()
+def parse_partition(value: str) -> tuple[str, ...]:
+    """--by 参数：逗号分隔的维度名；week 由 --across-weeks 控制，不在这里指定。"""
+    dims = tuple(d.strip() for d in value.split(",") if d.strip())
+    choices = [d for d in PARTITION_DIMENSIONS if d != "week"]
+    unknown = [d for d in dims if d not in choices]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知分区维度：{', '.join(unknown)}（可选：{', '.join(choices)}）")
+    return dims
 
-    if not rows:
-        print("该周没有任何异动记录。")
-        return 0
 
-    # 表头
-    headers = ["地区", "榜单", "平台", "当前排名", "上周排名", "变化", "异动类型", "App ID", "游戏名", "下载量", "收入"]
-    col_keys = ["country", "signal", "platform", "current_rank", "last_week_rank", "change", "change_type", "app_id", "display_name", "downloads", "revenue"]
+def output_columns(multi_week: bool, k: int, metric: str) -> tuple[list[str], list[str]]:
+    """按选项确定输出列 (表头, 字段)；默认选项与原先的输出列一致。"""
+    headers, col_keys = list(HEADERS), list(COL_KEYS)
+    if k > 1:
+        headers.insert(0, PICK_RANK_HEADER)
+        col_keys.insert(0, PICK_RANK_KEY)
+    if metric == "surge":
+        headers.append(SURGE_HEADER)
+        col_keys.append(SURGE_KEY)
+    if multi_week:
+        headers, col_keys = WEEK_HEADERS + headers, WEEK_COL_KEYS + col_keys
+    return headers, col_keys
+
 
-    # 打印表格
+@report_metrics.timed_render
+def print_table(rows: list[dict], headers: list[str], col_keys: list[str]) -> None:
+    """打印 ASCII 表格（需要全部行来计算列宽）。"""
     col_widths = [max(len(str(h)), 4) for h in headers]
     for r in rows:
         for i, k in enumerate(col_keys):
@@ -120,16 +94,158 @@ def main():
     for r in rows:
         print(line([r[k] for k in col_keys]))
     print(sep())
-    print(f"共 {len(rows)} 条（每地区每榜单每平台一条）\n")
+
+
+@report_metrics.timed_render
+def write_csv(rows, f, headers: list[str], col_keys: list[str]) -> int:
+    """逐行写 CSV，返回行数。"""
+    w = csv.writer(f)
+    w.writerow(headers)
+    n = 0
+    for r in rows:
+        w.writerow([r[k] for k in col_keys])
+        n += 1
+    return n
+
+
+@report_metrics.timed_render
+def write_jsonl(rows, f, col_keys: list[str]) -> int:
+    """逐行写 JSON Lines，返回行数。"""
+    n = 0
+    for r in rows:
+        f.write(json.dumps({k: r[k] for k in col_keys}, ensure_ascii=False) + "\n")
+        n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="最近一周（或指定周次区间）异动榜单：每个地区每个榜单每个平台取一条游戏（排名最高的一条）；可用 --k / --by / --metric 泛化为每分区 TopK"
+    )
+    parser.add_argument(
+        "--db",
+        type=Path,
+        default=Path("public/sensortower_top100.db"),
+        help="sensortower_top100.db 路径",
+    )
+    parser.add_argument(
+        "--csv",
+        type=Path,
+        default=None,
+        help="若指定则同时输出到该 CSV 文件（表格模式）",
+    )
+    parser.add_argument("--from", dest="week_from", default=None, help="起始周 rank_date_current（含），如 2025-01-06")
+    parser.add_argument("--to", dest="week_to", default=None, help="结束周 rank_date_current（含）")
+    parser.add_argument("--all-weeks", action="store_true", help="导出全部周次")
+    parser.add_argument("--k", type=int, default=1, help="每个分区取几条（默认 1）")
+    parser.add_argument(
+        "--by",
+        dest="partition",
+        type=parse_partition,
+        default=DEFAULT_PARTITION,
+        help="分区维度，逗号分隔：country / signal / platform / change_type（默认 country,signal,platform；空字符串为全局）",
+    )
+    parser.add_argument(
+        "--metric",
+        choices=list(TOP_K_METRICS),
+        default="rank",
+        help="分区内排序指标：rank 排名最高（默认）/ downloads / revenue / surge 上升幅度",
+    )
+    parser.add_argument(
+        "--across-weeks",
+        action="store_true",
+        help="周次区间作为一个整体取 TopK（默认每周单独取）",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["table", "csv", "jsonl"],
+        default="table",
+        help="输出格式：table 打印表格（默认）；csv / jsonl 流式输出",
+    )
+    parser.add_argument("--out", type=Path, default=None, help="csv / jsonl 的输出文件，默认写 stdout")
+    report_metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    with report_metrics.session("pick_one_per_region_chart_platform", args.metrics_dir, args.profile):
+        return pick(args)
+
+
+def describe_pick(args) -> str:
+    """表格末尾的说明，默认选项时为「每地区每榜单每平台一条」。"""
+    names = {"country": "地区", "signal": "榜单", "platform": "平台", "change_type": "异动类型"}
+    metrics = {"rank": "", "downloads": "下载量最高的", "revenue": "收入最高的", "surge": "上升幅度最大的"}
+    scope = "".join(f"每{names[d]}" for d in args.partition) or "全部"
+    count = "一条" if args.k == 1 else f"前 {args.k} 条"
+    return f"{'整个区间' if args.across_weeks else ''}{scope}{metrics[args.metric]}{count}"
+
+
+def pick(args) -> int:
+    """按参数查询并输出，返回退出码。"""
+    if not args.db.exists():
+        print(f"错误：数据库不存在 {args.db}")
+        return 1
+
+    if args.k < 1:
+        print("错误：--k 至少为 1")
+        return 1
+
+    conn = connect_readonly(args.db)
+    queries = SensorTowerQueries(conn)
+    multi_week = args.all_weeks or args.week_from is not None or args.week_to is not None
+    partition = args.partition if args.across_weeks else ("week",) + args.partition
+    headers, col_keys = output_columns(multi_week, args.k, args.metric)
+
+    try:
+        if multi_week:
+            # 一条窗口查询覆盖整个周次区间
+            start, end = args.week_from, args.week_to
+            label = f"周次区间：{start or '最早'} ~ {end or '最新'}"
+        else:
+            # 最近一周的日期
+            latest = queries.latest_week()
+            if not latest:
+                print("未找到任何异动数据（rank_changes 为空）")
+                return 0
+            start = end = latest[0]
+            label = f"最近一周榜单日期：{latest[0]}"
+        rows = queries.top_k_per_partition(args.k, partition, args.metric, start, end)
+
+        if args.format != "table":
+            # 流式输出：行从游标直接写出，不整体缓存
+            if args.out:
+                args.out.parent.mkdir(parents=True, exist_ok=True)
+                f = open(args.out, "w", newline="", encoding="utf-8")
+            else:
+                f = sys.stdout
+            try:
+                if args.format == "csv":
+                    n = write_csv(rows, f, headers, col_keys)
+                else:
+                    n = write_jsonl(rows, f, col_keys)
+            finally:
+                if f is not sys.stdout:
+                    f.close()
+            print(f"{label}，共 {n} 条" + (f"，已写入：{args.out}" if args.out else ""), file=sys.stderr)
+            return 0
+
+        print(f"{label}\n")
+        # 每个分区按指标取前 K 条，并关联 app_metadata 取显示名
+        rows = list(rows)
+    finally:
+        conn.close()
+
+    if not rows:
+        print("该周没有任何异动记录。")
+        return 0
+
+    print_table(rows, headers, col_keys)
+    print(f"共 {len(rows)} 条（{describe_pick(args)}）\n")
 
     # 可选 CSV
     if args.csv:
         args.csv.parent.mkdir(parents=True, exist_ok=True)
         with open(args.csv, "w", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow(headers)
-            for r in rows:
-                w.writerow([r[k] for k in col_keys])
+            write_csv(rows, f, headers, col_keys)
         print(f"已写入 CSV：{args.csv}")
 
     return 0
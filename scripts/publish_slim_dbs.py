@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+为前端（sql.js）发布瘦身版数据库：只保留页面会查询的表和列，按页面查询的顺序连续存放，便于 HTTP Range 按页读取。
+
+前端原先整库下载 videos.db / competitor_data.db / sensortower_top100.db，其中大部分字节是页面从不读取的列
+（video_urls、original_video_url、gdrive_*、local_path、posts_json 等）。本脚本为每个使用方生成一份瘦身副本：
+  - 只建 CONSUMERS 里列出的表和列（列类型沿用源库），其余表、列、视图、触发器都不带
+  - 行按页面查询的 ORDER BY 顺序写入（rowid 即页面读取顺序），全表顺序扫描时读到的页是连续的
+  - 只建页面查询需要的索引（如 games 按 game_name 查玩法）；表按页面加载顺序依次写入，
+    VACUUM INTO 后每张表的 B-tree 页连续存放，索引页在所有表之后
+  - page_size 默认 4096（--page-size 可调；Range 虚拟文件系统按页取数，页越小单次读取越少、请求越多），
+    journal_mode 为 DELETE（非 WAL，只读的 Range 虚拟文件系统只能打开单文件数据库）
+  - 写完后在瘦身库与源库上分别执行页面的查询，结果不一致则报错退出
+
+输出（默认 public/slim/）：<源库同名>.db 与 manifest.json（每个库的源文件指纹、字节数、页大小、各表行数）。
+源库大小与修改时间未变时跳过，--force 强制重建。前端加载路径的切换另行处理。
+
+使用方式（在项目根目录）：
+  python scripts/publish_slim_dbs.py
+  python scripts/publish_slim_dbs.py --only videos --page-size 1024
+  python scripts/publish_slim_dbs.py --out public/slim --force
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote
+
+from report_db import connect_readonly
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_PAGE_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class SlimTable:
+    name: str
+    columns: tuple[str, ...]
+    # 写入顺序，与页面查询的 ORDER BY 一致
+    order_by: str
+    indexes: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class Consumer:
+    name: str
+    source: Path
+    # 按页面加载顺序排列，先加载的表在文件前部
+    tables: tuple[SlimTable, ...]
+    # 用于核对瘦身库的页面查询（与 src/data 下各 loader 的 SQL 一致）
+    checks: tuple[str, ...] = field(default_factory=tuple)
+
+
+CONSUMERS = (
+    Consumer(
+        "videos",
+        Path("public/videos.db"),
+        (
+            # reportsLoader.ts：周报简要（微信 / 抖音）
+            SlimTable(
+                "weekly_report_simple",
+                ("week_range", "platform", "game_name", "change_type", "rank", "rank_change"),
+                "week_range DESC, platform, change_type, CAST(rank AS INTEGER)",
+            ),
+            # reportsLoader.ts：按游戏名查玩法解析
+            SlimTable(
+                "games",
+                ("game_name", "gameplay_analysis"),
+                "game_name",
+                ("CREATE INDEX idx_games_game_name ON games(game_name)",),
+            ),
+        ),
+        (
+            "SELECT week_range, platform, game_name, change_type, rank, rank_change FROM weekly_report_simple "
+            "WHERE platform IN ('wx','dy') ORDER BY week_range DESC, platform, change_type, CAST(rank AS INTEGER)",
+            "SELECT game_name, gameplay_analysis FROM games ORDER BY game_name",
+        ),
+    ),
+    Consumer(
+        "competitor_data",
+        Path("public/competitor_data.db"),
+        (
+            # weeklyReportLoader.ts：竞品周报（页面不读取各公司的 posts_json 原始抓取数据）
+            SlimTable(
+                "weekly_reports",
+                ("id", "company_name", "start_date", "end_date", "report_content", "created_at"),
+                "start_date DESC, company_name ASC",
+            ),
+        ),
+        (
+            "SELECT id, company_name, start_date, end_date, report_content, created_at FROM weekly_reports "
+            "ORDER BY start_date DESC, company_name ASC",
+        ),
+    ),
+    Consumer(
+        "sensortower_top100",
+        Path("public/sensortower_top100.db"),
+        (
+            # sensortowerTopLoader.ts：先读 app_metadata 建名称映射，再读榜单与异动
+            SlimTable("app_metadata", ("app_id", "os", "name", "publisher_name", "release_date"), "app_id, os"),
+            SlimTable(
+                "rank_changes",
+                (
+                    "rank_date_current",
+                    "rank_date_last",
+                    "signal",
+                    "app_name",
+                    "app_id",
+                    "country",
+                    "platform",
+                    "current_rank",
+                    "last_week_rank",
+                    "change",
+                    "change_type",
+                    "downloads",
+                    "revenue",
+                    "publisher_name",
+                ),
+                "rank_date_current DESC, country, platform, current_rank ASC",
+            ),
+            SlimTable(
+                "apple_top100",
+                ("rank_date", "country", "chart_type", "rank", "app_id"),
+                "rank_date DESC, country, chart_type, rank ASC",
+            ),
+            SlimTable(
+                "android_top100",
+                ("rank_date", "country", "chart_type", "rank", "app_id"),
+                "rank_date DESC, country, chart_type, rank ASC",
+            ),
+        ),
+        (
+            "SELECT app_id, os, name, publisher_name, release_date FROM app_metadata ORDER BY app_id, os",
+            'SELECT rank_date_current, rank_date_last, signal, app_name, app_id, country, platform, current_rank, '
+            'last_week_rank, "change", change_type, downloads, revenue, publisher_name FROM rank_changes '
+            "ORDER BY rank_date_current DESC, country, platform, current_rank ASC",
+        ),
+    ),
+)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _column_types(conn: sqlite3.Connection, schema: str, table: str) -> dict[str, str]:
+    """{列名: 声明类型}；表不存在时为空。"""
+    return {row[1]: row[2] for row in conn.execute(f"PRAGMA {schema}.table_info({_quote(table)})")}
+
+
+def build_slim(consumer: Consumer, source: Path, target: Path, page_size: int) -> dict[str, int]:
+    """在内存库里按瘦身结构重建，再 VACUUM INTO 目标文件；返回各表行数。缺失的表跳过。"""
+    mem = sqlite3.connect(":memory:", uri=True)
+    try:
+        # page_size 必须在建第一张表之前设置，VACUUM INTO 沿用内存库的页大小
+        mem.execute(f"PRAGMA page_size = {int(page_size)}")
+        mem.execute("ATTACH DATABASE ? AS src", (f"file:{quote(str(source.resolve()))}?mode=ro",))
+        counts = {}
+        with mem:
+            for table in consumer.tables:
+                types = _column_types(mem, "src", table.name)
+                if not types:
+                    print(f"[{consumer.name}] 源库没有表 {table.name}，已跳过", file=sys.stderr)
+                    continue
+                missing = [c for c in table.columns if c not in types]
+                if missing:
+                    raise ValueError(f"{source.name} 的 {table.name} 缺少列：{', '.join(missing)}")
+                cols = ", ".join(_quote(c) for c in table.columns)
+                defs = ", ".join(f"{_quote(c)} {types[c]}".rstrip() for c in table.columns)
+                mem.execute(f"CREATE TABLE main.{_quote(table.name)} ({defs})")
+                cur = mem.execute(
+                    f"INSERT INTO main.{_quote(table.name)} ({cols}) "
+                    f"SELECT {cols} FROM src.{_quote(table.name)} ORDER BY {table.order_by}"
+                )
+                counts[table.name] = cur.rowcount
+            # 索引在全部表写完之后建，VACUUM INTO 时排在表数据之后
+            for table in consumer.tables:
+                if table.name in counts:
+                    for sql in table.indexes:
+                        mem.execute(sql)
+        mem.execute("DETACH DATABASE src")
+        mem.execute("ANALYZE")
+
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.unlink(missing_ok=True)
+        mem.execute("VACUUM INTO ?", (str(tmp),))
+    finally:
+        mem.close()
+    out = sqlite3.connect(tmp)
+    try:
+        out.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        out.close()
+    tmp.replace(target)
+    return counts
+
+
+def verify(consumer: Consumer, source: Path, target: Path) -> list[str]:
+    """在源库与瘦身库上执行页面查询，返回结果行不一致的查询（源库缺表的查询忽略）。
+
+    ORDER BY 相同键的行先后顺序不保证一致，只比较结果行的多重集合。
+    """
+    failures = []
+    src = connect_readonly(source)
+    slim = connect_readonly(target)
+    try:
+        for sql in consumer.checks:
+            try:
+                expected = src.execute(sql).fetchall()
+            except sqlite3.OperationalError:
+                continue
+            try:
+                actual = slim.execute(sql).fetchall()
+            except sqlite3.OperationalError as e:
+                failures.append(f"{sql}（{e}）")
+                continue
+            if sorted(actual, key=repr) != sorted(expected, key=repr):
+                failures.append(sql)
+    finally:
+        src.close()
+        slim.close()
+    return failures
+
+
+def _fingerprint(path: Path) -> dict:
+    st = path.stat()
+    return {"bytes": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def load_manifest(out_dir: Path) -> dict:
+    try:
+        data = json.loads((out_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return data.get("databases", {}) if isinstance(data, dict) else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为前端发布只含页面所需表、列与索引的瘦身数据库")
+    parser.add_argument("--out", type=Path, default=Path("public/slim"), help="输出目录")
+    parser.add_argument(
+        "--only",
+        default=None,
+        help=f"只发布部分数据库，逗号分隔（可选：{', '.join(c.name for c in CONSUMERS)}）",
+    )
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="瘦身库的 page_size（512~65536 的 2 的幂）")
+    parser.add_argument("--videos-db", type=Path, default=None, help="videos.db 路径（默认 public/videos.db）")
+    parser.add_argument(
+        "--competitor-db", type=Path, default=None, help="competitor_data.db 路径（默认 public/competitor_data.db）"
+    )
+    parser.add_argument(
+        "--sensortower-db", type=Path, default=None, help="sensortower_top100.db 路径（默认 public/sensortower_top100.db）"
+    )
+    parser.add_argument("--force", action="store_true", help="源库未变化时也重新生成")
+    args = parser.parse_args()
+
+    if args.page_size < 512 or args.page_size > 65536 or args.page_size & (args.page_size - 1):
+        print("错误：--page-size 须为 512~65536 之间 2 的幂")
+        return 1
+    consumers = list(CONSUMERS)
+    if args.only:
+        names = [n.strip() for n in args.only.split(",") if n.strip()]
+        unknown = [n for n in names if n not in {c.name for c in CONSUMERS}]
+        if unknown:
+            print(f"错误：未知数据库 {', '.join(unknown)}")
+            return 1
+        consumers = [c for c in CONSUMERS if c.name in names]
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(args.out)
+    failed = False
+    overrides = {"videos": args.videos_db, "competitor_data": args.competitor_db, "sensortower_top100": args.sensortower_db}
+    for consumer in consumers:
+        source = overrides.get(consumer.name) or consumer.source
+        if not source.exists():
+            print(f"[跳过] {source.name} 不存在: {source}", file=sys.stderr)
+            continue
+        target = args.out / consumer.source.name
+        fingerprint = _fingerprint(source)
+        entry = manifest.get(consumer.name, {})
+        if (
+            not args.force
+            and target.exists()
+            and entry.get("source") == fingerprint
+            and entry.get("page_size") == args.page_size
+        ):
+            print(f"[{consumer.name}] 源库未变化，跳过")
+            continue
+        try:
+            counts = build_slim(consumer, source, target, args.page_size)
+        except (ValueError, sqlite3.Error) as e:
+            print(f"[{consumer.name}] 生成失败：{e}", file=sys.stderr)
+            failed = True
+            continue
+        failures = verify(consumer, source, target)
+        if failures:
+            for sql in failures:
+                print(f"[{consumer.name}] 查询结果与源库不一致：{sql}", file=sys.stderr)
+            failed = True
+            continue
+        size = target.stat().st_size
+        manifest[consumer.name] = {
+            "file": target.name,
+            "source": fingerprint,
+            "bytes": size,
+            "page_size": args.page_size,
+            "tables": counts,
+        }
+        print(
+            f"[{consumer.name}] {source.stat().st_size / 1024:.0f} KB -> {size / 1024:.0f} KB "
+            f"（{', '.join(f'{t} {n} 行' for t, n in counts.items())}）"
+        )
+
+    (args.out / MANIFEST_NAME).write_text(
+        json.dumps(
+            {"generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"), "databases": manifest},
+            ensure_ascii=False,
+            indent=2,
+        )
+        + "\n",
+        encoding="utf-8",
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+报表常驻进程：数据源有变化时才重新生成并推送。
+
+原先每个报表都是一次冷启动的 cron 调用，无论 videos.db / sensortower_top100.db 是否更新，
+都要重新导入、重连、重算。本脚本常驻运行：
+  - 每个数据源保持一个热的只读连接（report_db.connect_readonly），只用于检测变化
+  - 按 --interval 轮询，廉价地检测变化：文件 mtime / size（含 -wal）、inode 变化（整文件替换时重连），
+    以及热连接上的 PRAGMA data_version（其他连接提交后会变化）
+  - 变化后再等一个轮询周期、版本不再变化才算稳定（避免在写入中途构建），只重跑输入有变化的报表构建器
+  - 构建结果与上次相同则跳过；不同则放入进程内唯一的发送队列，由一个发送线程写入发件箱并投递
+    （report_outbox：幂等键含内容哈希，同一内容不会重复发送）
+  - --delta：只推送与上次成功推送的版本相比的变化（见 report_delta.py），适合高频轮询
+
+报表构建器：
+  - minigame_weekly：微信/抖音 + SensorTower 周报（输入 videos.db、sensortower_top100.db），
+    与 send_minigame_weekly_reports.py 走同一条路径：report_sources 注册表并行构建、各自超时（--source-timeout），
+    合并为 report_model.Report 后按数据哈希读写渲染缓存（--render-cache）
+  - ai_competitor_digest：AI 竞品简报 Markdown 文件（输入该文件）
+
+运行指标（见 report_metrics.py）：--metrics-dir / --profile 时每一轮构建记录一次（查询、渲染、数据源耗时）。
+
+环境变量同 send_minigame_weekly_reports.py（FEISHU_WEBHOOK_URL、WECOM_WEBHOOK_URL_REAL）。
+
+使用方式（在项目根目录）：
+  python scripts/report_daemon.py
+  python scripts/report_daemon.py --interval 5 --dry-run
+  python scripts/report_daemon.py --once
+"""
+
+import argparse
+import functools
+import os
+import queue
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Callable
+
+import report_delta
+import report_metrics
+from report_db import connect_readonly
+from report_model import DEFAULT_RENDER_CACHE, RenderCache, render
+from report_outbox import DEFAULT_OUTBOX, enqueue, flush, open_outbox
+from send_ai_competitor_digest import card_title, read_report
+from send_minigame_weekly_reports import (
+    _clean_url,
+    _load_env,
+    build_minigame_report,
+    feishu_channel,
+    wecom_channel,
+)
+
+DEFAULT_INTERVAL = 10.0
+
+
+def _stat_key(path: Path) -> tuple | None:
+    """文件（及 SQLite -wal）的 (inode, mtime_ns, size)；文件不存在返回 None。"""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    wal = path.with_name(path.name + "-wal")
+    try:
+        wst = wal.stat()
+        key += (wst.st_mtime_ns, wst.st_size)
+    except OSError:
+        pass
+    return key
+
+
+class WatchedSource:
+    """一个被监视的输入：普通文件只看 mtime / size；SQLite 库另外保持热连接并检查 data_version。"""
+
+    def __init__(self, name: str, path: Path, is_db: bool = True):
+        self.name = name
+        self.path = path
+        self.is_db = is_db
+        self.conn: sqlite3.Connection | None = None
+        self._inode = None
+        self._version: tuple | None = None
+
+    def _data_version(self) -> int | None:
+        if not self.is_db or self.conn is None:
+            return None
+        try:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    def _ensure_conn(self, stat_key: tuple | None) -> None:
+        """库文件出现、消失或被整体替换（inode 变化）时重开连接。"""
+        if not self.is_db:
+            return
+        inode = stat_key[0] if stat_key else None
+        if inode == self._inode and (self.conn is not None or inode is None):
+            return
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self._inode = inode
+        if inode is not None:
+            try:
+                self.conn = connect_readonly(self.path)
+            except sqlite3.Error as e:
+                print(f"[{self.name}] 打开失败：{e}", file=sys.stderr)
+
+    def version(self) -> tuple:
+        """当前版本标识：文件状态 + data_version，任一变化即视为有更新。"""
+        stat_key = _stat_key(self.path)
+        self._ensure_conn(stat_key)
+        return (stat_key, self._data_version())
+
+    def poll(self) -> bool:
+        """与上次记录的版本相比是否变化（首次调用视为变化）。"""
+        current = self.version()
+        changed = current != self._version
+        self._version = current
+        return changed
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# (报表类型, 周期, 卡片标题, Markdown)
+Report = tuple[str, str, str, str]
+
+
+@dataclass
+class Builder:
+    """报表构建器：inputs 中任一数据源变化时重跑 build，产出要推送的报表。"""
+
+    name: str
+    inputs: tuple[str, ...]
+    build: Callable[[dict[str, WatchedSource]], list[Report]]
+    last_output: list[Report] = field(default_factory=list)
+
+
+def build_minigame_weekly(
+    sources: dict[str, WatchedSource],
+    cache: RenderCache | None = None,
+    timeout: float | None = None,
+) -> list[Report]:
+    """与 send_minigame_weekly_reports.py 相同：注册表里的默认数据源并行构建后合并，再经渲染缓存渲染为 Markdown。"""
+    report = build_minigame_report({name: source.path for name, source in sources.items()}, timeout=timeout)
+    if report is None:
+        return []
+    period = "{0}-W{1:02d}".format(*date.today().isocalendar())
+    return [("minigame_weekly", period, report.title, render(report, ["markdown"], cache)["markdown"])]
+
+
+def build_ai_competitor_digest(sources: dict[str, WatchedSource]) -> list[Report]:
+    path = sources["ai_digest"].path
+    if not path.exists():
+        return []
+    text = read_report(path)
+    return [("ai_competitor_digest", date.today().isoformat(), card_title(text), text)]
+
+
+class SendQueue:
+    """进程内唯一的发送队列：一个后台线程依次把报表写入发件箱并投递。"""
+
+    def __init__(
+        self,
+        outbox_path: Path,
+        feishu: str | None,
+        wecom: str | None,
+        dry_run: bool = False,
+        delta_max_ratio: float | None = None,
+    ):
+        self.outbox_path = outbox_path
+        self.feishu = feishu
+        self.wecom = wecom
+        self.dry_run = dry_run
+        # 非 None 时开启增量推送（见 report_delta），为回退全文的变化行占比阈值
+        self.delta_max_ratio = delta_max_ratio
+        self._queue: queue.Queue[Report | None] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="report-sender", daemon=True)
+        self._thread.start()
+
+    def put(self, report: Report) -> None:
+        self._queue.put(report)
+
+    def close(self) -> None:
+        """处理完已入队的报表后退出发送线程。"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        outbox = None if self.dry_run else open_outbox(self.outbox_path)
+        try:
+            while True:
+                report = self._queue.get()
+                if report is None:
+                    return
+                report_type, period, title, md = report
+                if self.dry_run:
+                    print(f"=== [dry-run] {report_type} {period}：{title} ===\n{md}\n")
+                    continue
+                try:
+                    message = md
+                    if self.delta_max_ratio is not None:
+                        mode, message = report_delta.choose_message(
+                            outbox, report_type, title, md, self.delta_max_ratio
+                        )
+                        if mode == "unchanged":
+                            print(f"[{report_type}] 与上次推送的版本一致，跳过")
+                            continue
+                        if mode == "delta":
+                            title = f"{title}（更新）"
+                    if self.feishu:
+                        enqueue(outbox, report_type, period, feishu_channel(self.feishu, title, message))
+                    if self.wecom:
+                        enqueue(outbox, report_type, period, wecom_channel(self.wecom, message))
+                    sent, failed = flush(outbox, reports=[(report_type, period)])
+                    report_delta.record_delivered(outbox, report_type, period, md)
+                    print(f"[{report_type}] 投递：成功 {sent} 条，失败 {failed} 条")
+                except Exception as e:  # noqa: BLE001
+                    # 未投递成功的消息留在发件箱，下一次 flush 时补发
+                    print(f"[{report_type}] 投递异常：{e}", file=sys.stderr)
+        finally:
+            if outbox is not None:
+                outbox.close()
+
+
+class ReportDaemon:
+    def __init__(
+        self,
+        sources: dict[str, WatchedSource],
+        builders: list[Builder],
+        sender: SendQueue,
+        metrics_dir: Path | None = None,
+        profile_dir: Path | None = None,
+    ):
+        self.sources = sources
+        self.builders = builders
+        self.sender = sender
+        # 每一轮构建是一次指标会话（见 report_metrics.session）
+        self.metrics_dir = metrics_dir
+        self.profile_dir = profile_dir
+        self._stop = threading.Event()
+        self._pending: set[str] = set()
+
+    def stop(self, *_args) -> None:
+        self._stop.set()
+
+    def run_builders(self, changed: set[str]) -> None:
+        with report_metrics.session("report_daemon", self.metrics_dir, self.profile_dir):
+            self._run_builders(changed)
+
+    def _run_builders(self, changed: set[str]) -> None:
+        for builder in self.builders:
+            if not changed.intersection(builder.inputs):
+                continue
+            start = time.perf_counter()
+            try:
+                output = builder.build(self.sources)
+            except Exception as e:  # noqa: BLE001
+                print(f"[{builder.name}] 构建失败：{e}", file=sys.stderr)
+                continue
+            elapsed = time.perf_counter() - start
+            if output == builder.last_output:
+                print(f"[{builder.name}] 内容未变化，跳过（{elapsed:.2f}s）")
+                continue
+            builder.last_output = output
+            print(f"[{builder.name}] 已重新生成 {len(output)} 份报表（{elapsed:.2f}s），加入发送队列")
+            for report in output:
+                self.sender.put(report)
+
+    def poll_changes(self) -> set[str]:
+        """返回已稳定的更新：上一轮检测到变化、本轮版本不再变化的数据源（避免在写入中途构建）。"""
+        changed = {name for name, source in self.sources.items() if source.poll()}
+        ready = self._pending - changed
+        self._pending = changed
+        return ready
+
+    def run(self, interval: float, once: bool = False) -> None:
+        # 启动时全部构建一次（与上次进程的推送去重由发件箱幂等键保证）
+        for source in self.sources.values():
+            source.poll()
+        self.run_builders(set(self.sources))
+        while not once and not self._stop.wait(interval):
+            changed = self.poll_changes()
+            if changed:
+                print(f"检测到数据更新：{', '.join(sorted(changed))}")
+                self.run_builders(changed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="报表常驻进程：数据库/报告文件变化时才重新生成并推送")
+    parser.add_argument("--videos-db", type=Path, default=Path("public/videos.db"), help="videos.db 路径")
+    parser.add_argument(
+        "--sensortower-db",
+        type=Path,
+        default=Path("public/sensortower_top100.db"),
+        help="sensortower_top100.db 路径",
+    )
+    parser.add_argument(
+        "--ai-digest",
+        type=Path,
+        default=Path("public/ai产品/竞品动态报告_AI产品.md"),
+        help="AI 竞品简报 Markdown 文件",
+    )
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="轮询间隔（秒）")
+    parser.add_argument("--once", action="store_true", help="只构建并推送一次后退出")
+    parser.add_argument("--dry-run", action="store_true", help="只打印构建结果，不发送")
+    parser.add_argument(
+        "--outbox",
+        type=Path,
+        default=DEFAULT_OUTBOX,
+        help="发件箱 SQLite 路径（记录每条消息的投递状态）",
+    )
+    parser.add_argument(
+        "--source-timeout",
+        type=float,
+        default=None,
+        help="每个数据源的构建超时（秒），默认用各数据源自己的超时（60s）",
+    )
+    parser.add_argument(
+        "--render-cache",
+        type=Path,
+        default=DEFAULT_RENDER_CACHE,
+        help="渲染结果缓存目录（按报表数据哈希），相对路径基于项目根目录",
+    )
+    parser.add_argument(
+        "--no-render-cache",
+        action="store_true",
+        help="不读写渲染缓存",
+    )
+    report_delta.add_arguments(parser)
+    report_metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    repo_root = Path(__file__).resolve().parents[1]
+    _load_env(repo_root)
+
+    def resolve(p: Path) -> Path:
+        return p if p.is_absolute() else repo_root / p
+
+    feishu = _clean_url(os.environ.get("FEISHU_WEBHOOK_URL"))
+    wecom = _clean_url(os.environ.get("WECOM_WEBHOOK_URL_REAL")) or _clean_url(os.environ.get("WECOM_WEBHOOK_URL"))
+    if not args.dry_run and not feishu and not wecom:
+        print(
+            "未配置 Webhook。请在 .env 中设置 FEISHU_WEBHOOK_URL 或 WECOM_WEBHOOK_URL_REAL（或 WECOM_WEBHOOK_URL）",
+            file=sys.stderr,
+        )
+        return 1
+
+    sources = {
+        "videos": WatchedSource("videos", resolve(args.videos_db)),
+        "sensortower": WatchedSource("sensortower", resolve(args.sensortower_db)),
+        "ai_digest": WatchedSource("ai_digest", resolve(args.ai_digest), is_db=False),
+    }
+    cache = None if args.no_render_cache else RenderCache(resolve(args.render_cache))
+    builders = [
+        Builder(
+            "minigame_weekly",
+            ("videos", "sensortower"),
+            functools.partial(build_minigame_weekly, cache=cache, timeout=args.source_timeout),
+        ),
+        Builder("ai_competitor_digest", ("ai_digest",), build_ai_competitor_digest),
+    ]
+    sender = SendQueue(
+        resolve(args.outbox),
+        feishu,
+        wecom,
+        dry_run=args.dry_run,
+        delta_max_ratio=args.delta_max_ratio if args.delta else None,
+    )
+    daemon = ReportDaemon(sources, builders, sender, args.metrics_dir, args.profile)
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+
+    print(f"报表常驻进程已启动（轮询间隔 {args.interval}s）" if not args.once else "构建一次后退出")
+    try:
+        daemon.run(args.interval, once=args.once)
+    finally:
+        sender.close()
+        for source in sources.values():
+            source.close()
+    print("报表常驻进程已退出")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
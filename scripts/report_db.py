@@ -0,0 +1,391 @@
+"""
+报表脚本共用的只读数据访问层。
+
+  - connect_readonly：以 URI 只读方式（mode=ro，可选 immutable=1）打开 SQLite，
+    并统一设置 mmap_size / cache_size / query_only 等读优化 PRAGMA
+  - SensorTowerQueries：rank_changes 相关的全部报表查询（周次、新进、飙升、每分区 TopK；每分区一条即 K = 1），
+    SQL 在构造时按库结构（是否已迁移 surge_value / platform_os）生成一次，之后复用
+  - format_number / format_revenue：报表里的数字、收入格式化
+
+generate_sensortower_weekly_report.py、send_minigame_weekly_reports.py、
+pick_one_per_region_chart_platform.py 都通过本模块读库，不再各自复制查询。
+"""
+
+import hashlib
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+from urllib.parse import quote
+
+from report_metrics import timed_query
+from sensortower_schema import CHANGE_COUNTER_TABLE, has_table, platform_os_sql, surge_value_sql
+
+# 读优化参数：mmap 256MB，页缓存 64MB（cache_size 取负数表示 KiB）
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_SIZE_KIB = 64 * 1024
+
+CHANGE_TYPE_NEW = "🆕 新进榜单"
+CHANGE_TYPE_SURGE = "🚀 排名飙升"
+
+# 每分区 TopK 可用的分区维度：名称 -> rank_changes 列（rc 为窗口查询里的表别名）
+PARTITION_DIMENSIONS = {
+    "week": "rc.rank_date_current",
+    "country": "rc.country",
+    "signal": "rc.signal",
+    "platform": "rc.platform",
+    "change_type": "rc.change_type",
+}
+DEFAULT_PARTITION = ("country", "signal", "platform")
+# 每周每个 (地区, 榜单, 平台) 取排名最高的一条：top_k_per_partition(1, ONE_PER_PARTITION_WEEKLY)，供分片导出等使用
+ONE_PER_PARTITION_WEEKLY = ("week",) + DEFAULT_PARTITION
+# 排序指标：名称 -> 窗口内 ORDER BY（{surge} 为上升幅度表达式）；同值时排名高者优先
+TOP_K_METRICS = {
+    "rank": "rc.current_rank ASC",
+    "downloads": "rc.downloads DESC, rc.current_rank ASC",
+    "revenue": "rc.revenue DESC, rc.current_rank ASC",
+    "surge": "{surge} DESC, rc.current_rank ASC",
+}
+
+
+def connect_readonly(
+    path: Path,
+    immutable: bool = False,
+    mmap_size: int = DEFAULT_MMAP_SIZE,
+    cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB,
+) -> sqlite3.Connection:
+    """以只读方式打开数据库并应用读优化 PRAGMA。
+
+    immutable=True 时 SQLite 不再加锁、不检查其他进程的修改，仅适用于运行期间不会被写入的文件。
+    """
+    uri = f"file:{quote(str(Path(path).resolve()))}?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+    conn = sqlite3.connect(uri, uri=True)
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    conn.execute(f"PRAGMA cache_size = -{int(cache_size_kib)}")
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def format_number(n) -> str:
+    """格式化数字：过万显示为 x.xx万，否则千分位。"""
+    if n is None:
+        return "—"
+    try:
+        n = int(n)
+    except (TypeError, ValueError):
+        return str(n)
+    if n >= 10000:
+        return f"{n / 10000:.2f}万"
+    return f"{n:,}"
+
+
+def format_revenue(r) -> str:
+    """收入格式化：美元千分位或万。"""
+    if r is None:
+        return "—"
+    try:
+        r = float(r)
+    except (TypeError, ValueError):
+        return str(r)
+    if r >= 10000:
+        return f"${r / 10000:.2f}万"
+    return f"${r:,.0f}"
+
+
+class SensorTowerQueries:
+    """sensortower_top100.db 的报表查询。
+
+    构造时根据库结构生成 SQL（已迁移则走 surge_value / platform_os 列与索引，
+    否则现场解析），同一连接上的后续调用复用同一批 SQL 文本，从而命中 sqlite3 默认的语句缓存（128 条，远多于本类的查询数）。
+    """
+
+    LATEST_WEEK_SQL = """
+        SELECT rank_date_current, MAX(rank_date_last)
+        FROM rank_changes
+        WHERE rank_date_current = (SELECT MAX(rank_date_current) FROM rank_changes)
+        GROUP BY rank_date_current
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        surge = surge_value_sql(conn)
+        platform_os = platform_os_sql(conn)
+        join_meta = f"LEFT JOIN app_metadata m ON m.app_id = r.app_id AND m.os = {platform_os}"
+        self._join_meta = join_meta
+        # 每分区 TopK 的 SQL 按 (分区维度, 排序指标) 生成一次后缓存，相同选项复用同一 SQL 文本
+        self._top_k_sql: dict[tuple[tuple[str, ...], str], str] = {}
+
+        # 当周新进：参数 (rank_date_current, max_rank)
+        self.new_entries_sql = f"""
+            SELECT
+                r.current_rank,
+                r.last_week_rank,
+                r.change,
+                r.app_id,
+                r.country,
+                r.platform,
+                r.downloads,
+                r.revenue,
+                COALESCE(m.name, r.app_name, r.app_id) AS display_name,
+                COALESCE(NULLIF(TRIM(r.publisher_name), ''), m.publisher_name) AS publisher_name
+            FROM rank_changes r
+            {join_meta}
+            WHERE r.rank_date_current = ?
+              AND r.change_type = '{CHANGE_TYPE_NEW}'
+              AND r.current_rank <= ?
+            ORDER BY r.current_rank ASC, r.country, r.platform
+        """
+
+        # 当周飙升 TopN：参数 (rank_date_current, limit)
+        self.surge_top_sql = f"""
+            SELECT
+                r.current_rank,
+                r.last_week_rank,
+                r.change,
+                r.app_id,
+                r.country,
+                r.platform,
+                r.downloads,
+                r.revenue,
+                COALESCE(m.name, r.app_name, r.app_id) AS display_name,
+                COALESCE(NULLIF(TRIM(r.publisher_name), ''), m.publisher_name) AS publisher_name,
+                {surge} AS surge_value
+            FROM rank_changes r
+            {join_meta}
+            WHERE r.rank_date_current = ?
+              AND r.change_type = '{CHANGE_TYPE_SURGE}'
+            ORDER BY surge_value DESC, r.current_rank ASC
+            LIMIT ?
+        """
+
+        # 周次探测：每周行数与最大 rowid，只读 (rank_date_current, rank_date_last) 索引
+        self.week_probe_sql = """
+            SELECT rank_date_current, MAX(rank_date_last), COUNT(*), MAX(rowid)
+            FROM rank_changes
+            WHERE rank_date_current IS NOT NULL
+            GROUP BY rank_date_current
+        """
+
+        # 单周行内容：报表用到的列及关联的 app_metadata 名称 / 发行商（在 Python 里累加行哈希）；参数 (rank_date_current,)
+        self.week_rows_sql = f"""
+            SELECT
+                r.rank_date_current,
+                r.rank_date_last,
+                r.country,
+                r.signal,
+                r.platform,
+                r.app_id,
+                r.app_name,
+                r.publisher_name,
+                r.current_rank,
+                r.last_week_rank,
+                r.change,
+                r.change_type,
+                r.downloads,
+                r.revenue,
+                m.name,
+                m.publisher_name
+            FROM rank_changes r
+            {join_meta}
+            WHERE r.rank_date_current = ?
+        """
+
+    def top_k_sql(self, partition=DEFAULT_PARTITION, metric: str = "rank") -> str:
+        """每分区 TopK 的 SQL：参数 (起始周, 结束周, K)，周次为 NULL 表示不限。
+
+        一次窗口查询完成：先在周次区间内按分区维度编号，只保留前 K 条后再关联 app_metadata。
+        partition 为空时整个区间作为一个分区（全局 TopK）；不含 week 时跨周比较。
+        """
+        partition = tuple(partition)
+        unknown = [d for d in partition if d not in PARTITION_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"未知分区维度：{', '.join(unknown)}（可选：{', '.join(PARTITION_DIMENSIONS)}）")
+        if len(set(partition)) != len(partition):
+            raise ValueError(f"分区维度重复：{', '.join(partition)}")
+        if metric not in TOP_K_METRICS:
+            raise ValueError(f"未知排序指标：{metric}（可选：{', '.join(TOP_K_METRICS)}）")
+        key = (partition, metric)
+        sql = self._top_k_sql.get(key)
+        if sql is not None:
+            return sql
+
+        rc_surge = surge_value_sql(self.conn, "rc")
+        partition_by = (
+            "PARTITION BY " + ", ".join(PARTITION_DIMENSIONS[d] for d in partition) if partition else ""
+        )
+        order_by = TOP_K_METRICS[metric].format(surge=rc_surge)
+        outer_order = ", ".join(PARTITION_DIMENSIONS[d].replace("rc.", "r.") for d in partition)
+        sql = f"""
+            WITH ranked AS (
+                SELECT
+                    rc.*,
+                    {rc_surge} AS surge_value,
+                    ROW_NUMBER() OVER (
+                        {partition_by}
+                        ORDER BY {order_by}
+                    ) AS rn
+                FROM rank_changes rc
+                WHERE rc.rank_date_current BETWEEN COALESCE(?1, '') AND COALESCE(?2, '9999-12-31')
+            )
+            SELECT
+                r.rank_date_current,
+                r.rank_date_last,
+                r.rn AS pick_rank,
+                r.country,
+                r.signal,
+                r.platform,
+                r.current_rank,
+                r.last_week_rank,
+                r.change,
+                r.change_type,
+                r.app_id,
+                COALESCE(m.name, r.app_name, r.app_id) AS display_name,
+                r.downloads,
+                r.revenue,
+                r.surge_value
+            FROM ranked r
+            {self._join_meta}
+            WHERE r.rn <= ?3
+            ORDER BY {outer_order + ", " if outer_order else ""}r.rn
+        """
+        self._top_k_sql[key] = sql
+        return sql
+
+    @staticmethod
+    def _dict_rows(cur: sqlite3.Cursor) -> Iterator[dict]:
+        """把已执行的游标包装为逐行产出字典的迭代器。
+
+        流式查询的方法先执行查询、再返回本迭代器（而不是写成生成器函数），
+        timed_query 才能计入执行时间，并在读完后记录行数与读取耗时。
+        """
+        names = [d[0] for d in cur.description]
+        return (dict(zip(names, r)) for r in cur)
+
+    @staticmethod
+    def _report_row(r) -> dict:
+        """新进 / 飙升查询的公共列（前 10 列）转为报表行字典。"""
+        return {
+            "current_rank": r[0],
+            "last_week_rank": r[1],
+            "change": r[2] or "",
+            "app_id": r[3],
+            "country": r[4],
+            "platform": r[5],
+            "downloads": r[6],
+            "revenue": r[7],
+            "display_name": r[8] or r[3],
+            "publisher_name": r[9] or "—",
+        }
+
+    def _change_counters(self) -> dict[tuple[str, str], int] | None:
+        """触发器维护的修改计数 {(来源表, 键): 计数}；未迁移（没有计数表）时返回 None。"""
+        if not has_table(self.conn, CHANGE_COUNTER_TABLE):
+            return None
+        return {(source, key): version for source, key, version in self.conn.execute(
+            f"SELECT source, key, version FROM {CHANGE_COUNTER_TABLE}"
+        )}
+
+    def _week_content_hash(self, rank_date_current: str) -> str:
+        """该周每行哈希之和（与行的存储顺序无关），按 rank_date_current 索引读取。"""
+        total = 0
+        for row in self.conn.execute(self.week_rows_sql, (rank_date_current,)):
+            digest = hashlib.blake2b(repr(row).encode("utf-8"), digest_size=8).digest()
+            total = (total + int.from_bytes(digest, "big")) & 0xFFFFFFFFFFFFFFFF
+        return f"{total:016x}"
+
+    @timed_query
+    def week_fingerprints(self, known: dict[str, str] | None = None) -> list[tuple[str, str, str]]:
+        """返回 (rank_date_current, rank_date_last, fingerprint) 列表，按当周日期倒序。
+
+        指纹为「探测值/内容哈希」。探测值 = 行数:最大 rowid:该周修改计数:app_metadata 修改计数，
+        只读索引与计数表即可得到；内容哈希为该周每行（报表用到的列及关联的 app_metadata 名称、发行商）哈希之和。
+        known 为上次的 {rank_date_current: fingerprint}：探测值未变的周直接沿用上次的指纹，
+        只有探测值变了（或库未迁移、没有修改计数）的周才逐行计算内容哈希。
+        """
+        known = known or {}
+        counters = self._change_counters()
+        meta_version = None if counters is None else counters.get(("app_metadata", ""), 0)
+        result = []
+        for week, last, count, max_rowid in self.conn.execute(self.week_probe_sql):
+            if counters is None:
+                probe = f"{count}:{max_rowid}:-:-"
+            else:
+                probe = f"{count}:{max_rowid}:{counters.get(('rank_changes', week), 0)}:{meta_version}"
+            previous = known.get(week)
+            if counters is not None and previous and previous.split("/")[0] == probe:
+                fingerprint = previous
+            else:
+                fingerprint = f"{probe}/{self._week_content_hash(week)}"
+            result.append((week, last or "", fingerprint))
+        return sorted(result, reverse=True)
+
+    @timed_query
+    def latest_week(self) -> tuple[str, str] | None:
+        """最近一周的 (rank_date_current, rank_date_last)；无数据返回 None。"""
+        row = self.conn.execute(self.LATEST_WEEK_SQL).fetchone()
+        if not row or not row[0]:
+            return None
+        return row[0], row[1] or ""
+
+    @timed_query
+    def new_entries(self, rank_date_current: str, max_rank: int = 50) -> list[dict]:
+        """当周新进榜单且 current_rank <= max_rank，按 current_rank 排序。"""
+        cur = self.conn.execute(self.new_entries_sql, (rank_date_current, max_rank))
+        return [self._report_row(r) for r in cur]
+
+    @timed_query
+    def surge_top(self, rank_date_current: str, limit: int = 10) -> list[dict]:
+        """当周排名飙升中上升幅度最大的 limit 条。"""
+        cur = self.conn.execute(self.surge_top_sql, (rank_date_current, limit))
+        rows = []
+        for r in cur:
+            row = self._report_row(r)
+            row["surge_value"] = r[10]
+            rows.append(row)
+        return rows
+
+    def weeks_report_rows(
+        self, weeks: list[str], max_rank: int = 50, surge_limit: int = 10
+    ) -> dict[str, tuple[list, list]]:
+        """多个周次的新进与飙升数据：{rank_date_current: (new_entries, surge_top)}。
+
+        逐周执行 new_entries / surge_top：两者都直接走 (周, 异动类型, 排序列) 索引并在 LIMIT 处停止，
+        比一条按周开窗的多周查询更快（见 bench_sensortower_reports.py）。
+        本身不计时：耗时与行数由 new_entries / surge_top 各自记录，避免重复计算。
+        """
+        return {w: (self.new_entries(w, max_rank), self.surge_top(w, surge_limit)) for w in weeks}
+
+    @timed_query
+    def top_k_per_partition(
+        self,
+        k: int = 1,
+        partition=DEFAULT_PARTITION,
+        metric: str = "rank",
+        start: str | None = None,
+        end: str | None = None,
+    ) -> Iterator[dict]:
+        """逐行产出 [start, end] 周次区间内每个分区按 metric 排序的前 k 条（pick_rank 为分区内名次）。
+
+        partition 取 PARTITION_DIMENSIONS 里的维度名，metric 取 TOP_K_METRICS 里的指标名；
+        按分区维度、名次排序，从游标流式读取。参数在调用时即校验，非法时直接抛 ValueError（不等到读取第一行）。
+        每周每分区一条即 top_k_per_partition(1, ONE_PER_PARTITION_WEEKLY)。
+        """
+        if k < 1:
+            raise ValueError("k 至少为 1")
+        return self._dict_rows(self.conn.execute(self.top_k_sql(partition, metric), (start, end, k)))
+
+    def report_queries(self) -> list[tuple[str, str, tuple]]:
+        """全部报表查询及示例参数：(名称, SQL, 参数)，供查询计划检查使用。"""
+        week = (self.latest_week() or ("", ""))[0]
+        return [
+            ("周次探测", self.week_probe_sql, ()),
+            ("单周行内容", self.week_rows_sql, (week,)),
+            ("最近一周", self.LATEST_WEEK_SQL, ()),
+            ("新进 Top50", self.new_entries_sql, (week, 50)),
+            ("飙升 Top10", self.surge_top_sql, (week, 10)),
+            ("每地区/榜单/平台一条", self.top_k_sql(ONE_PER_PARTITION_WEEKLY), (week, week, 1)),
+            ("多周每地区/榜单/平台一条", self.top_k_sql(ONE_PER_PARTITION_WEEKLY), (None, None, 1)),
+            ("每周每地区/异动类型下载量 Top3", self.top_k_sql(("week", "country", "change_type"), "downloads"), (None, None, 3)),
+        ]
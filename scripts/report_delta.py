@@ -0,0 +1,241 @@
+"""
+增量推送：把本次报表与「上次成功推送的版本」按章节、表格行比较，只推送新增 / 变化的内容。
+
+  - 章节：按 Markdown 标题切分；标题里的日期、数字不参与匹配（「SensorTower 周报（2026-01-19）」与上周同一章节对应）
+  - 比较单位：章节内的每个内容行（表格数据行、列表项、段落行），按出现次数计；空行与分隔线忽略
+  - 增量消息：只列出有变化的章节，新增的表格行带上所属表格的表头；移出的行只给出条数
+  - 回退全文：首次推送（没有上次版本），或变化行占比超过 max_ratio，或增量消息不比全文短
+  - 完全无变化时不推送
+
+推送脚本用 add_arguments 加上 --delta / --delta-max-ratio，入队前调用 choose_message 决定发送内容，
+flush 之后调用 record_delivered 记录本次全文（不开 --delta 时也记录，之后开启即可直接比较）。
+上次推送的版本保存在发件箱库（report_outbox）的 delivered_reports 表里，按报表类型一份；
+只有该报表本周期没有待重试的消息后才更新（见 record_delivered），失败重跑时仍与旧版本比较。
+"""
+
+import re
+import sqlite3
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from report_markdown import is_heading, is_table_line, is_table_separator
+
+DEFAULT_MAX_RATIO = 0.5
+
+_VOLATILE_RE = re.compile(r"[\d\-~/.:：,，]+")
+
+
+@dataclass
+class Section:
+    key: str
+    heading: str | None
+    # (内容行, 所属表格的表头两行；非表格行为 None)
+    lines: list[tuple[str, tuple[str, str] | None]] = field(default_factory=list)
+
+
+@dataclass
+class SectionDelta:
+    heading: str | None
+    added: list[tuple[str, tuple[str, str] | None]]
+    removed: int
+    is_new: bool
+
+
+@dataclass
+class Delta:
+    sections: list[SectionDelta]
+    changed_lines: int
+    total_lines: int
+    unchanged_sections: int
+
+    @property
+    def ratio(self) -> float:
+        return self.changed_lines / max(self.total_lines, 1)
+
+
+def _section_key(heading: str | None) -> str:
+    if heading is None:
+        return ""
+    level = len(heading) - len(heading.lstrip("#"))
+    return f"{level}:{_VOLATILE_RE.sub('', heading.lstrip('#')).strip()}"
+
+
+def parse_sections(md: str) -> list[Section]:
+    """按标题切分章节；同名章节按出现顺序加序号区分。"""
+    sections = [Section("", None)]
+    seen: Counter = Counter()
+    lines = md.splitlines()
+    header: tuple[str, str] | None = None
+    i = 0
+    while i < len(lines):
+        line = lines[i].rstrip()
+        if is_heading(line):
+            key = _section_key(line.strip())
+            seen[key] += 1
+            sections.append(Section(f"{key}#{seen[key]}", line.strip()))
+            header = None
+        elif is_table_line(line) and i + 1 < len(lines) and is_table_separator(lines[i + 1]):
+            header = (line, lines[i + 1].rstrip())
+            i += 2
+            continue
+        elif is_table_line(line):
+            sections[-1].lines.append((line, header))
+        else:
+            header = None
+            if line.strip() and line.strip() != "---":
+                sections[-1].lines.append((line, None))
+        i += 1
+    return [s for s in sections if s.heading is not None or s.lines]
+
+
+def diff_reports(old_md: str, new_md: str) -> Delta:
+    """按章节比较两个版本，返回新版本里新增的内容行与各章节移出的行数。"""
+    old = {s.key: s for s in parse_sections(old_md)}
+    new_sections = parse_sections(new_md)
+    deltas = []
+    changed = total = unchanged = 0
+    for section in new_sections:
+        total += len(section.lines)
+        before = old.pop(section.key, None)
+        if before is None:
+            deltas.append(SectionDelta(section.heading, section.lines, 0, True))
+            changed += len(section.lines) or 1
+            continue
+        remaining = Counter(line for line, _ in before.lines)
+        added = []
+        for line, header in section.lines:
+            if remaining[line]:
+                remaining[line] -= 1
+            else:
+                added.append((line, header))
+        removed = sum(remaining.values())
+        if added or removed:
+            deltas.append(SectionDelta(section.heading, added, removed, False))
+            changed += len(added) + removed
+        else:
+            unchanged += 1
+    # 整个章节消失的只计入变化量
+    changed += sum(len(s.lines) or 1 for s in old.values())
+    return Delta(deltas, changed, total, unchanged)
+
+
+def render_delta_md(title: str, delta: Delta, since: str) -> str:
+    """增量消息 Markdown：只列出有变化的章节。"""
+    lines = [f"# {title}（较上次推送的更新）", "", f"> 与上次推送（{since}）相比的新增与变化，未变化的章节已省略。", ""]
+    for section in delta.sections:
+        if section.heading:
+            lines.append(section.heading + ("（新增章节）" if section.is_new else ""))
+            lines.append("")
+        header = None
+        for line, line_header in section.added:
+            if line_header != header:
+                # 表格与普通行之间空一行；换到另一张表时补上它的表头
+                if lines[-1]:
+                    lines.append("")
+                if line_header is not None:
+                    lines.extend(line_header)
+            header = line_header
+            lines.append(line)
+        if section.added:
+            lines.append("")
+        if section.removed:
+            lines.append(f"（另有 {section.removed} 行已不在本次报表中）")
+            lines.append("")
+    if delta.unchanged_sections:
+        lines.append(f"其余 {delta.unchanged_sections} 个章节无变化。")
+    return "\n".join(lines).rstrip() + "\n"
+
+
+def ensure_snapshot_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS delivered_reports (
+            report_type TEXT PRIMARY KEY,
+            period TEXT NOT NULL,
+            markdown TEXT NOT NULL,
+            delivered_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def last_delivered(conn: sqlite3.Connection, report_type: str) -> tuple[str, str, str] | None:
+    """上次成功推送的版本：(周期, Markdown, 推送时间 UTC)；没有时返回 None。"""
+    try:
+        return conn.execute(
+            "SELECT period, markdown, delivered_at FROM delivered_reports WHERE report_type = ?",
+            (report_type,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # 还没有任何快照（表不存在），例如 dry-run 时以只读方式打开的新发件箱
+        return None
+
+
+def record_delivered(conn: sqlite3.Connection, report_type: str, period: str, markdown: str) -> bool:
+    """该报表本周期没有待投递的消息时，把本次全文记为上次推送的版本；返回是否已更新。
+
+    只看 pending / failed：dead（已放弃，flush 已计入失败）与 superseded（已被新版本取代）的条目
+    不会再投递，不能让它们永远挡住快照更新。
+    """
+    ensure_snapshot_table(conn)
+    unsent = conn.execute(
+        """
+        SELECT COUNT(*) FROM outbox
+        WHERE report_type = ? AND period = ? AND status IN ('pending', 'failed')
+        """,
+        (report_type, period),
+    ).fetchone()[0]
+    if unsent:
+        return False
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO delivered_reports (report_type, period, markdown, delivered_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(report_type) DO UPDATE SET
+                period = excluded.period, markdown = excluded.markdown, delivered_at = excluded.delivered_at
+            """,
+            (report_type, period, markdown, datetime.now(timezone.utc).isoformat(timespec="seconds")),
+        )
+    return True
+
+
+def add_arguments(parser) -> None:
+    """给推送脚本的 argparse 加上 --delta 与 --delta-max-ratio。"""
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="增量推送：只发送与上次成功推送版本相比新增 / 变化的内容（首次或变化较大时发全文，无变化不发）",
+    )
+    parser.add_argument(
+        "--delta-max-ratio",
+        type=float,
+        default=DEFAULT_MAX_RATIO,
+        help=f"增量模式下变化行占比超过该值时改发全文（默认 {DEFAULT_MAX_RATIO}）",
+    )
+
+
+def choose_message(
+    conn: sqlite3.Connection | None,
+    report_type: str,
+    title: str,
+    markdown: str,
+    max_ratio: float = DEFAULT_MAX_RATIO,
+) -> tuple[str, str | None]:
+    """决定本次推送的内容：("full", 全文) / ("delta", 增量消息) / ("unchanged", None)。"""
+    previous = last_delivered(conn, report_type) if conn is not None else None
+    if previous is None:
+        return "full", markdown
+    _, old_md, delivered_at = previous
+    if old_md == markdown:
+        return "unchanged", None
+    delta = diff_reports(old_md, markdown)
+    if not delta.changed_lines:
+        return "unchanged", None
+    if not delta.sections or delta.ratio > max_ratio:
+        return "full", markdown
+    delta_md = render_delta_md(title, delta, delivered_at[:16].replace("T", " ") + " UTC")
+    if len(delta_md.encode("utf-8")) >= len(markdown.encode("utf-8")):
+        return "full", markdown
+    return "delta", delta_md
@@ -0,0 +1,139 @@
+"""
+报表 Markdown 的结构解析与企业微信分条打包。
+
+企业微信机器人单条 Markdown 上限 4096 字节（UTF-8），超限会报 40058。
+split_for_wecom 把报表按行解析为「标题 / 普通行 / 表头 / 表格行」，
+再按顺序贪心装箱成尽量少的消息（每条 ≤ max_bytes）：
+  - 标题与其后的第一段内容、表头与第一行表格不会被拆开
+  - 表格跨消息时，续页开头重复表头
+  - 每行只编码一次，装箱为一次线性扫描
+不丢弃任何内容；单行本身超限时才按字节在 UTF-8 字符边界处硬切。
+"""
+
+import re
+
+from report_metrics import timed_render
+
+WECOM_MARKDOWN_MAX_BYTES = 4096
+
+# 表格分隔行，如 |------|:----:|
+_TABLE_SEP_RE = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+
+
+def is_heading(line: str) -> bool:
+    return line.lstrip().startswith("#")
+
+
+def is_table_line(line: str) -> bool:
+    return line.lstrip().startswith("|")
+
+
+def is_table_separator(line: str) -> bool:
+    return bool(_TABLE_SEP_RE.match(line))
+
+
+def _atoms(lines: list[str]) -> list[tuple[list[str], list[str] | None]]:
+    """把行序列切成不可再分的单元：(行列表, 续页需补的表头)。
+
+    表头（表头行 + 分隔行）与第一行表格合为一个单元，之后每行表格各为一个单元并带上表头；
+    标题与其后的空行、下一个单元合并。
+    """
+    atoms: list[tuple[list[str], list[str] | None]] = []
+    i, n = 0, len(lines)
+    while i < n:
+        line = lines[i]
+        if is_table_line(line) and i + 1 < n and is_table_separator(lines[i + 1]):
+            header = [line, lines[i + 1]]
+            i += 2
+            if i < n and is_table_line(lines[i]):
+                atoms.append((header + [lines[i]], None))
+                i += 1
+            else:
+                atoms.append((header, None))
+            while i < n and is_table_line(lines[i]):
+                atoms.append(([lines[i]], header))
+                i += 1
+            continue
+        atoms.append(([line], None))
+        i += 1
+
+    # 标题粘住后面的内容，避免一条消息以孤立标题结尾
+    merged: list[tuple[list[str], list[str] | None]] = []
+    pending: list[str] = []
+    for atom_lines, header in atoms:
+        if header is None and len(atom_lines) == 1 and (
+            is_heading(atom_lines[0]) or (pending and not atom_lines[0].strip())
+        ):
+            pending.extend(atom_lines)
+            continue
+        if pending:
+            atom_lines, pending = pending + atom_lines, []
+        merged.append((atom_lines, header))
+    if pending:
+        merged.append((pending, None))
+    return merged
+
+
+def _hard_split(line: str, max_bytes: int) -> list[str]:
+    """把单行按字节切成若干段，切点落在 UTF-8 字符边界。"""
+    data = line.encode("utf-8")
+    pieces = []
+    while len(data) > max_bytes:
+        cut = max_bytes
+        while cut > 0 and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        pieces.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+    pieces.append(data.decode("utf-8"))
+    return pieces
+
+
+@timed_render
+def split_for_wecom(md: str, max_bytes: int = WECOM_MARKDOWN_MAX_BYTES) -> list[str]:
+    """把 Markdown 打包为尽量少的、每条不超过 max_bytes 字节的消息，内容不丢失。"""
+    md = md.strip("\n")
+    if len(md.encode("utf-8")) <= max_bytes:
+        return [md] if md else []
+
+    chunks: list[str] = []
+    cur: list[str] = []
+    cur_bytes = 0
+
+    def flush() -> None:
+        nonlocal cur, cur_bytes
+        while cur and not cur[-1].strip():
+            cur.pop()
+        if cur:
+            chunks.append("\n".join(cur))
+        cur, cur_bytes = [], 0
+
+    def add_line(line: str, size: int) -> None:
+        nonlocal cur_bytes
+        if not cur and not line.strip():
+            return  # 消息开头不留空行
+        cur_bytes += size + (1 if cur else 0)
+        cur.append(line)
+
+    for atom_lines, header in _atoms(md.split("\n")):
+        sizes = [len(line.encode("utf-8")) for line in atom_lines]
+        atom_bytes = sum(sizes) + len(sizes) - 1
+        if cur and cur_bytes + 1 + atom_bytes > max_bytes:
+            flush()
+        # 表格续行落到新消息开头时补上表头
+        if not cur and header is not None:
+            for line in header:
+                add_line(line, len(line.encode("utf-8")))
+        if cur_bytes + (1 if cur else 0) + atom_bytes <= max_bytes:
+            for line, size in zip(atom_lines, sizes):
+                add_line(line, size)
+            continue
+        # 单元本身超限：逐行装入，单行超限再硬切
+        for line, size in zip(atom_lines, sizes):
+            pieces = [line] if size <= max_bytes else _hard_split(line, max_bytes)
+            for piece in pieces:
+                piece_bytes = len(piece.encode("utf-8")) if len(pieces) > 1 else size
+                if cur and cur_bytes + 1 + piece_bytes > max_bytes:
+                    flush()
+                add_line(piece, piece_bytes)
+    flush()
+    return chunks
@@ -0,0 +1,312 @@
+"""
+报表脚本的运行指标：每个查询的耗时与行数、渲染耗时与字节数、每条消息的字节数、Webhook 的 HTTP 耗时与状态码。
+
+各脚本在 main() 里用 session() 包住一次运行：
+  - 未开启时 record / timed / 装饰器都是空操作，几乎没有开销
+  - 开启后（--metrics-dir 或环境变量 REPORT_METRICS_DIR）：
+      <dir>/report_metrics.jsonl  每个事件一行 JSON，追加写入
+      <dir>/<脚本名>.prom         Prometheus textfile collector 格式，按 (类型, 名称, 状态) 汇总，原子替换
+  - --profile [DIR]：同时输出 cProfile（.prof，可用 snakeviz / pstats 查看）与 tracemalloc 快照，
+    并在 stderr 打印耗时与内存分配最多的位置
+
+事件类型（kind）：
+  query    SQLite 查询（行数为返回行数；流式结果按实际读取的行数、只计游标内耗时）
+  render   Markdown 渲染（bytes 为 UTF-8 字节数）
+  http     一条 Webhook 消息（bytes 为请求体字节数，status 为最终 HTTP 状态，含重试次数）
+  stage    其他阶段（读文件、入发件箱等）
+
+只依赖标准库。
+"""
+
+import cProfile
+import functools
+import inspect
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+DEFAULT_METRICS_DIR = Path(".report_state/metrics")
+JSONL_NAME = "report_metrics.jsonl"
+PROFILE_TOP = 15
+
+
+class MetricsRun:
+    """一次脚本运行收集到的事件（线程安全：投递层在多个线程里记录 HTTP 事件）。"""
+
+    def __init__(self, script: str):
+        self.script = script
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.events: list[dict] = []
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, name: str, **fields) -> None:
+        event = {"kind": kind, "name": name, **fields}
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self) -> dict[tuple, dict]:
+        """按 (kind, name, status) 汇总：次数、耗时合计 / 最大值、行数、字节数。"""
+        groups: dict[tuple, dict] = {}
+        for e in self.events:
+            key = (e["kind"], e["name"], str(e.get("status", "")))
+            g = groups.setdefault(key, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "bytes": 0})
+            seconds = e.get("duration_ms", 0.0) / 1000
+            g["calls"] += 1
+            g["seconds"] += seconds
+            g["max_seconds"] = max(g["max_seconds"], seconds)
+            g["rows"] += e.get("rows", 0)
+            g["bytes"] += e.get("bytes", 0)
+        return groups
+
+
+_run: MetricsRun | None = None
+
+
+def enabled() -> bool:
+    return _run is not None
+
+
+def record(kind: str, name: str, **fields) -> None:
+    """记录一个事件；未开启指标时忽略。"""
+    if _run is not None:
+        _run.record(kind, name, **fields)
+
+
+@contextmanager
+def timed(kind: str, name: str, **fields):
+    """计时一个代码块；块内可往产出的字典里补充 rows / bytes 等字段。"""
+    if _run is None:
+        yield fields
+        return
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        _run.record(kind, name, duration_ms=(time.perf_counter() - start) * 1000, **fields)
+
+
+def count_rows(kind: str, name: str, rows: Iterable, spent: float = 0.0, **fields) -> Iterator:
+    """包装流式结果：读完（或提前关闭）时记录行数与耗时，只计取下一行的时间，不含调用方处理每行的时间。"""
+    it = iter(rows)
+    n = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(it)
+            except StopIteration:
+                break
+            finally:
+                spent += time.perf_counter() - start
+            n += 1
+            yield row
+    finally:
+        record(kind, name, duration_ms=spent * 1000, rows=n, **fields)
+
+
+def _size(result) -> int:
+    """结果的行数：列表按长度；{周次: (新进, 飙升)} 这类容器累加其中的列表；单行结果（元组等）计 1。"""
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        return sum(_size(v) for v in result.values())
+    if isinstance(result, tuple) and result and all(isinstance(v, list) for v in result):
+        return sum(len(v) for v in result)
+    return 1
+
+
+def timed_query(fn):
+    """查询方法的装饰器：记录耗时与行数（事件名为方法名）；返回迭代器时在读完后记录。
+
+    只用于叶子查询（内部不再调用其他被计时的查询，否则会重复计算）。
+    流式查询应先执行查询再返回迭代器（如游标），不能是生成器函数：生成器函数被调用时函数体还没开始执行。
+    """
+    if inspect.isgeneratorfunction(fn):
+        raise TypeError(f"timed_query 不能装饰生成器函数 {fn.__qualname__}：请先执行查询，再返回迭代器")
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _run is None:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        spent = time.perf_counter() - start
+        if isinstance(result, Iterator):
+            return count_rows("query", fn.__name__, result, spent=spent)
+        _run.record("query", fn.__name__, duration_ms=spent * 1000, rows=_size(result))
+        return result
+
+    return wrapper
+
+
+def _bytes(result) -> int:
+    if isinstance(result, str):
+        return len(result.encode("utf-8"))
+    if isinstance(result, list):
+        return sum(_bytes(v) for v in result)
+    return 0
+
+
+def timed_render(fn):
+    """渲染函数的装饰器：记录耗时与输出（字符串或字符串列表）的 UTF-8 字节数。"""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _run is None:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        _run.record(
+            "render",
+            fn.__name__,
+            duration_ms=(time.perf_counter() - start) * 1000,
+            bytes=_bytes(result),
+        )
+        return result
+
+    return wrapper
+
+
+def _prom_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_prom_escape(str(v))}"' for k, v in labels.items() if v != "") + "}"
+
+
+PROM_METRICS = [
+    ("report_stage_calls", "calls", "阶段调用次数（HTTP 为消息条数）"),
+    ("report_stage_seconds", "seconds", "阶段耗时合计（秒）"),
+    ("report_stage_max_seconds", "max_seconds", "单次最长耗时（秒）"),
+    ("report_stage_rows", "rows", "查询返回的行数合计"),
+    ("report_stage_bytes", "bytes", "渲染输出 / 消息请求体字节数合计"),
+]
+
+
+def prometheus_text(run: MetricsRun, finished: float) -> str:
+    """Prometheus 文本格式（全部为 gauge，反映最近一次运行）。"""
+    script = run.script
+    lines = [
+        "# HELP report_run_duration_seconds 最近一次运行的总耗时（秒）",
+        "# TYPE report_run_duration_seconds gauge",
+        f"report_run_duration_seconds{_prom_labels(script=script)} {finished - run.started:.6f}",
+        "# HELP report_run_timestamp_seconds 最近一次运行结束的 Unix 时间",
+        "# TYPE report_run_timestamp_seconds gauge",
+        f"report_run_timestamp_seconds{_prom_labels(script=script)} {finished:.3f}",
+    ]
+    summary = sorted(run.summary().items())
+    for metric, field, help_text in PROM_METRICS:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for (kind, name, status), g in summary:
+            labels = _prom_labels(script=script, kind=kind, name=name, status=status)
+            value = g[field]
+            lines.append(f"{metric}{labels} {value:.6f}" if isinstance(value, float) else f"{metric}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_outputs(run: MetricsRun, metrics_dir: Path) -> None:
+    """追加 JSON Lines，并原子替换该脚本的 .prom 文件。"""
+    finished = time.time()
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    ts = datetime.fromtimestamp(finished, timezone.utc).isoformat(timespec="seconds")
+    with open(metrics_dir / JSONL_NAME, "a", encoding="utf-8") as f:
+        for event in run.events:
+            f.write(json.dumps({"ts": ts, "run": run.run_id, "script": run.script, **event}, ensure_ascii=False) + "\n")
+        f.write(
+            json.dumps(
+                {
+                    "ts": ts,
+                    "run": run.run_id,
+                    "script": run.script,
+                    "kind": "run",
+                    "name": run.script,
+                    "duration_ms": (finished - run.started) * 1000,
+                },
+                ensure_ascii=False,
+            )
+            + "\n"
+        )
+    prom = metrics_dir / f"{run.script}.prom"
+    tmp = prom.with_name(prom.name + ".tmp")
+    tmp.write_text(prometheus_text(run, finished), encoding="utf-8")
+    tmp.replace(prom)
+
+
+def print_summary(run: MetricsRun) -> None:
+    """在 stderr 打印按类型汇总的一行摘要。"""
+    totals: dict[str, list] = {}
+    for (kind, _, _), g in run.summary().items():
+        t = totals.setdefault(kind, [0, 0.0])
+        t[0] += g["calls"]
+        t[1] += g["seconds"]
+    parts = [f"{kind} {calls} 次 {seconds:.3f}s" for kind, (calls, seconds) in sorted(totals.items())]
+    print(f"[metrics] {run.script}：" + ("；".join(parts) or "无事件"), file=sys.stderr)
+
+
+def add_arguments(parser) -> None:
+    """给脚本的 argparse 加上 --metrics-dir 与 --profile。"""
+    parser.add_argument(
+        "--metrics-dir",
+        type=Path,
+        default=Path(os.environ["REPORT_METRICS_DIR"]) if os.environ.get("REPORT_METRICS_DIR") else None,
+        help=f"输出运行指标（{JSONL_NAME} 与 <脚本名>.prom）的目录，默认读环境变量 REPORT_METRICS_DIR，未设置则不输出",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        nargs="?",
+        const=DEFAULT_METRICS_DIR,
+        default=None,
+        help=f"输出 cProfile 与 tracemalloc 快照的目录（不带值时为 {DEFAULT_METRICS_DIR}）",
+    )
+
+
+@contextmanager
+def session(script: str, metrics_dir: Path | None = None, profile_dir: Path | None = None):
+    """一次脚本运行的指标会话：退出时写出指标与性能剖析结果（异常退出也会写出）。"""
+    global _run
+    if metrics_dir is None and profile_dir is None:
+        yield None
+        return
+
+    run = MetricsRun(script)
+    _run = run
+    profiler = None
+    if profile_dir is not None:
+        tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield run
+    finally:
+        _run = None
+        if profiler is not None:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            stem = profile_dir / f"{script}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{run.run_id}"
+            profiler.dump_stats(f"{stem}.prof")
+            snapshot.dump(f"{stem}.tracemalloc")
+            print(f"[profile] 已写入 {stem}.prof、{stem}.tracemalloc", file=sys.stderr)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(PROFILE_TOP)
+            print(f"[profile] 内存分配最多的 {PROFILE_TOP} 处：", file=sys.stderr)
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP]:
+                print(f"  {stat}", file=sys.stderr)
+        if metrics_dir is not None:
+            write_outputs(run, metrics_dir)
+        print_summary(run)
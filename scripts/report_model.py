@@ -0,0 +1,266 @@
+"""
+报表的中间结构与多目标渲染。
+
+报表构建函数只产出一个 Report（标题 + 按顺序排列的块：标题行、段落、表格、列表、分隔线、原始 Markdown），
+再由渲染器一次生成各目标格式：
+  - markdown：站点 Markdown（与原先手写拼接的输出逐字节一致）
+  - feishu：飞书互动卡片 payload 列表（卡片标题取 Report.title，正文为 Markdown）
+  - wecom：企业微信 Markdown payload 列表（按 4096 字节分条，见 report_markdown.split_for_wecom）
+  - html：纯 HTML 片段（表格、列表、加粗、链接）
+飞书 / 企业微信基于同一份 Markdown 派生，一次渲染只生成一次 Markdown。
+
+RenderCache 把渲染结果按「报表数据哈希」缓存到磁盘（默认项目根目录下的 .report_state/render_cache）：
+数据不变的报表直接读缓存，不再渲染；渲染逻辑变更时提高 RENDER_VERSION 使旧缓存失效。
+有清单的调用方（generate_sensortower_weekly_report.py）用 prune 删除清单里已不再引用的条目。
+"""
+
+import hashlib
+import html
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from report_markdown import split_for_wecom
+from report_metrics import timed_render
+from webhook_delivery import feishu_card_payload, wecom_markdown_payload
+
+RENDER_VERSION = 1
+DEFAULT_RENDER_CACHE = Path(__file__).resolve().parents[1] / ".report_state" / "render_cache"
+TARGETS = ("markdown", "feishu", "wecom", "html")
+
+
+@dataclass
+class Heading:
+    text: str
+    level: int = 2
+    kind: str = "heading"
+
+
+@dataclass
+class Paragraph:
+    text: str
+    kind: str = "paragraph"
+
+
+@dataclass
+class Rule:
+    kind: str = "rule"
+
+
+@dataclass
+class BulletList:
+    items: list[str]
+    kind: str = "bullets"
+
+
+@dataclass
+class Table:
+    headers: list[str]
+    rows: list[list]
+    # 无数据时显示的占位行
+    empty_row: list[str] | None = None
+    # Markdown 分隔行每列的短横线数（保持既有报表的格式不变），为空时每列 3 个
+    dashes: list[int] | None = None
+    kind: str = "table"
+
+
+@dataclass
+class RawMarkdown:
+    """已经是 Markdown 的内容（如人工撰写的简报），原样输出。"""
+
+    text: str
+    kind: str = "raw"
+
+
+Block = Heading | Paragraph | Rule | BulletList | Table | RawMarkdown
+
+
+@dataclass
+class Report:
+    """title 为消息 / 卡片标题（不渲染进正文）；footer 为正文末尾的推送说明。"""
+
+    title: str
+    blocks: list[Block] = field(default_factory=list)
+    footer: str | None = None
+    # 多个报表合并为一条消息时的子报表（按顺序，用分隔线隔开）
+    parts: list["Report"] = field(default_factory=list)
+
+    def data_hash(self) -> str:
+        """报表数据的哈希（含渲染版本），作为渲染缓存的键。"""
+        data = json.dumps([RENDER_VERSION, asdict(self)], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def combine(title: str, reports: list[Report]) -> Report:
+    """把多个报表合并为一条消息（正文依次排列，中间用分隔线隔开）。"""
+    return Report(title, parts=list(reports))
+
+
+def from_markdown(title: str, text: str) -> Report:
+    """把现成的 Markdown 包装为报表。"""
+    return Report(title, [RawMarkdown(text)])
+
+
+# ---------- Markdown ----------
+def _md_row(cells) -> str:
+    return "| " + " | ".join(str(c) for c in cells) + " |"
+
+
+def _md_block(block: Block) -> str:
+    if isinstance(block, Heading):
+        return f"{'#' * block.level} {block.text}"
+    if isinstance(block, Paragraph):
+        return block.text
+    if isinstance(block, Rule):
+        return "---"
+    if isinstance(block, BulletList):
+        return "\n".join(f"- {item}" for item in block.items)
+    if isinstance(block, Table):
+        dashes = block.dashes or [3] * len(block.headers)
+        lines = [_md_row(block.headers), "|" + "|".join("-" * n for n in dashes) + "|"]
+        lines += [_md_row(r) for r in block.rows]
+        if not block.rows and block.empty_row:
+            lines.append(_md_row(block.empty_row))
+        return "\n".join(lines)
+    if isinstance(block, RawMarkdown):
+        return block.text
+    raise TypeError(f"未知的报表块：{block!r}")
+
+
+@timed_render
+def render_markdown(report: Report) -> str:
+    """站点 Markdown：块之间空一行；正文以表格等结尾时保留末尾换行，footer 前空一行。"""
+    return _markdown(report)
+
+
+def _markdown(report: Report) -> str:
+    if report.parts:
+        return "\n\n---\n\n".join(_markdown(p) for p in report.parts)
+    if len(report.blocks) == 1 and isinstance(report.blocks[0], RawMarkdown) and not report.footer:
+        return report.blocks[0].text
+    md = "\n\n".join(_md_block(b) for b in report.blocks) + "\n"
+    if report.footer:
+        md += "\n" + report.footer
+    return md
+
+
+# ---------- HTML ----------
+_BOLD_RE = re.compile(r"\*\*(.+?)\*\*")
+_LINK_RE = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+
+
+def _inline_html(text) -> str:
+    """转义后处理行内的 **加粗** 与 [链接](url)。"""
+    s = html.escape(str(text), quote=False)
+    s = _BOLD_RE.sub(r"<strong>\1</strong>", s)
+    return _LINK_RE.sub(lambda m: f'<a href="{html.escape(m.group(2))}">{m.group(1)}</a>', s)
+
+
+def _html_block(block: Block) -> str:
+    if isinstance(block, Heading):
+        return f"<h{block.level}>{_inline_html(block.text)}</h{block.level}>"
+    if isinstance(block, Paragraph):
+        return f"<p>{_inline_html(block.text)}</p>"
+    if isinstance(block, Rule):
+        return "<hr>"
+    if isinstance(block, BulletList):
+        return "<ul>" + "".join(f"<li>{_inline_html(i)}</li>" for i in block.items) + "</ul>"
+    if isinstance(block, Table):
+        rows = block.rows or ([block.empty_row] if block.empty_row else [])
+        head = "".join(f"<th>{_inline_html(h)}</th>" for h in block.headers)
+        body = "".join("<tr>" + "".join(f"<td>{_inline_html(c)}</td>" for c in r) + "</tr>" for r in rows)
+        return f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+    if isinstance(block, RawMarkdown):
+        return f'<pre class="markdown">{html.escape(block.text, quote=False)}</pre>'
+    raise TypeError(f"未知的报表块：{block!r}")
+
+
+@timed_render
+def render_html(report: Report) -> str:
+    """纯 HTML 片段（不含 <html>/<body>，由页面模板包裹）。"""
+    return _html(report)
+
+
+def _html(report: Report) -> str:
+    if report.parts:
+        return "\n<hr>\n".join(_html(p) for p in report.parts)
+    blocks = [_html_block(b) for b in report.blocks]
+    if report.footer:
+        blocks.append(f"<p>{_inline_html(report.footer)}</p>")
+    return "\n".join(blocks) + "\n"
+
+
+# ---------- 渲染 ----------
+def render(report: Report, targets=TARGETS, cache: "RenderCache | None" = None) -> dict:
+    """一次渲染出指定目标格式：{目标: 结果}。有缓存时只渲染缓存里缺少的目标。"""
+    unknown = [t for t in targets if t not in TARGETS]
+    if unknown:
+        raise ValueError(f"未知渲染目标：{', '.join(unknown)}")
+    key = report.data_hash() if cache is not None else None
+    outputs = cache.get(key) if cache is not None else {}
+    missing = [t for t in targets if t not in outputs]
+    if missing:
+        md = outputs.get("markdown")
+        if md is None and any(t in ("markdown", "feishu", "wecom") for t in missing):
+            md = render_markdown(report)
+        rendered = {}
+        for target in missing:
+            if target == "markdown":
+                rendered[target] = md
+            elif target == "feishu":
+                rendered[target] = [feishu_card_payload(report.title, md)]
+            elif target == "wecom":
+                rendered[target] = [wecom_markdown_payload(chunk) for chunk in split_for_wecom(md)]
+            else:
+                rendered[target] = render_html(report)
+        outputs = {**outputs, **rendered}
+        if cache is not None:
+            cache.put(key, outputs)
+    return {t: outputs[t] for t in targets}
+
+
+class RenderCache:
+    """按报表数据哈希缓存渲染结果：<dir>/<哈希前两位>/<哈希>.json。"""
+
+    def __init__(self, directory: Path = DEFAULT_RENDER_CACHE):
+        self.directory = Path(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> dict:
+        try:
+            data = json.loads(self._path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.misses += 1
+            return {}
+        self.hits += 1
+        return data if isinstance(data, dict) else {}
+
+    def put(self, key: str, outputs: dict) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(outputs, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+
+    def prune(self, keep: set[str]) -> int:
+        """删除哈希不在 keep 里的条目（及残留的临时文件、空目录），返回删除的条目数。"""
+        removed = 0
+        for path in self.directory.glob("*/*.json*"):
+            if path.name.endswith(".json") and path.stem in keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            removed += path.name.endswith(".json")
+        for sub in self.directory.glob("*/"):
+            try:
+                sub.rmdir()
+            except OSError:
+                pass
+        return removed
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+报表推送的本地 SQLite 发件箱（outbox）。
+
+每条渲染好的消息（飞书卡片、企业微信的每一条 Markdown）先入队，再由 flush 投递：
+  - 幂等键 = sha256(报表类型 | 周期 | 渠道 | Webhook | 序号 | 内容哈希)，同一内容重复入队会被忽略
+  - 同一 (报表类型, 周期, 渠道, Webhook) 重新入队了不同内容（报表重新生成）时，旧版本中尚未送达的条目
+    标记为 superseded，不再投递，避免新旧两版都发出去
+  - flush 只投递 pending / failed 的条目，按批次、按渠道并发（见 webhook_delivery），逐条记录结果；
+    推送脚本只投递本次入队的报表（reports = [(报表类型, 周期)]），不会顺带补发其他报表、其他周期的旧消息
+  - 部分失败后重新运行脚本，只会补发失败的那几条，已成功的不会重复发送
+  - 每条最多投递 max_attempts 轮（默认 DEFAULT_MAX_ATTEMPTS），仍失败的标记为 dead 不再重试；
+    入队超过 max_age_days 天（默认 DEFAULT_MAX_AGE_DAYS）仍未送达的视为过期，同样标记为 dead
+
+默认库文件：.report_state/outbox.db（相对仓库根目录）。
+
+使用方式（在项目根目录）：
+  python scripts/report_outbox.py status
+  python scripts/report_outbox.py flush
+  python scripts/report_outbox.py flush --batch-size 20
+  python scripts/report_outbox.py flush --report-type sensortower_weekly --period 2026-02-09
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from webhook_delivery import WECOM_RATE_LIMITER, Channel, deliver, print_results
+
+DEFAULT_OUTBOX = Path(__file__).resolve().parents[1] / ".report_state" / "outbox.db"
+DEFAULT_BATCH_SIZE = 50
+# 每条消息最多投递几轮（每轮内 webhook_delivery 已对临时失败做退避重试）
+DEFAULT_MAX_ATTEMPTS = 5
+# 入队超过该天数仍未送达的消息不再投递（周报、日报过期后补发没有意义）
+DEFAULT_MAX_AGE_DAYS = 7
+
+# 按渠道名决定是否走企业微信限流
+_RATE_LIMITERS = {"企业微信": WECOM_RATE_LIMITER}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def open_outbox(path: Path = DEFAULT_OUTBOX) -> sqlite3.Connection:
+    """打开（必要时创建）发件箱数据库。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idem_key TEXT NOT NULL UNIQUE,
+            report_type TEXT NOT NULL,
+            period TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            url TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',  -- pending / sent / failed / dead（不再重试）/ superseded（已被新版本取代）
+            attempts INTEGER NOT NULL DEFAULT 0,     -- 已投递的轮数
+            last_status INTEGER,
+            last_response TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            sent_at TEXT
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, id)")
+    conn.commit()
+    return conn
+
+
+def idempotency_key(report_type: str, period: str, channel: str, url: str, seq: int, content_hash: str) -> str:
+    raw = "|".join([report_type, period, channel, url, str(seq), content_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def enqueue(conn: sqlite3.Connection, report_type: str, period: str, channel: Channel) -> int:
+    """把一个渠道的全部消息入队，返回新入队的条数（已存在的幂等键忽略）。
+
+    该渠道这份报表此前入队、但不属于本次内容的未送达条目（pending / failed / dead）标记为 superseded。
+    """
+    now = _now()
+    added = 0
+    keys = []
+    with conn:
+        for seq, payload in enumerate(channel.payloads):
+            payload_json = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+            content_hash = hashlib.sha256(payload_json.encode("utf-8")).hexdigest()
+            key = idempotency_key(report_type, period, channel.name, channel.url, seq, content_hash)
+            keys.append(key)
+            cur = conn.execute(
+                """
+                INSERT OR IGNORE INTO outbox
+                    (idem_key, report_type, period, channel, url, seq, content_hash, payload, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, report_type, period, channel.name, channel.url, seq, content_hash, payload_json, now, now),
+            )
+            added += cur.rowcount
+        conn.execute(
+            """
+            UPDATE outbox
+            SET status = 'superseded', updated_at = ?, last_response = '已被重新入队的新版本取代'
+            WHERE report_type = ? AND period = ? AND channel = ? AND url = ?
+              AND status IN ('pending', 'failed', 'dead')
+              AND idem_key NOT IN (SELECT value FROM json_each(?))
+            """,
+            (now, report_type, period, channel.name, channel.url, json.dumps(keys)),
+        )
+    return added
+
+
+def _scope_sql(reports) -> tuple[str, tuple]:
+    """把 reports（[(报表类型, 周期)]，None 表示全部）转为 WHERE 子句片段与参数。"""
+    if reports is None:
+        return "", ()
+    pairs = json.dumps(sorted({(t, p) for t, p in reports}), ensure_ascii=False)
+    return (
+        """
+        AND EXISTS (
+            SELECT 1 FROM json_each(?) j
+            WHERE json_extract(j.value, '$[0]') = outbox.report_type
+              AND json_extract(j.value, '$[1]') = outbox.period
+        )
+        """,
+        (pairs,),
+    )
+
+
+def expire(
+    conn: sqlite3.Connection,
+    reports=None,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+) -> int:
+    """把已达投递轮数上限或已过期的未送达条目标记为 dead，返回条数。"""
+    scope, params = _scope_sql(reports)
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).isoformat(timespec="seconds")
+    with conn:
+        cur = conn.execute(
+            f"""
+            UPDATE outbox
+            SET status = 'dead', updated_at = ?,
+                last_response = CASE WHEN attempts >= ? THEN last_response
+                                     ELSE '入队超过 ' || ? || ' 天未送达，已过期' END
+            WHERE status IN ('pending', 'failed') AND (attempts >= ? OR created_at < ?)
+            {scope}
+            """,
+            (_now(), max_attempts, f"{max_age_days:g}", max_attempts, cutoff) + params,
+        )
+    return cur.rowcount
+
+
+def flush(
+    conn: sqlite3.Connection,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    reports=None,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+) -> tuple[int, int]:
+    """投递 pending / failed 条目，返回 (成功数, 失败数)。每条在本次 flush 中至多尝试一轮。
+
+    reports 为 [(报表类型, 周期)] 时只投递这些报表的条目（推送脚本传本次入队的报表），None 表示全部。
+    达到 max_attempts 轮仍失败或入队超过 max_age_days 天的条目标记为 dead，计入失败数。
+    """
+    dead = expire(conn, reports, max_attempts, max_age_days)
+    if dead:
+        print(f"发件箱：{dead} 条消息已达重试上限或已过期，标记为 dead 不再投递", file=sys.stderr)
+    scope, scope_params = _scope_sql(reports)
+    sent = failed = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            f"""
+            SELECT id, channel, url, payload
+            FROM outbox
+            WHERE status IN ('pending', 'failed') AND id > ?
+            {scope}
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_id,) + scope_params + (batch_size,),
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        # 同一 (渠道, Webhook) 的条目按 id 顺序组成一个 Channel，各渠道并发投递
+        channels: dict[tuple[str, str], tuple[Channel, list[int]]] = {}
+        for entry_id, name, url, payload in rows:
+            if (name, url) not in channels:
+                channels[(name, url)] = (Channel(name, url, [], _RATE_LIMITERS.get(name)), [])
+            channel, ids = channels[(name, url)]
+            channel.payloads.append(json.loads(payload))
+            ids.append(entry_id)
+
+        batch = list(channels.values())
+        results = iter(deliver([channel for channel, _ in batch]))
+        delivered = []
+        now = _now()
+        with conn:
+            # deliver 按渠道顺序、渠道内按消息顺序返回结果
+            for channel, ids in batch:
+                for entry_id in ids:
+                    r = next(results)
+                    delivered.append(r)
+                    conn.execute(
+                        """
+                        UPDATE outbox
+                        SET status = CASE WHEN ? THEN 'sent' WHEN attempts + 1 >= ? THEN 'dead' ELSE 'failed' END,
+                            attempts = attempts + 1, last_status = ?, last_response = ?,
+                            updated_at = ?, sent_at = CASE WHEN ? THEN ? ELSE sent_at END
+                        WHERE id = ?
+                        """,
+                        (r.ok, max_attempts, r.status, r.response[:2000], now, r.ok, now, entry_id),
+                    )
+                    if r.ok:
+                        sent += 1
+                    else:
+                        failed += 1
+        print_results(delivered)
+    return sent, failed + dead
+
+
+def status(conn: sqlite3.Connection) -> dict[str, int]:
+    """各状态的条目数。"""
+    return dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+
+def print_status(conn: sqlite3.Connection) -> None:
+    counts = status(conn)
+    print("发件箱状态：" + "，".join(f"{k} {counts.get(k, 0)} 条" for k in ("pending", "failed", "dead", "superseded", "sent")))
+    rows = conn.execute(
+        """
+        SELECT id, report_type, period, channel, seq, status, attempts, last_status, updated_at
+        FROM outbox
+        WHERE status NOT IN ('sent', 'superseded')
+        ORDER BY id
+        """
+    ).fetchall()
+    for entry_id, report_type, period, channel, seq, entry_status, attempts, last_status, updated_at in rows:
+        print(
+            f"  #{entry_id} {report_type} {period} [{channel}] 第 {seq + 1} 条（{entry_status}）："
+            f"尝试 {attempts} 轮，最近 status={last_status}，更新于 {updated_at}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="报表推送发件箱：查看状态 / 补发未成功的消息")
+    parser.add_argument("command", choices=["status", "flush"], help="status 查看状态；flush 投递 pending/failed 条目（默认全部报表）")
+    parser.add_argument("--outbox", type=Path, default=DEFAULT_OUTBOX, help="发件箱 SQLite 路径")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每批投递的条目数")
+    parser.add_argument("--report-type", default=None, help="flush 时只投递该报表类型（需同时指定 --period）")
+    parser.add_argument("--period", default=None, help="flush 时只投递该周期")
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=DEFAULT_MAX_ATTEMPTS,
+        help=f"每条消息最多投递几轮，超过后标记为 dead（默认 {DEFAULT_MAX_ATTEMPTS}）",
+    )
+    parser.add_argument(
+        "--max-age-days",
+        type=float,
+        default=DEFAULT_MAX_AGE_DAYS,
+        help=f"入队超过该天数仍未送达的消息标记为 dead（默认 {DEFAULT_MAX_AGE_DAYS}）",
+    )
+    args = parser.parse_args()
+    if (args.report_type is None) != (args.period is None):
+        parser.error("--report-type 与 --period 需同时指定")
+
+    conn = open_outbox(args.outbox)
+    try:
+        if args.command == "status":
+            print_status(conn)
+            return 0
+        reports = [(args.report_type, args.period)] if args.report_type is not None else None
+        sent, failed = flush(conn, args.batch_size, reports, args.max_attempts, args.max_age_days)
+        print(f"投递完成：成功 {sent} 条，失败 {failed} 条")
+        return 0 if failed == 0 else 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
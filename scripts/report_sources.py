@@ -0,0 +1,188 @@
+"""
+周报数据源注册表：每个数据源各自构建一段报表（report_model.Report），并行执行、各自超时，结果按固定顺序拼装。
+
+  - register_source：装饰一个构建函数 build(ctx) -> Report | None，登记名称、顺序、超时与是否默认启用
+  - build_sources：把选中的数据源放进线程池（默认）或进程池并行构建，
+    按 (order, name) 的顺序返回成功的结果；超时或抛异常的数据源打印警告后跳过，不影响其他数据源
+  - SourceContext：构建函数通过 ctx.connect(key) 取只读连接（文件不存在时返回 None 并提示跳过），
+    ctx.options 里是命令行传入的参数（如 week）
+
+超时处理：
+  - 线程模式：超时后对该数据源打开的 SQLite 连接调用 interrupt()，正在执行的查询会立即中止；
+    卡在非 SQLite 代码里的构建函数无法被强制停止（进程退出时仍会等待它结束）
+  - 进程模式（executor="process"）：全部结果收齐后 terminate 进程池，超时的构建进程会被直接结束；
+    构建函数与 ctx 需可 pickle（模块顶层函数即可）
+"""
+
+import multiprocessing
+import sqlite3
+import sys
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from dataclasses import dataclass
+from pathlib import Path
+
+import report_metrics
+from report_db import connect_readonly
+from report_model import Report
+
+DEFAULT_SOURCE_TIMEOUT = 60.0
+
+
+class SourceContext:
+    """一个数据源单次构建的上下文：数据库路径、命令行参数，以及构建期间打开的连接。"""
+
+    def __init__(self, paths: dict[str, Path], options: dict | None = None):
+        self.paths = paths
+        self.options = options or {}
+        self._conns: list[sqlite3.Connection] = []
+
+    def __getstate__(self):
+        # 进程模式下只传路径与参数，连接在子进程里重新打开
+        return {"paths": self.paths, "options": self.options}
+
+    def __setstate__(self, state):
+        self.__init__(state["paths"], state["options"])
+
+    def connect(self, key: str) -> sqlite3.Connection | None:
+        """打开 paths[key] 的只读连接；文件不存在时打印提示并返回 None。连接在构建结束后自动关闭。"""
+        path = self.paths[key]
+        if not path.exists():
+            print(f"[跳过] {path.name} 不存在: {path}", file=sys.stderr)
+            return None
+        conn = connect_readonly(path)
+        self._conns.append(conn)
+        return conn
+
+    def interrupt(self) -> None:
+        """中止该数据源正在执行的 SQLite 查询（可从其他线程调用）。"""
+        for conn in list(self._conns):
+            try:
+                conn.interrupt()
+            except sqlite3.ProgrammingError:
+                pass
+
+    def close(self) -> None:
+        for conn in self._conns:
+            conn.close()
+        self._conns.clear()
+
+
+@dataclass(frozen=True)
+class ReportSource:
+    name: str
+    label: str
+    build: Callable[[SourceContext], Report | None]
+    order: int = 100
+    timeout: float = DEFAULT_SOURCE_TIMEOUT
+    default: bool = True
+
+
+REGISTRY: dict[str, ReportSource] = {}
+
+
+def register_source(
+    name: str,
+    label: str,
+    order: int = 100,
+    timeout: float = DEFAULT_SOURCE_TIMEOUT,
+    default: bool = True,
+):
+    """登记一个数据源构建函数；order 越小在合并报表里越靠前。"""
+
+    def decorator(fn: Callable[[SourceContext], Report | None]):
+        REGISTRY[name] = ReportSource(name, label, fn, order, timeout, default)
+        return fn
+
+    return decorator
+
+
+def select_sources(names: list[str] | None = None) -> list[ReportSource]:
+    """按名称选取数据源（None 时为全部默认数据源），按 (order, name) 排序；未知名称抛 ValueError。"""
+    if names is None:
+        selected = [s for s in REGISTRY.values() if s.default]
+    else:
+        unknown = [n for n in names if n not in REGISTRY]
+        if unknown:
+            raise ValueError(f"未知数据源：{', '.join(unknown)}（可选：{', '.join(sorted(REGISTRY))}）")
+        selected = [REGISTRY[n] for n in dict.fromkeys(names)]
+    return sorted(selected, key=lambda s: (s.order, s.name))
+
+
+def _run_source(build: Callable[[SourceContext], Report | None], ctx: SourceContext) -> Report | None:
+    try:
+        return build(ctx)
+    finally:
+        ctx.close()
+
+
+def build_sources(
+    sources: list[ReportSource],
+    paths: dict[str, Path],
+    options: dict | None = None,
+    executor: str = "thread",
+    timeout: float | None = None,
+) -> list[tuple[ReportSource, Report]]:
+    """并行构建各数据源，按传入顺序返回 (数据源, 报表)；无内容、超时、出错的数据源不出现在结果里。
+
+    timeout 为 None 时使用各数据源自己的超时，均从提交时刻起算。
+    """
+    if not sources:
+        return []
+    contexts = [SourceContext(paths, options) for _ in sources]
+    start = time.monotonic()
+    pool = None
+    if executor == "process":
+        pool = multiprocessing.Pool(processes=len(sources))
+        pending = [pool.apply_async(_run_source, (s.build, ctx)) for s, ctx in zip(sources, contexts)]
+        timeout_error = multiprocessing.TimeoutError
+    else:
+        threads = ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="report-source")
+        futures = [threads.submit(_run_source, s.build, ctx) for s, ctx in zip(sources, contexts)]
+        pending = [_FutureResult(f) for f in futures]
+        timeout_error = FuturesTimeout
+
+    results = []
+    try:
+        for source, ctx, result in zip(sources, contexts, pending):
+            limit = source.timeout if timeout is None else timeout
+            status = "ok"
+            try:
+                report = result.get(timeout=max(0.0, start + limit - time.monotonic()))
+            except timeout_error:
+                status = "timeout"
+                ctx.interrupt()
+                print(f"[警告] {source.label}（{source.name}）超过 {limit:g}s 未完成，已跳过", file=sys.stderr)
+                continue
+            except Exception as e:  # noqa: BLE001
+                status = "error"
+                print(f"[警告] {source.label}（{source.name}）构建失败，已跳过：{e}", file=sys.stderr)
+                continue
+            finally:
+                report_metrics.record(
+                    "stage",
+                    f"source:{source.name}",
+                    status=status,
+                    duration_ms=(time.monotonic() - start) * 1000,
+                )
+            if report:
+                results.append((source, report))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        else:
+            threads.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+class _FutureResult:
+    """让 concurrent.futures.Future 与 multiprocessing 的 AsyncResult 有相同的 get(timeout) 接口。"""
+
+    def __init__(self, future):
+        self.future = future
+
+    def get(self, timeout: float | None = None):
+        return self.future.result(timeout=timeout)
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+videos.db / competitor_data.db 文本的 FTS5 全文索引：增量构建 + 命令行检索（带高亮片段、按相关度排序）。
+
+索引内容：
+  - games（videos.db）：标题 = 游戏名 + 视频标题，正文 = 玩法解析 gameplay_analysis + 视频描述
+  - weekly_reports（competitor_data.db）：标题 = 公司 + 周期，正文 = report_content
+  - posts（competitor_data.db 各公司抓取的 posts_json）：每条帖子一行（按平台帖子 ID / 链接去重，
+    同一帖子每天重复抓取只保留最近一次的文本），标题 = 帖子标题或游戏，正文 = 帖子文本
+
+索引单独存放（默认 .report_state/search_index.db），源库只读打开：
+  - search_fts：FTS5 虚拟表，trigram 分词（中文不需要分词，任意 ≥3 字的子串都能走索引）
+  - search_items：(来源, 源记录键) -> FTS 行号，用于更新 / 删除已索引的记录
+  - search_watermarks：各来源的水位（games 取 updated_at / analyzed_at / created_at 中最新的，
+    weekly_reports 取 created_at，帖子按公司取 fetched_at），每次只读取水位及之后的行；
+    与水位相同时间戳的行会重读一次（幂等覆盖），不会漏掉同一秒写入的行
+  - games / weekly_reports 另按主键核对，源库里已删除的行会从索引中移除；帖子只增不删
+
+检索：每个用空格分开的词都要命中；≥3 个字的词走 FTS5 MATCH（bm25 排序，标题权重更高），
+不足 3 个字的词（trigram 无法索引）退化为 LIKE 过滤，全部词都不足 3 个字时按日期倒序返回。
+
+使用方式（在项目根目录）：
+  python scripts/search_index.py build
+  python scripts/search_index.py build --full
+  python scripts/search_index.py query 合成消除
+  python scripts/search_index.py query "Mob Control" --source posts --limit 5
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from competitor_store import RAW_TABLE, company_tables, is_table
+from report_db import connect_readonly
+
+DEFAULT_INDEX = Path(".report_state/search_index.db")
+SOURCES = ("games", "weekly_reports", "posts")
+SNIPPET_TOKENS = 24
+# bm25 列权重：source / ref / company / date 不参与，title 5 倍于 body
+BM25_WEIGHTS = "0, 0, 0, 0, 5.0, 1.0"
+
+SCHEMA_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+    source UNINDEXED,
+    ref UNINDEXED,
+    company UNINDEXED,
+    date UNINDEXED,
+    title,
+    body,
+    tokenize = 'trigram'
+);
+CREATE TABLE IF NOT EXISTS search_items (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    ref TEXT NOT NULL,
+    UNIQUE (source, ref)
+);
+CREATE TABLE IF NOT EXISTS search_watermarks (
+    source TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+GAMES_STAMP_SQL = "MAX(COALESCE(updated_at, ''), COALESCE(analyzed_at, ''), COALESCE(created_at, ''))"
+
+
+def open_index(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(SCHEMA_SQL)
+    return conn
+
+
+def _watermark(conn: sqlite3.Connection, source: str) -> str:
+    row = conn.execute("SELECT value FROM search_watermarks WHERE source = ?", (source,)).fetchone()
+    return row[0] if row else ""
+
+
+def _set_watermark(conn: sqlite3.Connection, source: str, value: str) -> None:
+    conn.execute(
+        "INSERT INTO search_watermarks (source, value) VALUES (?, ?) "
+        "ON CONFLICT(source) DO UPDATE SET value = excluded.value",
+        (source, value),
+    )
+
+
+def _upsert(conn: sqlite3.Connection, source: str, ref: str, company, date, title: str, body: str) -> None:
+    """写入或覆盖一条索引记录（FTS 行号沿用 search_items.id）。"""
+    row = conn.execute("SELECT id FROM search_items WHERE source = ? AND ref = ?", (source, ref)).fetchone()
+    if row:
+        item_id = row[0]
+        conn.execute("DELETE FROM search_fts WHERE rowid = ?", (item_id,))
+    else:
+        item_id = conn.execute("INSERT INTO search_items (source, ref) VALUES (?, ?)", (source, ref)).lastrowid
+    conn.execute(
+        "INSERT INTO search_fts (rowid, source, ref, company, date, title, body) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (item_id, source, ref, company, date, title, body),
+    )
+
+
+def _prune(conn: sqlite3.Connection, source: str, live_refs: set[str]) -> int:
+    """删除源库里已不存在的记录，返回删除条数。"""
+    stale = [
+        (item_id,)
+        for item_id, ref in conn.execute("SELECT id, ref FROM search_items WHERE source = ?", (source,))
+        if ref not in live_refs
+    ]
+    conn.executemany("DELETE FROM search_fts WHERE rowid = ?", stale)
+    conn.executemany("DELETE FROM search_items WHERE id = ?", stale)
+    return len(stale)
+
+
+def _join(*parts) -> str:
+    return "\n".join(str(p) for p in parts if p)
+
+
+def index_games(conn: sqlite3.Connection, videos: sqlite3.Connection) -> tuple[int, int]:
+    """增量索引 games，返回 (写入条数, 删除条数)。"""
+    mark = _watermark(conn, "games")
+    latest = mark
+    written = 0
+    rows = videos.execute(
+        f"""
+        SELECT id, game_name, title, gameplay_analysis, description, monitor_date, {GAMES_STAMP_SQL} AS stamp
+        FROM games
+        WHERE {GAMES_STAMP_SQL} >= ?
+        """,
+        (mark,),
+    )
+    for game_id, game_name, title, analysis, description, monitor_date, stamp in rows:
+        _upsert(conn, "games", str(game_id), None, monitor_date, _join(game_name, title), _join(analysis, description))
+        latest = max(latest, stamp)
+        written += 1
+    removed = _prune(conn, "games", {str(r[0]) for r in videos.execute("SELECT id FROM games")})
+    _set_watermark(conn, "games", latest)
+    return written, removed
+
+
+def index_weekly_reports(conn: sqlite3.Connection, competitor: sqlite3.Connection) -> tuple[int, int]:
+    """增量索引 weekly_reports，返回 (写入条数, 删除条数)。"""
+    mark = _watermark(conn, "weekly_reports")
+    latest = mark
+    written = 0
+    rows = competitor.execute(
+        """
+        SELECT id, company_name, start_date, end_date, report_content, created_at
+        FROM weekly_reports
+        WHERE created_at >= ?
+        """,
+        (mark,),
+    )
+    for report_id, company, start_date, end_date, content, created_at in rows:
+        _upsert(
+            conn, "weekly_reports", str(report_id), company, start_date, f"{company} {start_date}~{end_date}", content
+        )
+        latest = max(latest, created_at)
+        written += 1
+    removed = _prune(conn, "weekly_reports", {str(r[0]) for r in competitor.execute("SELECT id FROM weekly_reports")})
+    _set_watermark(conn, "weekly_reports", latest)
+    return written, removed
+
+
+def _post_key(post: dict) -> str:
+    """帖子去重键：平台帖子 ID，其次链接，都没有时为文本哈希（与 competitor_store 的正文去重一致）。"""
+    key = post.get("id") or post.get("post_url") or post.get("link")
+    if key:
+        return str(key)
+    return hashlib.sha256(str(post.get("text", "")).encode("utf-8")).hexdigest()[:16]
+
+
+def _fetches(competitor: sqlite3.Connection, company: str, table: str, mark: str):
+    """某公司水位之后的抓取：(game, fetched_at, posts_json)，统一存储存在时直接读帖子表。"""
+    if is_table(competitor, RAW_TABLE):
+        return competitor.execute(
+            f"""
+            SELECT r.game, r.fetched_at, json_group_array(json(p.post))
+            FROM {RAW_TABLE} r
+            JOIN competitor_posts p ON p.raw_id = r.id
+            WHERE r.company_name = ? AND r.fetched_at >= ?
+            GROUP BY r.id
+            ORDER BY r.fetched_at
+            """,
+            (company, mark),
+        )
+    return competitor.execute(
+        f'SELECT game, fetched_at, posts_json FROM "{table}" WHERE fetched_at >= ? ORDER BY fetched_at',
+        (mark,),
+    )
+
+
+def index_posts(conn: sqlite3.Connection, competitor: sqlite3.Connection) -> tuple[int, int]:
+    """增量索引各公司的帖子，返回 (写入条数, 0)。"""
+    written = 0
+    for company, table in company_tables(competitor):
+        source = f"posts:{company}"
+        mark = _watermark(conn, source)
+        latest = mark
+        for game, fetched_at, posts_json in _fetches(competitor, company, table, mark):
+            latest = max(latest, fetched_at)
+            try:
+                posts = json.loads(posts_json or "[]")
+            except ValueError:
+                continue
+            for post in posts:
+                if not isinstance(post, dict) or not (post.get("text") or post.get("title")):
+                    continue
+                _upsert(
+                    conn,
+                    "posts",
+                    f"{company}|{_post_key(post)}",
+                    company,
+                    str(post.get("published_at") or post.get("time") or fetched_at)[:10],
+                    _join(post.get("title"), game),
+                    post.get("text") or "",
+                )
+                written += 1
+        _set_watermark(conn, source, latest)
+    return written, 0
+
+
+def build(conn: sqlite3.Connection, videos_db: Path, competitor_db: Path, full: bool = False) -> None:
+    """按来源增量构建（每个来源一个事务）；--full 时清空索引与水位后重建并 optimize。"""
+    if full:
+        with conn:
+            conn.execute("DELETE FROM search_fts")
+            conn.execute("DELETE FROM search_items")
+            conn.execute("DELETE FROM search_watermarks")
+    jobs = [
+        ("games", videos_db, index_games),
+        ("weekly_reports", competitor_db, index_weekly_reports),
+        ("posts", competitor_db, index_posts),
+    ]
+    for name, db, job in jobs:
+        if not db.exists():
+            print(f"[跳过] {db.name} 不存在: {db}", file=sys.stderr)
+            continue
+        src = connect_readonly(db)
+        start = time.perf_counter()
+        try:
+            with conn:
+                written, removed = job(conn, src)
+        except sqlite3.OperationalError as e:
+            print(f"[{name}] 读取失败，已跳过：{e}", file=sys.stderr)
+            continue
+        finally:
+            src.close()
+        print(f"[{name}] 写入 {written} 条，删除 {removed} 条（{(time.perf_counter() - start) * 1000:.0f} ms）")
+    if full:
+        conn.execute("INSERT INTO search_fts (search_fts) VALUES ('optimize')")
+        conn.commit()
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _manual_snippet(text: str, terms: list[str], width: int = 40) -> str:
+    """LIKE 检索时的片段：取第一个命中词前后各 width 个字，命中词用【】标出。"""
+    lower = text.lower()
+    hits = [lower.find(t.lower()) for t in terms]
+    hits = [h for h in hits if h >= 0]
+    if not hits:
+        return text[: width * 2].replace("\n", " ")
+    start = max(0, min(hits) - width)
+    piece = text[start : min(hits) + width].replace("\n", " ")
+    for t in terms:
+        idx = piece.lower().find(t.lower())
+        if idx >= 0:
+            piece = piece[:idx] + "【" + piece[idx : idx + len(t)] + "】" + piece[idx + len(t) :]
+    return ("…" if start else "") + piece + "…"
+
+
+def query(conn: sqlite3.Connection, text: str, source: str | None = None, limit: int = 10) -> list[dict]:
+    """检索：返回 [{source, ref, company, date, title, snippet}]，按相关度（或日期）排序。"""
+    terms = text.split()
+    if not terms:
+        return []
+    long_terms = [t for t in terms if len(t) >= 3]
+    short_terms = [t for t in terms if len(t) < 3]
+    where, params = [], []
+    if long_terms:
+        where.append("search_fts MATCH ?")
+        params.append(" AND ".join(_fts_phrase(t) for t in long_terms))
+    for t in short_terms:
+        where.append("(title LIKE ? ESCAPE '\\' OR body LIKE ? ESCAPE '\\')")
+        params += [_like_pattern(t)] * 2
+    if source:
+        where.append("source = ?")
+        params.append(source)
+    if long_terms:
+        select = f"snippet(search_fts, 5, '【', '】', '…', {SNIPPET_TOKENS}) AS snip, title"
+        order = f"bm25(search_fts, {BM25_WEIGHTS})"
+    else:
+        select = "body, title"
+        order = "date DESC"
+    rows = conn.execute(
+        f"""
+        SELECT source, ref, company, date, {select}
+        FROM search_fts
+        WHERE {' AND '.join(where)}
+        ORDER BY {order}
+        LIMIT ?
+        """,
+        (*params, limit),
+    ).fetchall()
+    results = []
+    for src, ref, company, date, snip, title in rows:
+        if not long_terms:
+            snip = _manual_snippet(snip, terms)
+        results.append(
+            {"source": src, "ref": ref, "company": company, "date": date, "title": title, "snippet": snip}
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="videos.db / competitor_data.db 的 FTS5 全文索引：构建与检索")
+    parser.add_argument("command", choices=["build", "query"], help="build 增量构建索引；query 检索")
+    parser.add_argument("text", nargs="?", default="", help="检索词（query 时必填，多个词用空格分开）")
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX, help="索引库路径")
+    parser.add_argument("--videos-db", type=Path, default=Path("public/videos.db"), help="videos.db 路径")
+    parser.add_argument(
+        "--competitor-db",
+        type=Path,
+        default=Path("public/competitor_data.db"),
+        help="competitor_data.db 路径",
+    )
+    parser.add_argument("--full", action="store_true", help="清空索引与水位后全量重建")
+    parser.add_argument("--source", choices=SOURCES, default=None, help="只检索某一来源")
+    parser.add_argument("--limit", type=int, default=10, help="最多返回条数")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        conn = open_index(args.index)
+        try:
+            build(conn, args.videos_db, args.competitor_db, full=args.full)
+        finally:
+            conn.close()
+        return 0
+
+    if not args.text.strip():
+        parser.error("query 需要检索词")
+    if not args.index.exists():
+        print(f"错误：索引不存在 {args.index}，请先运行 build")
+        return 1
+    conn = connect_readonly(args.index)
+    try:
+        start = time.perf_counter()
+        results = query(conn, args.text, args.source, args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+    finally:
+        conn.close()
+    for r in results:
+        who = f" · {r['company']}" if r["company"] else ""
+        print(f"[{r['source']}{who}] {r['date'] or ''}  {r['title'].splitlines()[0] if r['title'] else ''}")
+        print(f"    {r['snippet']}")
+    print(f"共 {len(results)} 条（{elapsed:.1f} ms）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,23 +10,31 @@
      - pip install -r requirements.txt
   3. 运行脚本，例如：
      - python scripts/send_ai_competitor_digest.py
+     - python scripts/send_ai_competitor_digest.py --delta
      - 或指定文件：
        python scripts/send_ai_competitor_digest.py --file public/ai产品/竞品动态报告_AI产品.md
 
 说明：
-  - 使用标准库 urllib 发送 HTTP 请求，加载 .env 依赖 python-dotenv。
+  - 通过 webhook_delivery 发送（标准库 http.client 长连接、并发、重试），加载 .env 依赖 python-dotenv。
+  - 消息先写入发件箱（report_outbox），重跑只补发失败的消息，同一天同一内容不会重复发送。
+  - --delta：只发送与上次成功推送的版本相比新增 / 变化的章节与表格行（见 report_delta.py），
+    首次推送或变化较大时发全文，内容无变化时不发送。
 """
 
 import argparse
-import json
 import os
 import sys
-import urllib.error
-import urllib.request
+from datetime import date
 from pathlib import Path
 
 from dotenv import load_dotenv
 
+import report_delta
+import report_metrics
+from report_markdown import split_for_wecom
+from report_outbox import DEFAULT_OUTBOX, enqueue, flush, open_outbox
+from webhook_delivery import WECOM_RATE_LIMITER, Channel, feishu_card_payload, wecom_markdown_payload
+
 
 def read_report(path: Path) -> str:
     """读取 Markdown 报告内容并返回字符串。"""
@@ -36,80 +44,31 @@ def read_report(path: Path) -> str:
     return content.strip()
 
 
-def post_json(url: str, payload: dict) -> tuple[int, str]:
-    """向指定 URL 发送 JSON 请求，返回 (status_code, response_text)。"""
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        url,
-        data=data,
-        headers={"Content-Type": "application/json; charset=utf-8"},
-        method="POST",
-    )
-    try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            resp_text = resp.read().decode("utf-8", errors="ignore")
-            return resp.getcode(), resp_text
-    except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8", errors="ignore")
-        return e.code, body
-    except urllib.error.URLError as e:
-        return 0, f"URL error: {e}"
-
-
-def send_to_feishu(webhook: str, text: str) -> None:
-    """通过飞书机器人发送卡片消息（interactive card）。"""
-    # 把 Markdown 第一行标题拿出来作为卡片标题（例如：# AI 竞品动态报告（本周简要版））
+def card_title(text: str) -> str:
+    """把 Markdown 第一行标题拿出来作为卡片标题（例如：# AI 竞品动态报告（本周简要版））。"""
     title = "AI 竞品动态报告"
-    lines = text.splitlines()
-    for line in lines:
+    for line in text.splitlines():
         l = line.strip()
         if l.startswith("#"):
             # 去掉开头的井号和空格
             title = l.lstrip("#").strip() or title
             break
+    return title
+
 
-    payload = {
-        "msg_type": "interactive",
-        "card": {
-            "config": {
-                "wide_screen_mode": True,
-            },
-            "header": {
-                "title": {
-                    "tag": "plain_text",
-                    "content": title,
-                },
-                "template": "blue",
-            },
-            "elements": [
-                {
-                    # 直接把简报 Markdown 内容作为一个 markdown 元素展示
-                    "tag": "markdown",
-                    "content": text,
-                },
-            ],
-        },
-    }
-    status, resp_text = post_json(webhook, payload)
-    if status != 200:
-        print(f"[飞书] 发送失败，status={status}, resp={resp_text}", file=sys.stderr)
-    else:
-        print("[飞书] 发送成功")
-
-
-def send_to_wechat(webhook: str, text: str) -> None:
-    """通过企业微信机器人发送 Markdown 消息。"""
-    payload = {
-        "msgtype": "markdown",
-        "markdown": {
-            "content": text,
-        },
-    }
-    status, resp_text = post_json(webhook, payload)
-    if status != 200:
-        print(f"[企业微信] 发送失败，status={status}, resp={resp_text}", file=sys.stderr)
-    else:
-        print("[企业微信] 发送成功")
+def feishu_channel(webhook: str, text: str) -> Channel:
+    """飞书机器人卡片消息（interactive card），简报 Markdown 直接作为 markdown 元素展示。"""
+    return Channel("飞书", webhook, [feishu_card_payload(card_title(text), text)])
+
+
+def wechat_channel(webhook: str, text: str) -> Channel:
+    """企业微信机器人 Markdown 消息：超过 4096 字节时按章节/表格行拆成多条（避免 40058），按机器人限流。"""
+    return Channel(
+        "企业微信",
+        webhook,
+        [wecom_markdown_payload(chunk) for chunk in split_for_wecom(text)],
+        rate_limiter=WECOM_RATE_LIMITER,
+    )
 
 
 def main() -> None:
@@ -120,8 +79,27 @@ def main() -> None:
         default="public/ai产品/竞品动态报告_AI产品.md",
         help="要发送的 Markdown 报告文件路径（相对仓库根目录）",
     )
+    parser.add_argument(
+        "--outbox",
+        type=Path,
+        default=DEFAULT_OUTBOX,
+        help="发件箱 SQLite 路径（记录每条消息的投递状态）",
+    )
+    parser.add_argument(
+        "--period",
+        default=date.today().isoformat(),
+        help="本次推送的周期标识（参与幂等键），默认当天日期",
+    )
+    report_delta.add_arguments(parser)
+    report_metrics.add_arguments(parser)
     args = parser.parse_args()
 
+    with report_metrics.session("send_ai_competitor_digest", args.metrics_dir, args.profile):
+        send(args)
+
+
+def send(args) -> None:
+    """读取简报并推送；失败时以退出码 1 结束。"""
     # 仓库根目录（scripts/ 的上一级）
     repo_root = Path(__file__).resolve().parents[1]
 
@@ -133,7 +111,9 @@ def main() -> None:
     report_path = (repo_root / args.file).resolve()
 
     try:
-        text = read_report(report_path)
+        with report_metrics.timed("stage", "read_report") as m:
+            text = read_report(report_path)
+            m["bytes"] = len(text.encode("utf-8"))
     except Exception as e:  # noqa: BLE001
         print(f"读取报告失败：{e}", file=sys.stderr)
         sys.exit(1)
@@ -159,13 +139,33 @@ def main() -> None:
         )
         sys.exit(1)
 
-    # 为了兼容机器人长度限制和展示效果，这里可以酌情截断或直接发送全文。
-    # 目前报告已是极简版，默认直接发送全文。
-    if feishu_webhook:
-        send_to_feishu(feishu_webhook, text)
-
-    if wechat_webhook:
-        send_to_wechat(wechat_webhook, text)
+    # 飞书发一张完整卡片；企业微信超过单条 4096 字节时按章节/表格行拆成多条（见 wechat_channel），不截断。
+    # 两个渠道并发发送。
+    # 先入发件箱再投递：重跑时已成功的消息不会重复发送，只补发失败的
+    outbox = open_outbox(args.outbox)
+    try:
+        message = text
+        if args.delta:
+            mode, message = report_delta.choose_message(
+                outbox, "ai_competitor_digest", card_title(text), text, args.delta_max_ratio
+            )
+            if mode == "unchanged":
+                print("简报与上次推送的版本一致，本次不发送")
+                return
+            print("增量模式：发送" + ("与上次推送相比的更新" if mode == "delta" else "全文"))
+        channels = []
+        if feishu_webhook:
+            channels.append(feishu_channel(feishu_webhook, message))
+        if wechat_webhook:
+            channels.append(wechat_channel(wechat_webhook, message))
+        for channel in channels:
+            enqueue(outbox, "ai_competitor_digest", args.period, channel)
+        _, failed = flush(outbox, reports=[("ai_competitor_digest", args.period)])
+        report_delta.record_delivered(outbox, "ai_competitor_digest", args.period, text)
+    finally:
+        outbox.close()
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,23 @@
 #!/usr/bin/env python3
 """
 按前端「休闲游戏检测」中两个小游戏周报的格式构建内容，并发送到飞书和企业微信：
-  1. 微信/抖音小游戏周报（来自 public/videos.db 的 weekly_report_simple）
+  1. 微信/抖音小游戏周报（来自 public/videos.db 的 weekly_report_simple；默认最新一周，
+     --week 指定周次，--backfill 一次渲染全部周次，周次按补零后的周起始日期在 SQL 里解析）
   2. SensorTower 周报（来自 public/sensortower_top100.db 的 rank_changes）
 
+两个周报是 report_sources 注册表里的数据源，并行构建、各自超时（--source-timeout），
+按注册顺序合并为一条；超时或出错的数据源打印警告后跳过，其余照常发送。
+--sources 可选择数据源，例如追加 ai_competitor_digest（AI 竞品简报 Markdown 文件，默认不启用）。
+
 飞书：发一条互动卡片（interactive card，内容为 Markdown）。
-企业微信：发一条 Markdown 消息。
+企业微信：Markdown 消息，按章节与表格行打包成尽量少的条数（单条 ≤4096 字节，表格续页重复表头）。
+各周报先构建为 report_model.Report，每条消息只渲染一次 Markdown，飞书卡片与企业微信分条由它派生；
+渲染结果按报表数据哈希缓存在 --render-cache（默认 .report_state/render_cache），数据未变时不再渲染。
+两个渠道通过 webhook_delivery 并发发送（长连接复用、临时失败重试、企业微信限流）。
+--delta：只发送与上次成功推送的版本相比新增 / 变化的章节与表格行（见 report_delta.py），
+首次推送或变化较大时发全文，内容无变化时不发送。
+每条消息先写入发件箱（report_outbox，幂等键 = 报表类型 + 周期 + 内容哈希），
+重跑脚本只会补发失败的消息；也可用 python scripts/report_outbox.py flush / status 单独补发、查看。
 
 环境变量（.env 或系统环境）：
   - FEISHU_WEBHOOK_URL：飞书自定义机器人 Webhook
@@ -14,18 +26,49 @@
 使用方式（在项目根目录）：
   python scripts/send_minigame_weekly_reports.py
   python scripts/send_minigame_weekly_reports.py --videos-db public/videos.db --sensortower-db public/sensortower_top100.db
+  python scripts/send_minigame_weekly_reports.py --week 2026-1-26 --dry-run
+  python scripts/send_minigame_weekly_reports.py --backfill --dry-run
+  python scripts/send_minigame_weekly_reports.py --delta
+  python scripts/send_minigame_weekly_reports.py --sources wechat_douyin,sensortower,ai_competitor_digest --dry-run
 """
 
 import argparse
-import json
 import os
-import re
 import sqlite3
 import sys
-import urllib.error
-import urllib.request
+from datetime import date
+from itertools import groupby
 from pathlib import Path
 
+import report_delta
+import report_metrics
+from generate_sensortower_weekly_report import sensortower_week_report
+from report_db import SensorTowerQueries, connect_readonly
+from report_markdown import split_for_wecom
+from report_model import (
+    BulletList,
+    Heading,
+    Paragraph,
+    RenderCache,
+    Report,
+    Rule,
+    combine,
+    from_markdown,
+    render,
+    render_markdown,
+)
+from report_outbox import DEFAULT_OUTBOX, enqueue, flush, open_outbox
+from report_sources import REGISTRY, SourceContext, build_sources, register_source, select_sources
+from weekly_rankings_diff import normalize_date, week_start_sql
+from webhook_delivery import (
+    WECOM_RATE_LIMITER,
+    Channel,
+    deliver,
+    feishu_card_payload,
+    print_results,
+    wecom_markdown_payload,
+)
+
 try:
     from dotenv import load_dotenv
 except ImportError:
@@ -60,328 +103,262 @@ def _load_env(repo_root: Path) -> None:
 
 DETAIL_LINK = "https://olivr-hzk.github.io/monitor-web/"
 WEEKLY_BRIEF_PLATFORM = {"wx": "微信小游戏", "dy": "抖音小游戏"}
+SEND_TARGETS = ["markdown", "feishu", "wecom"]
+MINIGAME_TITLE = "小游戏周报（微信/抖音 + SensorTower）"
 
 
 # ---------- 微信/抖音小游戏周报（与前端 reportsLoader.loadWeeklyBriefFromDb 一致）----------
-def build_wechat_douyin_weekly_md(conn: sqlite3.Connection) -> str | None:
-    """从 weekly_report_simple 取最新一周，生成与前端一致的周报 Markdown。"""
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            """
-            SELECT week_range, platform, game_name, change_type, rank, rank_change
-            FROM weekly_report_simple
-            WHERE platform IN ('wx', 'dy')
-            ORDER BY week_range DESC, platform, change_type, CAST(rank AS INTEGER)
+@report_metrics.timed_query
+def wechat_douyin_weeks(conn: sqlite3.Connection) -> list[tuple[str, str]]:
+    """weekly_report_simple 中有微信/抖音数据的全部周次：[(week_start, week_range)]，按周起始日期升序。"""
+    key = week_start_sql(conn)
+    return conn.execute(
+        f"""
+        SELECT {key} AS week_key, MIN(w.week_range)
+        FROM weekly_report_simple w
+        WHERE w.platform IN ('wx', 'dy') AND w.week_range != ''
+        GROUP BY week_key
+        ORDER BY week_key
+        """
+    ).fetchall()
+
+
+@report_metrics.timed_query
+def resolve_week(conn: sqlite3.Connection, week: str | None = None) -> tuple[str, str] | None:
+    """在 SQL 里按可排序的周起始日期选周：week 为空取最新一周，否则按起始日期匹配。
+
+    week 可以是 week_range（如 2026-1-26~2026-2-1）或起始日期（2026-1-26 / 2026-01-26）。
+    返回 (week_start, week_range)，找不到返回 None。
+    """
+    key = week_start_sql(conn)
+    if week is None:
+        return conn.execute(
+            f"""
+            SELECT {key}, w.week_range
+            FROM weekly_report_simple w
+            WHERE w.platform IN ('wx', 'dy') AND w.week_range != ''
+            ORDER BY {key} DESC
+            LIMIT 1
             """
-        )
-        rows = [
-            {
-                "week_range": r[0],
-                "platform": r[1],
-                "game_name": r[2],
-                "change_type": r[3],
-                "rank": r[4],
-                "rank_change": r[5],
-            }
-            for r in cur.fetchall()
-        ]
-    except sqlite3.OperationalError as e:
-        print(f"[微信/抖音] 读取 weekly_report_simple 失败: {e}", file=sys.stderr)
+        ).fetchone()
+    week_start = normalize_date(week.split("~")[0])
+    if not week_start:
         return None
+    return conn.execute(
+        f"""
+        SELECT {key}, w.week_range
+        FROM weekly_report_simple w
+        WHERE {key} = ? AND w.platform IN ('wx', 'dy')
+        LIMIT 1
+        """,
+        (week_start,),
+    ).fetchone()
+
+
+@report_metrics.timed_query
+def _wechat_douyin_rows(conn: sqlite3.Connection, week_start: str | None = None):
+    """逐行读取某一周（week_start 为空时为全部周次）的微信/抖音记录，按周次、平台、类型、排名排序。"""
+    key = week_start_sql(conn)
+    where = f"AND {key} = ?" if week_start else ""
+    return conn.execute(
+        f"""
+        SELECT {key} AS week_key, w.week_range, w.platform, w.game_name, w.change_type, w.rank, w.rank_change
+        FROM weekly_report_simple w
+        WHERE w.platform IN ('wx', 'dy') AND w.week_range != '' {where}
+        ORDER BY week_key, w.platform, w.change_type, CAST(w.rank AS INTEGER)
+        """,
+        (week_start,) if week_start else (),
+    )
 
-    if not rows:
-        return None
 
-    by_week: dict[str, list] = {}
-    for r in rows:
-        w = r["week_range"] or ""
-        if not w:
-            continue
-        if w not in by_week:
-            by_week[w] = []
-        by_week[w].append(r)
-
-    # 取最新一周
-    latest_week = max(by_week.keys())
-    week_rows = by_week[latest_week]
-    new_in = [r for r in week_rows if r["change_type"] == "新进榜"]
-    surge = [r for r in week_rows if r["change_type"] == "飙升"]
-
-    lines = [
-        f"# 周报简要 {latest_week}",
-        "",
-        f"**监控时间**：{latest_week}",
-        "",
+def wechat_douyin_report(week_range: str, rows: list[tuple], title: str | None = None) -> Report:
+    """把一周的 (platform, game_name, change_type, rank, rank_change) 构建为与前端一致的周报结构。"""
+    new_in = [r for r in rows if r[2] == "新进榜"]
+    surge = [r for r in rows if r[2] == "飙升"]
+
+    blocks = [
+        Heading(f"周报简要 {week_range}", 1),
+        Paragraph(f"**监控时间**：{week_range}"),
     ]
     if new_in:
-        lines.append("## 本周新进榜")
-        lines.append("")
-        for r in new_in:
-            label = WEEKLY_BRIEF_PLATFORM.get(r["platform"], r["platform"])
-            lines.append(f"- **{r['game_name']}**（{label}）")
-        lines.append("")
+        blocks.append(Heading("本周新进榜"))
+        blocks.append(
+            BulletList(
+                [
+                    f"**{game_name}**（{WEEKLY_BRIEF_PLATFORM.get(platform, platform)}）"
+                    for platform, game_name, _, _, _ in new_in
+                ]
+            )
+        )
     if surge:
-        lines.append("## 本周排名飙升")
-        lines.append("")
-        for r in surge:
-            label = WEEKLY_BRIEF_PLATFORM.get(r["platform"], r["platform"])
-            lines.append(f"- **{r['game_name']}**（{label}，排名变化 {r['rank_change']}）")
-        lines.append("")
+        blocks.append(Heading("本周排名飙升"))
+        blocks.append(
+            BulletList(
+                [
+                    f"**{game_name}**（{WEEKLY_BRIEF_PLATFORM.get(platform, platform)}，排名变化 {rank_change}）"
+                    for platform, game_name, _, _, rank_change in surge
+                ]
+            )
+        )
     if not new_in and not surge:
-        lines.append("该周暂无新进榜或排名飙升记录。")
-        lines.append("")
-    lines.append("---")
-    lines.append("")
-    lines.append(f"详细玩法请登录 [监测汇总平台]({DETAIL_LINK}) 查看。")
-    return "\n".join(lines)
+        blocks.append(Paragraph("该周暂无新进榜或排名飙升记录。"))
+    blocks.append(Rule())
+    return Report(
+        title or f"周报简要 {week_range}",
+        blocks,
+        footer=f"详细玩法请登录 [监测汇总平台]({DETAIL_LINK}) 查看。",
+    )
 
 
-# ---------- SensorTower 周报（与前端 sensortowerWeeklyReport + generate_sensortower_weekly_report 一致）----------
-def _parse_surge(change: str) -> int:
-    if not change or change == "NEW":
-        return 0
-    m = re.search(r"↑\s*(\d+)", str(change).strip())
-    return int(m.group(1)) if m else 0
+def render_wechat_douyin_md(week_range: str, rows: list[tuple]) -> str:
+    """把一周的 (platform, game_name, change_type, rank, rank_change) 渲染为与前端一致的周报 Markdown。"""
+    return render_markdown(wechat_douyin_report(week_range, rows))
+
 
+def build_wechat_douyin_weekly_report(conn: sqlite3.Connection, week: str | None = None) -> Report | None:
+    """从 weekly_report_simple 取最新一周（或指定 week），构建与前端一致的周报。
 
-def _fmt_num(n) -> str:
-    if n is None:
-        return "—"
+    周次在 SQL 里按补零后的周起始日期解析与排序，只有选中那一周的行会被读出。
+    """
     try:
-        n = int(n)
-    except (TypeError, ValueError):
-        return str(n)
-    if n >= 10000:
-        return f"{n / 10000:.2f}万"
-    return f"{n:,}"
+        resolved = resolve_week(conn, week)
+        if not resolved:
+            return None
+        week_start, week_range = resolved
+        rows = [r[2:] for r in _wechat_douyin_rows(conn, week_start)]
+    except sqlite3.OperationalError as e:
+        print(f"[微信/抖音] 读取 weekly_report_simple 失败: {e}", file=sys.stderr)
+        return None
+    return wechat_douyin_report(week_range, rows)
 
 
-def _fmt_revenue(r) -> str:
-    if r is None:
-        return "—"
+def build_wechat_douyin_weekly_md(conn: sqlite3.Connection, week: str | None = None) -> str | None:
+    """同 build_wechat_douyin_weekly_report，直接返回 Markdown。"""
+    report = build_wechat_douyin_weekly_report(conn, week)
+    return render_markdown(report) if report else None
+
+
+def build_wechat_douyin_backfill_reports(conn: sqlite3.Connection) -> list[tuple[str, Report]]:
+    """一次查询按周构建全部周次：[(week_start, 周报)]，按周起始日期升序。"""
     try:
-        r = float(r)
-    except (TypeError, ValueError):
-        return str(r)
-    if r >= 10000:
-        return f"${r / 10000:.2f}万"
-    return f"${r:,.0f}"
+        cur = _wechat_douyin_rows(conn)
+        reports = []
+        for week_start, group in groupby(cur, key=lambda r: r[0]):
+            rows = list(group)
+            title = f"微信/抖音小游戏周报 {week_start}"
+            reports.append((week_start, wechat_douyin_report(rows[0][1], [r[2:] for r in rows], title)))
+        return reports
+    except sqlite3.OperationalError as e:
+        print(f"[微信/抖音] 读取 weekly_report_simple 失败: {e}", file=sys.stderr)
+        return []
 
 
-def build_sensortower_weekly_md(conn: sqlite3.Connection) -> str | None:
-    """从 rank_changes 取最新一周，生成与前端一致的 SensorTower 周报 Markdown。"""
-    cur = conn.cursor()
+def build_wechat_douyin_backfill_md(conn: sqlite3.Connection) -> list[tuple[str, str]]:
+    """同 build_wechat_douyin_backfill_reports，直接返回 [(week_start, markdown)]。"""
+    return [(week_start, render_markdown(r)) for week_start, r in build_wechat_douyin_backfill_reports(conn)]
+
+
+# ---------- SensorTower 周报（与前端 sensortowerWeeklyReport + generate_sensortower_weekly_report 一致）----------
+def build_sensortower_weekly_report(conn: sqlite3.Connection) -> Report | None:
+    """从 rank_changes 取最新一周，构建与前端一致的 SensorTower 周报。"""
+    queries = SensorTowerQueries(conn)
     try:
-        cur.execute(
-            """
-            SELECT DISTINCT rank_date_current, rank_date_last
-            FROM rank_changes
-            ORDER BY rank_date_current DESC
-            LIMIT 1
-            """
-        )
-        row = cur.fetchone()
-        if not row:
-            return None
-        rank_date_current, rank_date_last = row[0], row[1] or ""
+        latest = queries.latest_week()
     except sqlite3.OperationalError as e:
         print(f"[SensorTower] 读取 rank_changes 失败: {e}", file=sys.stderr)
         return None
-
-    cur.execute(
-        """
-        SELECT
-            r.current_rank,
-            r.last_week_rank,
-            r.change,
-            r.app_id,
-            r.country,
-            r.platform,
-            r.downloads,
-            r.revenue,
-            COALESCE(m.name, r.app_name, r.app_id) AS display_name,
-            COALESCE(NULLIF(TRIM(r.publisher_name), ''), m.publisher_name) AS publisher_name
-        FROM rank_changes r
-        LEFT JOIN app_metadata m ON m.app_id = r.app_id AND m.os = LOWER(r.platform)
-        WHERE r.rank_date_current = ?
-          AND r.change_type = '🆕 新进榜单'
-          AND r.current_rank <= 50
-        ORDER BY r.current_rank ASC, r.country, r.platform
-        """,
-        (rank_date_current,),
+    if not latest:
+        return None
+    rank_date_current, rank_date_last = latest
+
+    return sensortower_week_report(
+        rank_date_current,
+        rank_date_last,
+        queries.new_entries(rank_date_current),
+        queries.surge_top(rank_date_current),
+        title="SensorTower 周报",
+        footer=f"详情请进入 [监测汇总平台]({DETAIL_LINK}) 查看。",
     )
-    new_top50 = [
-        {
-            "current_rank": r[0],
-            "last_week_rank": r[1],
-            "change": r[2],
-            "app_id": r[3],
-            "country": r[4],
-            "platform": r[5],
-            "downloads": r[6],
-            "revenue": r[7],
-            "display_name": r[8] or r[3],
-            "publisher_name": r[9] or "—",
-        }
-        for r in cur.fetchall()
-    ]
 
-    cur.execute(
-        """
-        SELECT
-            r.current_rank,
-            r.last_week_rank,
-            r.change,
-            r.app_id,
-            r.country,
-            r.platform,
-            r.downloads,
-            r.revenue,
-            COALESCE(m.name, r.app_name, r.app_id) AS display_name,
-            COALESCE(NULLIF(TRIM(r.publisher_name), ''), m.publisher_name) AS publisher_name
-        FROM rank_changes r
-        LEFT JOIN app_metadata m ON m.app_id = r.app_id AND m.os = LOWER(r.platform)
-        WHERE r.rank_date_current = ?
-          AND r.change_type = '🚀 排名飙升'
-        ORDER BY r.current_rank ASC
-        """,
-        (rank_date_current,),
-    )
-    surge_rows = [
-        {
-            "current_rank": r[0],
-            "last_week_rank": r[1],
-            "change": r[2],
-            "surge_value": _parse_surge(r[2] or ""),
-            "app_id": r[3],
-            "country": r[4],
-            "platform": r[5],
-            "downloads": r[6],
-            "revenue": r[7],
-            "display_name": r[8] or r[3],
-            "publisher_name": r[9] or "—",
-        }
-        for r in cur.fetchall()
-    ]
-    surge_rows.sort(key=lambda x: (-x["surge_value"], x["current_rank"]))
-    surge_top10 = surge_rows[:10]
-
-    lines = [
-        f"# SensorTower 周报（{rank_date_current}）",
-        "",
-        f"**统计周期**：本周榜单日期 {rank_date_current}，对比上周 {rank_date_last}。",
-        "",
-        "---",
-        "",
-        "## 一、本周新进 Top50",
-        "",
-        "当周新进榜单且当前排名在 Top50 内的产品（按当前排名排序）：",
-        "",
-        "| 排名 | 产品名 | 开发者 | 国家/地区 | 平台 | 下载量 | 收入 |",
-        "|------|--------|--------|-----------|------|--------|------|",
-    ]
-    for row in new_top50:
-        lines.append(
-            f"| {row['current_rank']} | {row['display_name']} | {row['publisher_name']} | {row['country']} | {row['platform']} | "
-            f"{_fmt_num(row['downloads'])} | {_fmt_revenue(row['revenue'])} |"
-        )
-    if not new_top50:
-        lines.append("| — | 本周无新进 Top50 记录 | — | — | — | — | — |")
-    lines.extend([
-        "",
-        "---",
-        "",
-        "## 二、本周排名飙升 Top10",
-        "",
-        "当周排名飙升中，上升幅度最大的 10 款产品：",
-        "",
-        "| 当前排名 | 上周排名 | 上升幅度 | 产品名 | 开发者 | 国家/地区 | 平台 | 下载量 | 收入 |",
-        "|----------|----------|----------|--------|--------|-----------|------|--------|------|",
-    ])
-    for row in surge_top10:
-        lines.append(
-            f"| {row['current_rank']} | {row['last_week_rank']} | {row['change']} | {row['display_name']} | {row['publisher_name']} | "
-            f"{row['country']} | {row['platform']} | {_fmt_num(row['downloads'])} | {_fmt_revenue(row['revenue'])} |"
-        )
-    if not surge_top10:
-        lines.append("| — | — | — | 本周无排名飙升记录 | — | — | — | — | — |")
-    lines.append("")
-    lines.append(f"详情请进入 [监测汇总平台]({DETAIL_LINK}) 查看。")
-    return "\n".join(lines)
+
+def build_sensortower_weekly_md(conn: sqlite3.Connection) -> str | None:
+    """同 build_sensortower_weekly_report，直接返回 Markdown。"""
+    report = build_sensortower_weekly_report(conn)
+    return render_markdown(report) if report else None
+
+
+# ---------- 数据源（report_sources 注册表，按 order 顺序合并） ----------
+@register_source("wechat_douyin", "微信/抖音小游戏周报", order=10)
+def wechat_douyin_source(ctx: SourceContext) -> Report | None:
+    conn = ctx.connect("videos")
+    if conn is None:
+        return None
+    week = ctx.options.get("week")
+    report = build_wechat_douyin_weekly_report(conn, week)
+    if not report and week:
+        print(f"[微信/抖音] 未找到周次 {week}", file=sys.stderr)
+    return report
+
+
+@register_source("sensortower", "SensorTower 周报", order=20)
+def sensortower_source(ctx: SourceContext) -> Report | None:
+    conn = ctx.connect("sensortower")
+    if conn is None:
+        return None
+    return build_sensortower_weekly_report(conn)
+
+
+@register_source("ai_competitor_digest", "AI 竞品简报", order=30, default=False)
+def ai_competitor_digest_source(ctx: SourceContext) -> Report | None:
+    path = ctx.paths["ai_digest"]
+    if not path.exists():
+        print(f"[跳过] {path.name} 不存在: {path}", file=sys.stderr)
+        return None
+    text = path.read_text(encoding="utf-8").strip()
+    return from_markdown("AI 竞品简报", text) if text else None
+
+
+def build_minigame_report(
+    paths: dict[str, Path],
+    options: dict | None = None,
+    names: list[str] | None = None,
+    executor: str = "thread",
+    timeout: float | None = None,
+) -> Report | None:
+    """按 report_sources 注册表并行构建选中的数据源，合并为一份周报；没有任何内容时返回 None。
+
+    names 为 None 时用默认数据源，含未知名称时抛 ValueError（见 select_sources）。report_daemon.py 也经由这里构建。
+    """
+    built = build_sources(select_sources(names), paths, options, executor=executor, timeout=timeout)
+    parts = [report for _, report in built]
+    # 合并为一条：各周报用分隔线隔开
+    return combine(MINIGAME_TITLE, parts) if parts else None
 
 
 # ---------- 发送 ----------
-def _post_json(url: str, payload: dict) -> tuple[int, str]:
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        url,
-        data=data,
-        headers={"Content-Type": "application/json; charset=utf-8"},
-        method="POST",
-    )
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return resp.getcode(), resp.read().decode("utf-8", errors="ignore")
-    except urllib.error.HTTPError as e:
-        return e.code, e.read().decode("utf-8", errors="ignore")
-    except urllib.error.URLError as e:
-        return 0, str(e)
+def feishu_channel(webhook: str, title: str, md_content: str) -> Channel:
+    """飞书：一条互动卡片，标题 + Markdown 正文。"""
+    return Channel("飞书", webhook, [feishu_card_payload(title, md_content)])
 
 
 def send_feishu_card(webhook: str, title: str, md_content: str) -> None:
     """飞书：发一条互动卡片，标题 + Markdown 正文。"""
-    payload = {
-        "msg_type": "interactive",
-        "card": {
-            "config": {"wide_screen_mode": True},
-            "header": {
-                "title": {"tag": "plain_text", "content": title},
-                "template": "blue",
-            },
-            "elements": [{"tag": "markdown", "content": md_content}],
-        },
-    }
-    status, resp = _post_json(webhook, payload)
-    if status != 200:
-        print(f"[飞书] 发送失败 status={status} resp={resp}", file=sys.stderr)
-    else:
-        print("[飞书] 发送成功")
-
+    print_results(deliver([feishu_channel(webhook, title, md_content)]))
 
-# 企业微信机器人 Markdown 单条消息上限 4096 字节（UTF-8），超限会报 40058
-WECOM_MARKDOWN_MAX_BYTES = 4096
 
-
-def _truncate_for_wecom(md: str, max_bytes: int = WECOM_MARKDOWN_MAX_BYTES) -> str:
-    """将 Markdown 截断到不超过 max_bytes（UTF-8），末尾追加详见链接。"""
-    data = md.encode("utf-8")
-    if len(data) <= max_bytes:
-        return md
-    suffix = f"\n\n> 内容过长，详见 [监测汇总平台]({DETAIL_LINK}) 查看。"
-    suffix_bytes = suffix.encode("utf-8")
-    keep = max_bytes - len(suffix_bytes)
-    if keep <= 0:
-        return suffix.strip()
-    # 按字节截断，避免截断 UTF-8 多字节字符中间
-    chunk = data[:keep]
-    while chunk and (chunk[-1] & 0x80) and not (chunk[-1] & 0x40):
-        chunk = chunk[:-1]
-    return chunk.decode("utf-8", errors="ignore") + suffix
+def wecom_channel(webhook: str, md_content: str) -> Channel:
+    """企业微信：按章节与表格行打包成尽量少的 Markdown 消息（单条不超过 4096 字节），按机器人限流。"""
+    return Channel(
+        "企业微信",
+        webhook,
+        [wecom_markdown_payload(chunk) for chunk in split_for_wecom(md_content)],
+        rate_limiter=WECOM_RATE_LIMITER,
+    )
 
 
 def send_wecom_markdown(webhook: str, md_content: str) -> None:
-    """企业微信：发一条 Markdown 消息（单条不超过 4096 字节）。"""
-    content = _truncate_for_wecom(md_content)
-    payload = {
-        "msgtype": "markdown",
-        "markdown": {"content": content},
-    }
-    status, resp = _post_json(webhook, payload)
-    if status != 200:
-        print(f"[企业微信] 发送失败 status={status} resp={resp}", file=sys.stderr)
-    else:
-        print("[企业微信] 发送成功")
+    """企业微信：发送 Markdown，超过单条上限时拆成多条，不丢内容。"""
+    print_results(deliver([wecom_channel(webhook, md_content)]))
 
 
 def _clean_url(value: str | None) -> str | None:
@@ -412,53 +389,163 @@ def main() -> int:
         action="store_true",
         help="只构建内容并打印，不发送",
     )
+    parser.add_argument(
+        "--outbox",
+        type=Path,
+        default=DEFAULT_OUTBOX,
+        help="发件箱 SQLite 路径（记录每条消息的投递状态）",
+    )
+    parser.add_argument(
+        "--period",
+        default="{0}-W{1:02d}".format(*date.today().isocalendar()),
+        help="本次推送的周期标识（参与幂等键），默认当前 ISO 周，如 2026-W05",
+    )
+    parser.add_argument(
+        "--ai-digest",
+        type=Path,
+        default=Path("public/ai产品/竞品动态报告_AI产品.md"),
+        help="AI 竞品简报 Markdown 文件（数据源 ai_competitor_digest）",
+    )
+    parser.add_argument(
+        "--sources",
+        default=None,
+        help=f"逗号分隔的数据源，按注册顺序合并（可选：{', '.join(REGISTRY)}），默认 wechat_douyin,sensortower",
+    )
+    parser.add_argument(
+        "--source-timeout",
+        type=float,
+        default=None,
+        help="每个数据源的构建超时（秒），默认用各数据源自己的超时（60s）",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default="thread",
+        help="数据源并行方式：thread 线程池（默认）；process 进程池（超时的构建进程会被结束）",
+    )
+    week_group = parser.add_mutually_exclusive_group()
+    week_group.add_argument(
+        "--week",
+        default=None,
+        help="微信/抖音周报改用指定周次（week_range 或起始日期，如 2026-1-26），默认最新一周",
+    )
+    week_group.add_argument(
+        "--backfill",
+        action="store_true",
+        help="一次渲染全部周次的微信/抖音周报（每周一条，以周起始日期为周期；不含 SensorTower）",
+    )
+    parser.add_argument(
+        "--render-cache",
+        type=Path,
+        default=Path(".report_state/render_cache"),
+        help="渲染结果缓存目录（按报表数据哈希），相对路径基于项目根目录",
+    )
+    parser.add_argument(
+        "--no-render-cache",
+        action="store_true",
+        help="不读写渲染缓存",
+    )
+    report_delta.add_arguments(parser)
+    report_metrics.add_arguments(parser)
     args = parser.parse_args()
+    if args.delta and args.backfill:
+        parser.error("--delta 不能与 --backfill 同时使用（回填的每周报表各自独立，没有可比较的上次版本）")
 
+    with report_metrics.session("send_minigame_weekly_reports", args.metrics_dir, args.profile):
+        return run(args)
+
+
+def _delta_connection(outbox_path: Path, dry_run: bool) -> sqlite3.Connection | None:
+    """增量模式读取上次推送版本的连接；dry-run 时只读打开（发件箱不存在则视为首次推送）。"""
+    if not dry_run:
+        return open_outbox(outbox_path)
+    return connect_readonly(outbox_path) if outbox_path.exists() else None
+
+
+def run(args) -> int:
+    """构建并推送周报，返回退出码。"""
     repo_root = Path(__file__).resolve().parents[1]
     _load_env(repo_root)
 
-    videos_db = repo_root / args.videos_db if not args.videos_db.is_absolute() else args.videos_db
-    st_db = repo_root / args.sensortower_db if not args.sensortower_db.is_absolute() else args.sensortower_db
+    def resolve(p: Path) -> Path:
+        return p if p.is_absolute() else repo_root / p
 
-    parts: list[str] = []
+    paths = {
+        "videos": resolve(args.videos_db),
+        "sensortower": resolve(args.sensortower_db),
+        "ai_digest": resolve(args.ai_digest),
+    }
 
-    # 1) 微信/抖音小游戏周报
-    if videos_db.exists():
-        conn_wx = sqlite3.connect(str(videos_db))
-        try:
-            md_wx = build_wechat_douyin_weekly_md(conn_wx)
-            if md_wx:
-                parts.append(md_wx)
-        finally:
-            conn_wx.close()
+    # (报表类型, 周期, 报表)
+    reports: list[tuple[str, str, Report]] = []
+
+    if args.backfill:
+        # 微信/抖音全部周次，每周一条
+        if paths["videos"].exists():
+            conn_wx = connect_readonly(paths["videos"])
+            try:
+                for week_start, report in build_wechat_douyin_backfill_reports(conn_wx):
+                    reports.append(("minigame_weekly_wxdy", week_start, report))
+            finally:
+                conn_wx.close()
+        else:
+            print(f"[跳过] videos.db 不存在: {paths['videos']}", file=sys.stderr)
     else:
-        print(f"[跳过] videos.db 不存在: {videos_db}", file=sys.stderr)
-
-    # 2) SensorTower 周报
-    if st_db.exists():
-        conn_st = sqlite3.connect(str(st_db))
+        # 各数据源并行构建，按注册顺序合并
         try:
-            md_st = build_sensortower_weekly_md(conn_st)
-            if md_st:
-                parts.append(md_st)
-        finally:
-            conn_st.close()
-    else:
-        print(f"[跳过] sensortower_top100.db 不存在: {st_db}", file=sys.stderr)
-
-    if not parts:
+            report = build_minigame_report(
+                paths,
+                {"week": args.week},
+                args.sources.split(",") if args.sources else None,
+                executor=args.executor,
+                timeout=args.source_timeout,
+            )
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        if report:
+            reports.append(("minigame_weekly", args.period, report))
+
+    if not reports:
         print("未生成任何周报内容，请检查数据库与表结构。", file=sys.stderr)
         return 1
 
-    # 合并为一条：两个周报用分隔线隔开
-    combined_md = "\n\n---\n\n".join(parts)
-    card_title = "小游戏周报（微信/抖音 + SensorTower）"
+    # 每个报表只渲染一次 Markdown，飞书卡片与企业微信分条都由它派生；数据未变时直接读渲染缓存
+    cache = None if args.no_render_cache else RenderCache(resolve(args.render_cache))
+    # (报表类型, 周期, 卡片标题, 各目标渲染结果, 报表全文)
+    messages: list[tuple[str, str, str, dict, str]] = []
+    delta_conn = _delta_connection(args.outbox, args.dry_run) if args.delta else None
+    try:
+        for report_type, period, report in reports:
+            outputs = render(report, SEND_TARGETS, cache)
+            full_md = outputs["markdown"]
+            title = report.title
+            if args.delta:
+                # 增量模式：与上次成功推送的版本比较，只发送变化的章节与表格行
+                mode, delta_md = report_delta.choose_message(
+                    delta_conn, report_type, title, full_md, args.delta_max_ratio
+                )
+                if mode == "unchanged":
+                    print(f"[{report_type}] 与上次推送的版本一致，本次不发送")
+                    continue
+                if mode == "delta":
+                    title = f"{title}（更新）"
+                    outputs = render(from_markdown(title, delta_md), SEND_TARGETS, cache)
+            messages.append((report_type, period, title, outputs, full_md))
+    finally:
+        if delta_conn is not None:
+            delta_conn.close()
+    if not messages:
+        return 0
 
     if args.dry_run:
         print("=== 构建结果（dry-run，不发送）===")
-        print(f"标题: {card_title}")
-        print("---")
-        print(combined_md)
+        for i, (_, _, title, outputs, _) in enumerate(messages):
+            if i:
+                print()
+            print(f"标题: {title}")
+            print("---")
+            print(outputs["markdown"])
         return 0
 
     feishu = _clean_url(os.environ.get("FEISHU_WEBHOOK_URL"))
@@ -470,14 +557,23 @@ def main() -> int:
         )
         return 1
 
-    if feishu:
-        send_feishu_card(feishu, card_title, combined_md)
-    if wecom:
-        # 企业微信单条 Markdown 限制 4096 字节，分两条发送：微信/抖音 + SensorTower
-        for i, part in enumerate(parts):
-            send_wecom_markdown(wecom, part)
-
-    return 0
+    # 飞书与企业微信并发发送；企业微信单条 Markdown 限制 4096 字节，合并内容按章节/表格行打包成尽量少的消息
+    # 先入发件箱再投递：重跑时已成功的消息不会重复发送，只补发失败的
+    outbox = open_outbox(args.outbox)
+    try:
+        for report_type, period, _, outputs, _ in messages:
+            if feishu:
+                enqueue(outbox, report_type, period, Channel("飞书", feishu, outputs["feishu"]))
+            if wecom:
+                channel = Channel("企业微信", wecom, outputs["wecom"], rate_limiter=WECOM_RATE_LIMITER)
+                enqueue(outbox, report_type, period, channel)
+        sent, failed = flush(outbox, reports=[(report_type, period) for report_type, period, *_ in messages])
+        for report_type, period, _, _, full_md in messages:
+            report_delta.record_delivered(outbox, report_type, period, full_md)
+    finally:
+        outbox.close()
+    print(f"本次投递：成功 {sent} 条，失败 {failed} 条")
+    return 0 if failed == 0 else 1
 
 
 if __name__ == "__main__":
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+sensortower_top100.db 的表结构迁移、索引维护与查询计划检查。
+
+当前迁移：
+  - rank_changes.surge_value：从 change 字符串解析出的上升幅度（'↑20' -> 20，无法解析为 0），
+    整数列 + 回填历史数据 + 触发器保证新写入/修改的行自动计算，
+    并建立 (rank_date_current, change_type, surge_value) 索引，
+    使「排名飙升 TopN」可以直接在 SQLite 里 ORDER BY surge_value DESC LIMIT N。
+  - rank_changes.platform_os：LOWER(platform) 的规范化列（同样由触发器维护），
+    关联 app_metadata 时用 m.os = r.platform_os，避免 LOWER() 挡住索引。
+  - 报表查询所需的索引（按周 + 异动类型、按周 + 地区/榜单/平台分区、app_metadata 关联）。
+  - report_change_counters：触发器维护的修改计数（rank_changes 按周、app_metadata 整表各一个），
+    每次增删改加 1。周次指纹先比较「行数 + 最大 rowid + 计数」，只有这些变了的周才逐行计算内容哈希
+    （见 report_db.SensorTowerQueries.week_fingerprints）。
+
+迁移是幂等的，可重复执行。默认执行完迁移后会运行 ANALYZE 与 PRAGMA optimize。
+--check 模式打印每条报表查询的 EXPLAIN QUERY PLAN，若有查询对 rank_changes /
+app_metadata 做全表扫描则返回非 0。
+
+使用方式（在项目根目录）：
+  python scripts/sensortower_schema.py
+  python scripts/sensortower_schema.py --db public/sensortower_top100.db
+  python scripts/sensortower_schema.py --check
+"""
+
+import argparse
+import re
+import sqlite3
+from pathlib import Path
+
+# 报表查询依赖的索引：名称 -> (表, 列)
+REPORT_INDEXES = {
+    # 周次指纹的行数 / 最大 rowid、最近一周：GROUP BY rank_date_current 只读索引
+    "idx_rank_changes_week_last": ("rank_changes", "rank_date_current, rank_date_last"),
+    # 新进 TopN：WHERE rank_date_current = ? AND change_type = ? ORDER BY current_rank
+    "idx_rank_changes_week_type_rank": ("rank_changes", "rank_date_current, change_type, current_rank"),
+    # 飙升 TopN：WHERE rank_date_current = ? AND change_type = ? ORDER BY surge_value DESC
+    "idx_rank_changes_surge": ("rank_changes", "rank_date_current, change_type, surge_value"),
+    # 每个 (地区, 榜单, 平台) 取排名最高：PARTITION BY country, signal, platform ORDER BY current_rank
+    "idx_rank_changes_week_partition": (
+        "rank_changes",
+        "rank_date_current, country, signal, platform, current_rank",
+    ),
+    # app_metadata 关联：覆盖 name / publisher_name，不回表
+    "idx_app_metadata_app_os": ("app_metadata", "app_id, os, name, publisher_name"),
+}
+
+# 视为全表扫描的基础表
+SCAN_CHECKED_TABLES = ("rank_changes", "app_metadata")
+
+# 修改计数表：(来源表, 键) -> 计数；rank_changes 的键为 rank_date_current，app_metadata 的键为 ''
+CHANGE_COUNTER_TABLE = "report_change_counters"
+
+
+def surge_value_expr(column: str = '"change"', arrow: str = "↑") -> str:
+    """返回从 change 字符串解析上升幅度的 SQL 表达式，语义与正则 ↑\\s*(\\d+) 一致。
+
+    arrow 传 '↓' 时解析下降幅度。
+    触发器在写入方自己的连接里执行，因此只能用纯 SQL，不能依赖 Python 自定义函数。
+    """
+    rest = f"ltrim(substr({column}, instr({column}, '{arrow}') + 1))"
+    return (
+        f"CASE WHEN instr({column}, '{arrow}') > 0 AND substr({rest}, 1, 1) BETWEEN '0' AND '9' "
+        f"THEN CAST({rest} AS INTEGER) ELSE 0 END"
+    )
+
+
+def has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    """表中是否存在指定列。"""
+    return any(r[1] == column for r in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def surge_value_sql(conn: sqlite3.Connection, alias: str = "r") -> str:
+    """查询里用于表示上升幅度的 SQL 片段：已迁移则直接用 surge_value 列，否则现场解析。"""
+    if has_column(conn, "rank_changes", "surge_value"):
+        return f"{alias}.surge_value"
+    return surge_value_expr(f'{alias}."change"')
+
+
+def platform_os_sql(conn: sqlite3.Connection, alias: str = "r") -> str:
+    """关联 app_metadata.os 用的小写平台：已迁移则用 platform_os 列，否则 LOWER(platform)。"""
+    if has_column(conn, "rank_changes", "platform_os"):
+        return f"{alias}.platform_os"
+    return f"LOWER({alias}.platform)"
+
+
+def ensure_surge_value(conn: sqlite3.Connection) -> int:
+    """添加并回填 rank_changes.surge_value，创建触发器。返回本次回填的行数。"""
+    expr = surge_value_expr()
+    with conn:
+        if not has_column(conn, "rank_changes", "surge_value"):
+            conn.execute("ALTER TABLE rank_changes ADD COLUMN surge_value INTEGER")
+        backfilled = conn.execute(
+            f"UPDATE rank_changes SET surge_value = {expr} WHERE surge_value IS NULL"
+        ).rowcount
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_rank_changes_surge_insert
+            AFTER INSERT ON rank_changes
+            WHEN NEW.surge_value IS NULL
+            BEGIN
+                UPDATE rank_changes SET surge_value = {expr} WHERE rowid = NEW.rowid;
+            END
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_rank_changes_surge_update
+            AFTER UPDATE OF "change" ON rank_changes
+            BEGIN
+                UPDATE rank_changes SET surge_value = {expr} WHERE rowid = NEW.rowid;
+            END
+            """
+        )
+    return backfilled
+
+
+def ensure_platform_os(conn: sqlite3.Connection) -> int:
+    """添加并回填 rank_changes.platform_os（小写平台），创建触发器。返回本次回填的行数。"""
+    with conn:
+        if not has_column(conn, "rank_changes", "platform_os"):
+            conn.execute("ALTER TABLE rank_changes ADD COLUMN platform_os TEXT")
+        backfilled = conn.execute(
+            "UPDATE rank_changes SET platform_os = LOWER(platform) "
+            "WHERE platform_os IS NULL AND platform IS NOT NULL"
+        ).rowcount
+        conn.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_rank_changes_platform_os_insert
+            AFTER INSERT ON rank_changes
+            WHEN NEW.platform_os IS NULL
+            BEGIN
+                UPDATE rank_changes SET platform_os = LOWER(NEW.platform) WHERE rowid = NEW.rowid;
+            END
+            """
+        )
+        conn.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_rank_changes_platform_os_update
+            AFTER UPDATE OF platform ON rank_changes
+            BEGIN
+                UPDATE rank_changes SET platform_os = LOWER(NEW.platform) WHERE rowid = NEW.rowid;
+            END
+            """
+        )
+    return backfilled
+
+
+def has_table(conn: sqlite3.Connection, table: str) -> bool:
+    """库中是否存在指定表。"""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def _bump_counter_sql(source: str, key: str) -> str:
+    """触发器里给 (source, key) 的修改计数加 1 的语句。"""
+    return (
+        f"INSERT INTO {CHANGE_COUNTER_TABLE} (source, key, version) VALUES ('{source}', {key}, 1) "
+        "ON CONFLICT (source, key) DO UPDATE SET version = version + 1;"
+    )
+
+
+def ensure_change_counters(conn: sqlite3.Connection) -> None:
+    """创建修改计数表及 rank_changes / app_metadata 的增删改触发器。
+
+    计数从 0 起算、不回填：迁移之前的写入由首次计算指纹时的内容哈希覆盖。
+    """
+    week_new = _bump_counter_sql("rank_changes", "COALESCE(NEW.rank_date_current, '')")
+    week_old = _bump_counter_sql("rank_changes", "COALESCE(OLD.rank_date_current, '')")
+    meta = _bump_counter_sql("app_metadata", "''")
+    triggers = {
+        "trg_rank_changes_counter_insert": ("AFTER INSERT ON rank_changes", week_new),
+        "trg_rank_changes_counter_update": ("AFTER UPDATE ON rank_changes", week_old + " " + week_new),
+        "trg_rank_changes_counter_delete": ("AFTER DELETE ON rank_changes", week_old),
+    }
+    if has_table(conn, "app_metadata"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            triggers[f"trg_app_metadata_counter_{event.lower()}"] = (f"AFTER {event} ON app_metadata", meta)
+    with conn:
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {CHANGE_COUNTER_TABLE} (
+                source TEXT NOT NULL,
+                key TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                PRIMARY KEY (source, key)
+            )
+            """
+        )
+        for name, (event, body) in triggers.items():
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+
+def ensure_indexes(conn: sqlite3.Connection) -> None:
+    """创建报表查询依赖的全部索引（已存在则跳过）。"""
+    with conn:
+        for name, (table, columns) in REPORT_INDEXES.items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+
+
+def ensure_schema(conn: sqlite3.Connection) -> dict[str, int]:
+    """执行全部迁移（列 + 触发器 + 修改计数 + 索引），返回各列本次回填的行数。"""
+    backfilled = {
+        "surge_value": ensure_surge_value(conn),
+        "platform_os": ensure_platform_os(conn),
+    }
+    ensure_change_counters(conn)
+    ensure_indexes(conn)
+    return backfilled
+
+
+def provision(conn: sqlite3.Connection) -> dict[str, int]:
+    """迁移 + 刷新统计信息（ANALYZE / PRAGMA optimize），供查询规划器选对索引。"""
+    backfilled = ensure_schema(conn)
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+    return backfilled
+
+
+def _report_queries(conn: sqlite3.Connection) -> list[tuple[str, str, tuple]]:
+    """收集报表脚本实际执行的查询：(名称, SQL, 示例参数)。"""
+    # 延迟导入：report_db 本身依赖本模块
+    from report_db import SensorTowerQueries
+
+    return SensorTowerQueries(conn).report_queries()
+
+
+def _full_scans(sql: str, plan: list[str]) -> list[str]:
+    """找出计划中对基础表（含别名）不走索引的 SCAN。"""
+    names = set(SCAN_CHECKED_TABLES)
+    for m in re.finditer(r"(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, re.IGNORECASE):
+        table, alias = m.group(1), m.group(2)
+        if table in SCAN_CHECKED_TABLES and alias and alias.upper() not in ("WHERE", "ON", "LEFT", "JOIN", "GROUP", "ORDER"):
+            names.add(alias)
+    scans = []
+    for detail in plan:
+        m = re.match(r"SCAN (\w+)(.*)$", detail)
+        if m and m.group(1) in names and "USING" not in m.group(2):
+            scans.append(detail)
+    return scans
+
+
+def check_query_plans(conn: sqlite3.Connection) -> bool:
+    """打印每条报表查询的 EXPLAIN QUERY PLAN；全部走索引返回 True。"""
+    ok = True
+    for name, sql, params in _report_queries(conn):
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        plan = [r[3] for r in rows]
+        scans = _full_scans(sql, plan)
+        print(f"== {name} {'[全表扫描]' if scans else '[OK]'}")
+        for r in rows:
+            print(f"   {r[3]}")
+        if scans:
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sensortower_top100.db 表结构迁移、索引维护与查询计划检查")
+    parser.add_argument(
+        "--db",
+        type=Path,
+        default=Path("public/sensortower_top100.db"),
+        help="sensortower_top100.db 路径",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="只打印报表查询的 EXPLAIN QUERY PLAN，存在全表扫描时返回 1",
+    )
+    args = parser.parse_args()
+
+    if not args.db.exists():
+        print(f"错误：数据库不存在 {args.db}")
+        return 1
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.check:
+            ok = check_query_plans(conn)
+            print("查询计划检查通过" if ok else "存在全表扫描，请先执行迁移（不带 --check 运行本脚本）")
+            return 0 if ok else 1
+        backfilled = provision(conn)
+    finally:
+        conn.close()
+    print(
+        f"迁移完成：surge_value 回填 {backfilled['surge_value']} 行，"
+        f"platform_os 回填 {backfilled['platform_os']} 行，索引 {len(REPORT_INDEXES)} 个，已 ANALYZE"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,281 @@
+"""
+飞书 / 企业微信机器人 Webhook 的投递层。
+
+  - 各渠道（飞书卡片、企业微信多条 Markdown）并发发送，渠道内按顺序发送，
+    总耗时取决于最慢的渠道而不是所有请求之和
+  - 按 (scheme, host, port) 复用 http.client 长连接（keep-alive），空闲连接已被服务端关闭时换新连接重发
+  - 请求发出前的连接错误、429、5xx 以及企业微信 errcode 45009（频率超限）视为临时失败，按带抖动的指数退避重试；
+    请求已发出但没有拿到响应（如读超时）时不重试：服务端可能已经处理，重发会在群里产生重复消息
+  - 企业微信每个机器人每分钟最多 20 条消息，按 Webhook 地址做滑动窗口限流
+
+只依赖标准库。
+"""
+
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+import report_metrics
+
+REQUEST_TIMEOUT = 15
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+# 连接层错误的状态码：0 表示请求未发出（可安全重试），-1 表示请求已发出但没有拿到响应（不重试）
+STATUS_NOT_SENT = 0
+STATUS_NO_RESPONSE = -1
+# 可重试的 HTTP 状态
+TRANSIENT_STATUS = {STATUS_NOT_SENT, 429, 500, 502, 503, 504}
+# 企业微信：接口调用频率超限
+WECOM_RATE_LIMIT_ERRCODE = 45009
+# 企业微信机器人：每分钟最多 20 条
+WECOM_MAX_PER_MINUTE = 20
+
+
+class ConnectionPool:
+    """按 (scheme, host, port) 缓存空闲的 HTTP(S) 长连接，线程安全。"""
+
+    def __init__(self, timeout: float = REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self._idle: dict[tuple, list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _checkout(self, key: tuple) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(host, port, timeout=self.timeout), False
+
+    def _checkin(self, key: tuple, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    def post(self, url: str, body: bytes, headers: dict) -> tuple[int, str]:
+        """发送 POST，返回 (status, response_text)。
+
+        连接层错误：请求未完整发出时返回 (STATUS_NOT_SENT, 错误信息)；
+        请求已发出但读取响应失败时返回 (STATUS_NO_RESPONSE, 错误信息)，服务端可能已处理。
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        # 复用的空闲连接可能已被服务端关闭：只在这种情况下换新连接再发一次
+        for _ in range(2):
+            conn, reused = self._checkout(key)
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if reused:
+                    continue
+                return STATUS_NOT_SENT, f"{type(e).__name__}: {e}"
+            try:
+                resp = conn.getresponse()
+                text = resp.read().decode("utf-8", errors="ignore")
+            except (http.client.RemoteDisconnected, ConnectionResetError) as e:
+                conn.close()
+                if reused:
+                    # 服务端在读取请求前就关闭了空闲连接（keep-alive 超时），请求没有被处理
+                    continue
+                return STATUS_NO_RESPONSE, f"{type(e).__name__}: {e}"
+            except (http.client.HTTPException, OSError) as e:
+                # 读超时等：请求已发出，服务端可能已处理，不能重发
+                conn.close()
+                return STATUS_NO_RESPONSE, f"{type(e).__name__}: {e}"
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+            return resp.status, text
+        return STATUS_NOT_SENT, "连接被关闭"
+
+    def close(self) -> None:
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+class RateLimiter:
+    """滑动窗口限流：同一 key 在 period 秒内最多 max_calls 次。"""
+
+    def __init__(self, max_calls: int, period: float = 60.0):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> None:
+        """阻塞直到 key 可以再发一次。"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                calls = self._calls.setdefault(key, deque())
+                while calls and now - calls[0] >= self.period:
+                    calls.popleft()
+                if len(calls) < self.max_calls:
+                    calls.append(now)
+                    return
+                wait = self.period - (now - calls[0])
+            time.sleep(wait)
+
+
+# 进程内共享：同一个企业微信机器人无论被哪个报表使用都共用配额
+WECOM_RATE_LIMITER = RateLimiter(WECOM_MAX_PER_MINUTE, 60.0)
+DEFAULT_POOL = ConnectionPool()
+
+
+def is_transient(status: int, text: str) -> bool:
+    """是否为值得重试的临时失败。"""
+    if status in TRANSIENT_STATUS:
+        return True
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return False
+    return isinstance(data, dict) and data.get("errcode") == WECOM_RATE_LIMIT_ERRCODE
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待秒数：指数退避 + 全抖动。"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def post_json(
+    url: str,
+    payload: dict,
+    pool: ConnectionPool | None = None,
+    max_attempts: int = MAX_ATTEMPTS,
+) -> tuple[int, str, int]:
+    """POST JSON，临时失败自动重试。返回 (status_code, response_text, attempts)。"""
+    pool = pool or DEFAULT_POOL
+    body = json.dumps(payload).encode("utf-8")
+    headers = {"Content-Type": "application/json; charset=utf-8", "Connection": "keep-alive"}
+    status, text = 0, ""
+    for attempt in range(max_attempts):
+        if attempt:
+            time.sleep(backoff_delay(attempt))
+        status, text = pool.post(url, body, headers)
+        if not is_transient(status, text):
+            return status, text, attempt + 1
+    return status, text, max_attempts
+
+
+def feishu_card_payload(title: str, md_content: str) -> dict:
+    """飞书互动卡片：标题 + Markdown 正文。"""
+    return {
+        "msg_type": "interactive",
+        "card": {
+            "config": {"wide_screen_mode": True},
+            "header": {
+                "title": {"tag": "plain_text", "content": title},
+                "template": "blue",
+            },
+            "elements": [{"tag": "markdown", "content": md_content}],
+        },
+    }
+
+
+def wecom_markdown_payload(md_content: str) -> dict:
+    """企业微信 Markdown 消息。"""
+    return {"msgtype": "markdown", "markdown": {"content": md_content}}
+
+
+@dataclass
+class Channel:
+    """一个投递渠道：同一 Webhook 上按顺序发送的若干条消息。"""
+
+    name: str
+    url: str
+    payloads: list[dict]
+    rate_limiter: RateLimiter | None = None
+
+
+@dataclass
+class DeliveryResult:
+    channel: str
+    index: int
+    status: int
+    response: str
+    attempts: int
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        """HTTP 200 且业务码为 0（企业微信 errcode / 飞书 code；HTTP 200 也可能是业务失败）。"""
+        if self.status != 200:
+            return False
+        try:
+            data = json.loads(self.response)
+        except ValueError:
+            return True
+        if not isinstance(data, dict):
+            return True
+        return data.get("errcode", 0) == 0 and data.get("code", 0) == 0
+
+
+@dataclass
+class _ChannelRun:
+    channel: Channel
+    results: list[DeliveryResult] = field(default_factory=list)
+
+
+def _run_channel(run: _ChannelRun, pool: ConnectionPool) -> _ChannelRun:
+    channel = run.channel
+    for i, payload in enumerate(channel.payloads):
+        if channel.rate_limiter is not None:
+            channel.rate_limiter.acquire(channel.url)
+        start = time.perf_counter()
+        status, text, attempts = post_json(channel.url, payload, pool=pool)
+        elapsed = time.perf_counter() - start
+        run.results.append(DeliveryResult(channel.name, i, status, text, attempts, elapsed))
+        if report_metrics.enabled():
+            report_metrics.record(
+                "http",
+                channel.name,
+                status=status,
+                attempts=attempts,
+                duration_ms=elapsed * 1000,
+                bytes=len(json.dumps(payload).encode("utf-8")),
+            )
+    return run
+
+
+def deliver(channels: list[Channel], pool: ConnectionPool | None = None) -> list[DeliveryResult]:
+    """并发投递所有渠道（渠道内顺序发送），按渠道顺序返回每条消息的结果。"""
+    pool = pool or DEFAULT_POOL
+    runs = [_ChannelRun(c) for c in channels if c.payloads]
+    if not runs:
+        return []
+    with ThreadPoolExecutor(max_workers=len(runs)) as executor:
+        list(executor.map(lambda r: _run_channel(r, pool), runs))
+    return [result for run in runs for result in run.results]
+
+
+def print_results(results: list[DeliveryResult]) -> bool:
+    """按脚本原有格式打印结果（失败输出到 stderr），全部成功返回 True。"""
+    ok = True
+    for r in results:
+        if r.ok:
+            print(f"[{r.channel}] 发送成功（{r.elapsed:.2f}s，{r.attempts} 次）")
+        else:
+            ok = False
+            print(f"[{r.channel}] 发送失败 status={r.status} resp={r.response}", file=sys.stderr)
+    return ok
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+根据 videos.db 的 weekly_rankings 计算每周「新进榜 / 飙升」，写入 weekly_report_simple。
+
+weekly_rankings.ranking 为每周每平台一整份榜单的 JSON（{"header", "rows"} 或直接是行数组）。
+本脚本：
+  1. 把榜单展开为 weekly_ranking_entries(week_start, platform, board_name, rank, game_name, ...)，
+     week_start 规范化为 YYYY-MM-DD；按 (week_start, platform) 记录源 JSON 指纹，只重新展开有变化的周
+  2. 对需要重算的 (周, 平台)，以源数据的「排名变化」为准（榜单本身只收异动游戏）：
+       - 为数字（'14' / '↑14'）：≥ --surge-min 记为「飙升」，rank_change 为该数字
+       - 为「新进榜」：记为「新进榜」
+       - 缺失时才用一次带索引的自连接与该平台上一周的榜单比较：上周有该游戏按排名上升判断飙升，
+         上周没有（且该平台有更早的周次）记为「新进榜」
+     与现有 weekly_report_simple 一致，只收录 games 里已有玩法解析（gameplay_analysis）的游戏
+  3. 只写 wx / dy（reportsLoader.ts 只读这两个平台）；周报的 week_range 是源榜单周次的下一周
+     （榜单在下一周监控发布），写成不补零的 'Y-M-D~Y-M-D'，与现有行一致
+  4. 结果与 weekly_report_simple 现有行比较，只替换有变化的 (week_range, platform)；
+     summary 沿用已有值，没有时取 games.gameplay_analysis。
+     本脚本写过的 (week_range, platform) 记在 weekly_report_owned（内容哈希），
+     现有行不是本脚本写的（或写入后被改过）且与计算结果不同时拒绝覆盖，列出后以退出码 1 结束；
+     与计算结果相同的现有行直接登记为本脚本所有
+  5. 给 weekly_report_simple 加 week_start 生成列（由 week_range 补零解析）及索引，
+     供按周选取（send_minigame_weekly_reports.py 的 --week / --backfill）
+
+建表、迁移与写入都在同一个事务里：中途失败整体回滚，--dry-run 时同样整体回滚，不改动数据库。
+
+使用方式（在项目根目录）：
+  python scripts/weekly_rankings_diff.py
+  python scripts/weekly_rankings_diff.py --db public/videos.db --surge-min 10
+  python scripts/weekly_rankings_diff.py --full --dry-run
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+
+ENTRIES_TABLE = "weekly_ranking_entries"
+STATE_TABLE = "weekly_ranking_state"
+OWNED_TABLE = "weekly_report_owned"
+DEFAULT_SURGE_MIN = 10
+
+# weekly_report_simple 只写这两个平台（src/data/reportsLoader.ts 按 platform IN ('wx', 'dy') 读取）
+REPORT_PLATFORMS = ("wx", "dy")
+
+CHANGE_NEW = "新进榜"
+CHANGE_SURGE = "飙升"
+
+SCHEMA_SQL = f"""
+CREATE TABLE IF NOT EXISTS {ENTRIES_TABLE} (
+    week_start TEXT NOT NULL,       -- YYYY-MM-DD
+    week_range TEXT NOT NULL,       -- 原样保留，如 2026-1-19~2026-1-25
+    platform TEXT NOT NULL,         -- wx / dy / ios / android
+    board_name TEXT,
+    rank INTEGER NOT NULL,
+    game_name TEXT NOT NULL,
+    source_change TEXT              -- 源数据的「排名变化」（新进榜 / 数字 / ↑数字）
+);
+-- 取某平台的上一周：WHERE platform = ? AND week_start < ? ORDER BY week_start DESC
+CREATE INDEX IF NOT EXISTS idx_weekly_ranking_entries_platform_week
+    ON {ENTRIES_TABLE}(platform, week_start);
+-- 自连接：同平台同游戏在上一周的排名
+CREATE INDEX IF NOT EXISTS idx_weekly_ranking_entries_platform_game_week
+    ON {ENTRIES_TABLE}(platform, game_name, week_start, rank);
+
+CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+    week_start TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,      -- 源 JSON 指纹:已有玩法解析的游戏指纹
+    PRIMARY KEY (week_start, platform)
+);
+-- 本脚本写入的 weekly_report_simple 分组及其内容哈希，用于拒绝覆盖别处产生（或被改过）的行
+CREATE TABLE IF NOT EXISTS {OWNED_TABLE} (
+    week_range TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (week_range, platform)
+)
+"""
+
+# 需要重算的 (周, 平台) 的当周榜单与上一周榜单的自连接：参数 (?1 = [[week_start, platform], ...] JSON)
+DIFF_SQL = f"""
+WITH targets AS (
+    SELECT json_extract(value, '$[0]') AS week_start, json_extract(value, '$[1]') AS platform
+    FROM json_each(?1)
+),
+spans AS (
+    SELECT
+        t.week_start,
+        t.platform,
+        (
+            SELECT MAX(p.week_start) FROM {ENTRIES_TABLE} p
+            WHERE p.platform = t.platform AND p.week_start < t.week_start
+        ) AS prev_start
+    FROM targets t
+),
+cur AS (
+    SELECT
+        e.week_start,
+        e.platform,
+        e.game_name,
+        MIN(e.rank) AS rank,
+        MAX(e.source_change) AS source_change,
+        s.prev_start
+    FROM spans s
+    JOIN {ENTRIES_TABLE} e ON e.platform = s.platform AND e.week_start = s.week_start
+    GROUP BY e.week_start, e.platform, e.game_name
+)
+SELECT
+    c.week_start,
+    c.platform,
+    c.game_name,
+    c.rank,
+    c.source_change,
+    c.prev_start,
+    MIN(prev.rank) AS prev_rank,
+    EXISTS (
+        SELECT 1 FROM games g
+        WHERE g.game_name = c.game_name AND COALESCE(g.gameplay_analysis, '') <> ''
+    ) AS analyzed
+FROM cur c
+LEFT JOIN {ENTRIES_TABLE} prev
+    ON prev.platform = c.platform AND prev.game_name = c.game_name AND prev.week_start = c.prev_start
+GROUP BY c.week_start, c.platform, c.game_name
+ORDER BY c.week_start, c.platform, c.rank
+"""
+
+_NUMBER_RE = re.compile(r"^[↑+]?\s*(\d+)$")
+
+
+def normalize_date(value: str | None) -> str | None:
+    """'2026-1-19' / '2026/01/19' -> '2026-01-19'；无法解析返回 None。"""
+    if not value:
+        return None
+    m = re.match(r"^\s*(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})", str(value))
+    if not m:
+        return None
+    return f"{int(m.group(1)):04d}-{int(m.group(2)):02d}-{int(m.group(3)):02d}"
+
+
+def week_start_of(week_range: str | None, week_start: str | None) -> str | None:
+    """优先用 week_start 列，否则取 week_range 的起始日期。"""
+    return normalize_date(week_start) or normalize_date((week_range or "").split("~")[0])
+
+
+def report_week_range(week_start: str) -> str:
+    """源榜单周次 -> 周报的 week_range：下一周，不补零，如 '2026-01-19' -> '2026-1-26~2026-2-1'。"""
+    start = date.fromisoformat(week_start) + timedelta(days=7)
+    end = start + timedelta(days=6)
+    return f"{start.year}-{start.month}-{start.day}~{end.year}-{end.month}-{end.day}"
+
+
+def ranking_rows(ranking: str | None) -> list[dict]:
+    """解析 ranking JSON：兼容 {"header": [...], "rows": [...]} 与直接的行数组。"""
+    try:
+        data = json.loads(ranking or "[]")
+    except ValueError:
+        return []
+    if isinstance(data, dict):
+        data = data.get("rows") or []
+    return [r for r in data if isinstance(r, dict)] if isinstance(data, list) else []
+
+
+def source_rise(source_change: str | None) -> int | None:
+    """源数据「排名变化」为上升名次时返回整数（'14' / '↑14'），否则 None。"""
+    m = _NUMBER_RE.match(str(source_change or "").strip())
+    return int(m.group(1)) if m else None
+
+
+def week_start_key_expr(column: str = "week_range") -> str:
+    """把 'Y-M-D~Y-M-D' 的起始日期补零为可排序的 YYYY-MM-DD 的 SQL 表达式。
+
+    '2026-1-19~2026-1-25' 按字符串比较会排在 '2026-1-5~...' 之前、'2026-10-...' 之后，
+    补零后字符串顺序即日期顺序。分隔符 '/'、'.' 先替换为 '-'，与 normalize_date 接受的格式一致。
+    """
+    start = f"replace(replace(substr({column}, 1, instr({column} || '~', '~') - 1), '/', '-'), '.', '-')"
+    rest = f"substr({start}, 6)"
+    return (
+        f"printf('%04d-%02d-%02d', CAST(substr({start}, 1, 4) AS INTEGER), "
+        f"CAST(substr({rest}, 1, instr({rest}, '-') - 1) AS INTEGER), "
+        f"CAST(substr({rest}, instr({rest}, '-') + 1) AS INTEGER))"
+    )
+
+
+def has_week_start(conn: sqlite3.Connection) -> bool:
+    """weekly_report_simple 是否已有 week_start 生成列（table_info 不列出生成列，需用 table_xinfo）。"""
+    return any(r[1] == "week_start" for r in conn.execute("PRAGMA table_xinfo(weekly_report_simple)"))
+
+
+def _week_start_outdated(conn: sqlite3.Connection) -> bool:
+    """week_start 列存在但不是按当前 week_start_key_expr 生成的（旧版只认 '-' 分隔）。"""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'weekly_report_simple'").fetchone()
+    return has_week_start(conn) and week_start_key_expr() not in row[0]
+
+
+def week_start_sql(conn: sqlite3.Connection, alias: str = "w") -> str:
+    """查询里表示 weekly_report_simple 周起始日期的 SQL 片段：已迁移用 week_start 列（走索引），否则现场解析。"""
+    if has_week_start(conn) and not _week_start_outdated(conn):
+        return f"{alias}.week_start"
+    return week_start_key_expr(f"{alias}.week_range")
+
+
+def ensure_week_start(conn: sqlite3.Connection) -> None:
+    """给 weekly_report_simple 增加 week_start 生成列与 (week_start, platform) 索引（幂等）。
+
+    已有的 week_start 列若不是按当前 week_start_key_expr 生成（旧版只认 '-' 分隔），删除后重建。
+    """
+    if _week_start_outdated(conn):
+        conn.execute("DROP INDEX IF EXISTS idx_weekly_simple_week_start_platform")
+        conn.execute("ALTER TABLE weekly_report_simple DROP COLUMN week_start")
+    if not has_week_start(conn):
+        conn.execute(
+            "ALTER TABLE weekly_report_simple ADD COLUMN week_start TEXT "
+            f"GENERATED ALWAYS AS ({week_start_key_expr()}) VIRTUAL"
+        )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_weekly_simple_week_start_platform "
+        "ON weekly_report_simple(week_start, platform)"
+    )
+
+
+def ensure_tables(conn: sqlite3.Connection) -> None:
+    """建表并迁移 week_start 列。不提交：逐条执行（executescript 会先提交），由调用方的事务决定提交或回滚。"""
+    for statement in SCHEMA_SQL.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+    ensure_week_start(conn)
+
+
+def analyzed_fingerprint(conn: sqlite3.Connection, week_start: str, platform: str) -> str:
+    """该周榜单里已有玩法解析的游戏指纹：解析补上后即使源 JSON 没变，这一周也要重算。"""
+    names = [
+        r[0]
+        for r in conn.execute(
+            f"""
+            SELECT DISTINCT e.game_name FROM {ENTRIES_TABLE} e
+            JOIN games g ON g.game_name = e.game_name AND COALESCE(g.gameplay_analysis, '') <> ''
+            WHERE e.platform = ? AND e.week_start = ?
+            ORDER BY e.game_name
+            """,
+            (platform, week_start),
+        )
+    ]
+    return hashlib.sha256("\x1e".join(names).encode("utf-8")).hexdigest()
+
+
+def sync_entries(conn: sqlite3.Connection, full: bool = False) -> set[tuple[str, str]]:
+    """把 weekly_rankings 中有变化的 (周, 平台) 展开到 weekly_ranking_entries，返回需要重算的 (week_start, platform)。
+
+    指纹为「源 JSON 指纹:已有玩法解析的游戏指纹」，源 JSON 没变时只重算解析情况有变化的周，不重新展开。
+    不提交：指纹与 weekly_report_simple 的更新由调用方在同一事务里提交（见 main）。
+    """
+    groups: dict[tuple[str, str], list] = {}
+    for week_range, week_start, platform, board_name, ranking in conn.execute(
+        "SELECT week_range, week_start, platform, board_name, ranking FROM weekly_rankings ORDER BY id"
+    ):
+        start = week_start_of(week_range, week_start)
+        if not start or not platform:
+            continue
+        groups.setdefault((start, platform), []).append((week_range, board_name, ranking))
+
+    known = {} if full else {
+        (w, p): fp for w, p, fp in conn.execute(f"SELECT week_start, platform, fingerprint FROM {STATE_TABLE}")
+    }
+    changed: set[tuple[str, str]] = set()
+    for key, sources in groups.items():
+        digest = hashlib.sha256()
+        for week_range, board_name, ranking in sources:
+            digest.update(f"{week_range}\x1f{board_name}\x1f{ranking}\x1e".encode("utf-8"))
+        source_fp = digest.hexdigest()
+        known_source_fp, _, known_analyzed_fp = known.get(key, "").partition(":")
+        if known_source_fp == source_fp:
+            analyzed_fp = analyzed_fingerprint(conn, *key)
+            if analyzed_fp != known_analyzed_fp:
+                changed.add(key)
+                conn.execute(
+                    f"UPDATE {STATE_TABLE} SET fingerprint = ? WHERE week_start = ? AND platform = ?",
+                    (f"{source_fp}:{analyzed_fp}", key[0], key[1]),
+                )
+            continue
+        changed.add(key)
+        conn.execute(f"DELETE FROM {ENTRIES_TABLE} WHERE platform = ? AND week_start = ?", (key[1], key[0]))
+        entries = []
+        for week_range, board_name, ranking in sources:
+            for row in ranking_rows(ranking):
+                try:
+                    rank = int(str(row.get("排名", "")).strip())
+                except ValueError:
+                    continue
+                game_name = str(row.get("游戏名称") or "").strip()
+                if not game_name:
+                    continue
+                change = row.get("排名变化")
+                entries.append(
+                    (key[0], week_range or "", key[1], board_name, rank, game_name,
+                     None if change is None else str(change).strip())
+                )
+        conn.executemany(
+            f"""
+            INSERT INTO {ENTRIES_TABLE}
+                (week_start, week_range, platform, board_name, rank, game_name, source_change)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            entries,
+        )
+        conn.execute(
+            f"INSERT OR REPLACE INTO {STATE_TABLE} (week_start, platform, fingerprint) VALUES (?, ?, ?)",
+            (key[0], key[1], f"{source_fp}:{analyzed_fingerprint(conn, *key)}"),
+        )
+    # 源数据里已删除的周次
+    for key in set(known) - set(groups):
+        changed.add(key)
+        conn.execute(f"DELETE FROM {ENTRIES_TABLE} WHERE platform = ? AND week_start = ?", (key[1], key[0]))
+        conn.execute(f"DELETE FROM {STATE_TABLE} WHERE week_start = ? AND platform = ?", key)
+    return changed
+
+
+def affected_weeks(conn: sqlite3.Connection, changed: set[tuple[str, str]]) -> list[tuple[str, str]]:
+    """有变化的 (周, 平台) 以及以它为「上一周」的下一周（其对比基准变了）。"""
+    targets = set()
+    for week_start, platform in changed:
+        targets.add((week_start, platform))
+        row = conn.execute(
+            f"SELECT MIN(week_start) FROM {ENTRIES_TABLE} WHERE platform = ? AND week_start > ?",
+            (platform, week_start),
+        ).fetchone()
+        if row and row[0]:
+            targets.add((row[0], platform))
+    return sorted(targets)
+
+
+def compute_changes(
+    conn: sqlite3.Connection, targets: list[tuple[str, str]], surge_min: int = DEFAULT_SURGE_MIN
+) -> dict[tuple[str, str], list[tuple]]:
+    """一次自连接算出各 (周报 week_range, 平台) 的新进榜 / 飙升：{(week_range, platform): [(game, type, rank, change)]}。
+
+    只算 REPORT_PLATFORMS；以源数据「排名变化」为准，缺失时才用上一周的排名比较（见模块说明）。
+    """
+    targets = [t for t in targets if t[1] in REPORT_PLATFORMS]
+    result: dict[tuple[str, str], list[tuple]] = {
+        (report_week_range(week_start), platform): [] for week_start, platform in targets
+    }
+    if not targets:
+        return result
+    for week_start, platform, game_name, rank, source_change, prev_start, prev_rank, analyzed in conn.execute(
+        DIFF_SQL, (json.dumps(targets),)
+    ):
+        if not analyzed:
+            continue
+        rows = result[(report_week_range(week_start), platform)]
+        rise = source_rise(source_change)
+        if rise is not None:
+            if rise >= surge_min:
+                rows.append((game_name, CHANGE_SURGE, str(rank), str(rise)))
+        elif source_change == CHANGE_NEW:
+            rows.append((game_name, CHANGE_NEW, str(rank), CHANGE_NEW))
+        elif prev_rank is not None:
+            if prev_rank - rank >= surge_min:
+                rows.append((game_name, CHANGE_SURGE, str(rank), str(prev_rank - rank)))
+        elif prev_start is not None:
+            rows.append((game_name, CHANGE_NEW, str(rank), CHANGE_NEW))
+    return result
+
+
+def content_hash(rows: list[tuple]) -> str:
+    """一个 (week_range, platform) 分组的内容哈希（不含 summary，summary 写入时沿用已有值）。"""
+    return hashlib.sha256(json.dumps(sorted(rows), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def upsert_report_simple(
+    conn: sqlite3.Connection, changes: dict[tuple[str, str], list[tuple]]
+) -> tuple[list[tuple[str, str, int]], list[tuple[str, str]]]:
+    """只替换内容有变化、且归本脚本所有的 (week_range, platform)。
+
+    返回 (已替换 [(week_range, platform, 行数)], 拒绝覆盖 [(week_range, platform)])。不提交，见 sync_entries。
+    """
+    updated, refused = [], []
+    for (week_range, platform), rows in sorted(changes.items()):
+        rows = sorted(rows, key=lambda r: (r[1], int(r[2])))
+        existing = conn.execute(
+            """
+            SELECT game_name, change_type, rank, rank_change, summary
+            FROM weekly_report_simple
+            WHERE week_range = ? AND platform = ?
+            ORDER BY change_type, CAST(rank AS INTEGER)
+            """,
+            (week_range, platform),
+        ).fetchall()
+        current = [tuple(r[:4]) for r in existing]
+        owned = conn.execute(
+            f"SELECT content_hash FROM {OWNED_TABLE} WHERE week_range = ? AND platform = ?", (week_range, platform)
+        ).fetchone()
+        if current == rows:
+            # 与计算结果一致的现有行（包括别处产生的）登记为本脚本所有，之后可以按需更新
+            if rows and (owned is None or owned[0] != content_hash(rows)):
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {OWNED_TABLE} (week_range, platform, content_hash) VALUES (?, ?, ?)",
+                    (week_range, platform, content_hash(rows)),
+                )
+            continue
+        if current and (owned is None or owned[0] != content_hash(current)):
+            refused.append((week_range, platform))
+            continue
+        updated.append((week_range, platform, len(rows)))
+        summaries = {r[0]: r[4] for r in existing if r[4]}
+        conn.execute("DELETE FROM weekly_report_simple WHERE week_range = ? AND platform = ?", (week_range, platform))
+        for game_name, change_type, rank, rank_change in rows:
+            summary = summaries.get(game_name)
+            if summary is None:
+                hit = conn.execute(
+                    "SELECT gameplay_analysis FROM games WHERE game_name = ?", (game_name,)
+                ).fetchone()
+                summary = hit[0] if hit else None
+            conn.execute(
+                """
+                INSERT INTO weekly_report_simple (week_range, platform, game_name, change_type, rank, rank_change, summary)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (week_range, platform, game_name, change_type, rank, rank_change, summary),
+            )
+        if rows:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {OWNED_TABLE} (week_range, platform, content_hash) VALUES (?, ?, ?)",
+                (week_range, platform, content_hash(rows)),
+            )
+        else:
+            conn.execute(f"DELETE FROM {OWNED_TABLE} WHERE week_range = ? AND platform = ?", (week_range, platform))
+    return updated, refused
+
+
+def main():
+    parser = argparse.ArgumentParser(description="由 weekly_rankings 计算新进榜 / 飙升并增量写入 weekly_report_simple")
+    parser.add_argument(
+        "--db",
+        type=Path,
+        default=Path("public/videos.db"),
+        help="videos.db 路径",
+    )
+    parser.add_argument(
+        "--surge-min",
+        type=int,
+        default=DEFAULT_SURGE_MIN,
+        help=f"排名上升至少多少名记为飙升，默认 {DEFAULT_SURGE_MIN}",
+    )
+    parser.add_argument("--full", action="store_true", help="忽略指纹，重新展开并重算全部周次")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="只打印会更新的周次，不改动数据库（建表、迁移、指纹与展开的榜单都回滚）"
+    )
+    args = parser.parse_args()
+
+    if not args.db.exists():
+        print(f"错误：数据库不存在 {args.db}")
+        return 1
+
+    conn = sqlite3.connect(args.db)
+    try:
+        # 建表 / 迁移、展开后的榜单、指纹与 weekly_report_simple 在同一事务里提交：
+        # 中途失败时整体回滚，不会出现「指纹已更新、结果未写入」；--dry-run 时同样整体回滚
+        conn.execute("BEGIN")
+        try:
+            ensure_tables(conn)
+            changed = sync_entries(conn, full=args.full)
+            targets = affected_weeks(conn, changed)
+            changes = compute_changes(conn, targets, args.surge_min)
+            updated, refused = upsert_report_simple(conn, changes)
+        except BaseException:
+            conn.rollback()
+            raise
+        if args.dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    finally:
+        conn.close()
+
+    if not changed:
+        print("weekly_rankings 无变化，无需重算")
+        return 0
+    print(f"榜单有变化的周次/平台 {len(changed)} 个，重算 {len(targets)} 个")
+    for week_range, platform, n in updated:
+        print(f"  {'将更新' if args.dry_run else '已更新'} {week_range} [{platform}]：{n} 条")
+    if not updated and not refused:
+        print("weekly_report_simple 已是最新")
+    if refused:
+        print(f"以下 {len(refused)} 组现有行不是本脚本写入的（或写入后被改过），与计算结果不同，未覆盖：")
+        for week_range, platform in refused:
+            print(f"  {week_range} [{platform}]")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())